@@ -1,9 +1,17 @@
 from flask import Flask
 from app.utils.config import load_settings
+from app.utils.cache import PayloadCache
+from app.utils import connection, executor, metrics
+from app.utils.json_provider import FastJSONProvider
 import os
 
 def create_app():
     app = Flask(__name__)
+    # アップロードファイルを一時ファイルに書き出すリクエストクラス
+    from app.routes.routes_data import SpoolingRequest
+    app.request_class = SpoolingRequest
+    # NumPy 配列・日時を直接書き出す JSON プロバイダ
+    app.json = FastJSONProvider(app)
 
     # YAML設定を読み込み
     # setting.yaml is at the root, so we need to go up one level from app/
@@ -16,6 +24,25 @@ def create_app():
     for key, value in settings.items():
         app.config[key.upper()] = value
 
+    # SQLite の接続設定 (PRAGMA, 読み込み用接続のプール)
+    connection.configure(**(app.config.get("SQLITE") or {}))
+    # ダッシュボードの読み込み・グラフ作成のスレッドプール
+    executor.configure(**(app.config.get("DASHBOARD_EXECUTOR") or {}))
+
+    # メトリクス (/api/metrics)。複数プロセスで動かす場合は multiprocess_dir で合算する
+    metrics.configure(**(app.config.get("METRICS") or {}))
+
+    # ダッシュボードのペイロードキャッシュ
+    cache_settings = app.config.get("DASHBOARD_CACHE") or {}
+    app.extensions["dashboard_cache"] = PayloadCache(
+        max_entries=cache_settings.get("max_entries", 64),
+        stale_while_revalidate=cache_settings.get("stale_while_revalidate", False),
+    )
+
+    from app.routes.routes_metrics import metrics_bp, cache_collector
+    metrics.register_collector("dashboard_cache", cache_collector(app.extensions["dashboard_cache"]))
+    app.register_blueprint(metrics_bp)
+
     # Blueprint登録
     from app.routes.routes_dashboard import dashboard_bp
     app.register_blueprint(dashboard_bp)
@@ -23,4 +50,16 @@ def create_app():
     from app.routes.routes_data import data_bp
     app.register_blueprint(data_bp)
 
+    from app.routes.routes_query import query_bp
+    app.register_blueprint(query_bp)
+
+    # pandas などの重い import と常駐データの読み込みを、リクエストの受付と並行してバックグラウンドで済ませる
+    if (app.config.get("WARMUP") or {}).get("enabled", False):
+        from app.utils.warmup import start_warmup
+        start_warmup(app)
+    else:
+        # finance.db の登録は最初のリクエストの前に1回だけ行う(ここで pandas などを import しない)
+        from app.utils.warmup import register_on_first_request
+        register_on_first_request(app)
+
     return app
@@ -1,26 +1,29 @@
-from app.utils.data_loader import get_df_from_db
+from app.utils.data_loader import get_df_from_db, get_data_version, get_latest_date, get_totals
+from app.utils.cache import PayloadCache, HIT, STALE, MISS
+from app.utils.rollups import rollup_table
+from app.utils.downsample import lttb_indices, MIN_POINTS
+from app.utils.executor import gather, CPU, IO
+from app.utils import data_store, precomputed
+from app.utils.timing import stage, timed
+from .figure_builder import figure, format_dates, scatter, bar, layout_template
 from typing import Dict, Any
 import numpy as np
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import plotly.io as pio
-import json
 
-def read_table_from_db(db_path):
-    df_asset_profit = get_df_from_db(
-        db_path=db_path, table_name="asset", index_col="date", columns_col=None, 
-        values_col=["資産額", "トータルリターン"], aggfunc="sum", set_index=True
-    )
-    df_balance = get_df_from_db(
-        db_path=db_path, table_name="balance", index_col="date", columns_col= ["収支タイプ", "収支カテゴリー"],
-        values_col=["金額", "目標"],aggfunc="sum", set_index=True
-    )
-    df_target = get_df_from_db(
-        db_path=db_path, table_name="target", index_col="date", columns_col= None,
-        values_col=["資産額", "トータルリターン"],aggfunc="sum", set_index=True,
-    )
+def source_table(db_path: str, table_name: str) -> str:
+    """
+    ロールアップテーブルがあればその名前を、無ければ元テーブル名を返す。
+    balance のロールアップは月次(日付は月初日)だが、月次に集計し直すので結果は同じになる。
+    """
+    return rollup_table(db_path, table_name) or table_name
 
+@timed("read")
+def read_table_from_db(db_path):
+    # データストアに登録済みの DB は常駐しているデータを使う
+    snap = data_store.snapshot(db_path)
+    if snap is not None:
+        return snap.frames()
+    df_asset_profit, df_balance, df_target = gather(data_store.table_reads(db_path), IO)
     return df_asset_profit, df_balance, df_target
 
 def build_summary(df_asset_profit, df_target) -> Dict[str, float]:
@@ -34,214 +37,740 @@ def build_summary(df_asset_profit, df_target) -> Dict[str, float]:
         "total_target_returns": int(df_target.loc[latest, "トータルリターン"]),
     }
 
-def graph_common_setting(fig, x_title, y_title):
-    fig.update_xaxes(
-        title = dict(text = x_title, font=dict(size=10)),
-        title_standoff=20,
-        tickformat="%y/%m/%d",
-        tickfont=dict(size=8),
-    )
-    fig.update_yaxes(
-        title = dict(text = y_title, font=dict(size=10)),
-        title_standoff=20,
-        tickprefix="¥",
-        separatethousands=False,  # これを追加すると tickformat が消えない
-        tickfont=dict(size=8),
-    )
-    fig.update_layout(
-        # サイズ調整
-        autosize=True, margin=dict(l=0,r=10,t=0,b=30),
-        # template
-        template="plotly_dark",
-    )
-
-    for trace in fig.data:
-        trace.name = trace.name  # 再設定して凡例マッピングを維持
-
-    fig.update_layout(
-        legend=dict(
-            visible=True,
-            orientation="h",
-            yanchor="top",
-            y=1.2,
-            xanchor="right",
-            x=1,
-            font=dict(size=10),
-        )
-    )
+# サマリで前回値との差を出す期間
+SUMMARY_CHANGE_PERIODS = {
+    "1d": pd.DateOffset(days=1),
+    "1w": pd.DateOffset(weeks=1),
+    "1m": pd.DateOffset(months=1),
+}
+
+def _totals_on(db_path: str, table_name: str, day: pd.Timestamp):
+    # 1日分だけを索引の範囲検索で合計する
+    return get_totals(db_path, table_name, ["資産額", "トータルリターン"],
+                      filters={"date": ("range", day, day + pd.Timedelta(days=1))})
+
+@timed("summary")
+def build_summary_from_db(db_path: str) -> Dict[str, Any]:
+    """
+    テーブル全体を読まずにサマリを作る。
+
+    MAX(date) で最新日を求め、その日の実績・目標を日付索引で引く。
+    1日前・1週間前・1か月前(その日が無ければそれ以前で最も近い日)との差も返す。
+    クエリ数は一定で、履歴の長さに依存しない。データストアに登録済みの DB では SQL を実行しない。
+
+    Returns:
+        dict: build_summary と同じキーに加えて
+              "changes": {"1d" | "1w" | "1m": {"date", "total_assets", "total_returns"} or None}
+    """
+    snap = data_store.snapshot(db_path)
+    if snap is not None:
+        asset_table, target_table = "asset", "target"
+        latest_date, totals_on = snap.latest_date, snap.totals_on
+    else:
+        asset_table, target_table = source_table(db_path, "asset"), source_table(db_path, "target")
+        latest_date = lambda table_name, before=None: get_latest_date(
+            db_path, table_name, filters=None if before is None else {"date": ("<", before)})
+        totals_on = lambda table_name, day: _totals_on(db_path, table_name, day)
+
+    latest = latest_date(asset_table)
+    if latest is None:
+        raise ValueError("asset にデータがありません")
+    actual = totals_on(asset_table, latest)
+    target = totals_on(target_table, latest)
+    if target is None:
+        raise ValueError(f"target に {latest:%Y/%m/%d} のデータがありません")
+
+    changes = {}
+    for label, offset in SUMMARY_CHANGE_PERIODS.items():
+        day = latest_date(asset_table, latest - offset + pd.Timedelta(days=1))
+        previous = None if day is None else totals_on(asset_table, day)
+        if previous is None:
+            changes[label] = None
+            continue
+        changes[label] = {
+            "date": day.strftime("%Y/%m/%d"),
+            "total_assets": int(actual["資産額"]) - int(previous["資産額"]),
+            "total_returns": int(actual["トータルリターン"]) - int(previous["トータルリターン"]),
+        }
 
-    return fig
+    return {
+        "latest_date": latest.strftime("%Y/%m/%d"),
+        "total_assets": int(actual["資産額"]),
+        "total_target_assets": int(target["資産額"]),
+        "total_returns": int(actual["トータルリターン"]),
+        "total_target_returns": int(target["トータルリターン"]),
+        "changes": changes,
+    }
 
-def build_total_assets(df_asset_profit, df_target):
+def series_uid(graph_key: str, trace_name: str) -> str:
+    """
+    トレースの安定ID。差分更新時にクライアントが既存トレースを特定するために使う。
+    """
+    return f"{graph_key}:{trace_name}"
+
+def _daily_traces(df, graph_key: str, max_points: int = None):
+    """
+    日次の列ごとに折れ線のトレースを作る。max_points を指定した場合は列ごとに LTTB で間引く。
+    """
+    x_values = format_dates(df.index, "D")
+    traces = []
+    for col in df.columns:
+        y_values = df[col].to_numpy()
+        if max_points is not None and len(df) > max_points:
+            idx = lttb_indices(df.index.values, y_values, max_points)
+            traces.append(scatter(x_values[idx], y_values[idx], col, series_uid(graph_key, col)))
+        else:
+            traces.append(scatter(x_values, y_values, col, series_uid(graph_key, col)))
+    return traces
+
+@timed()
+def build_total_assets(df_asset_profit, df_target, max_points: int = None):
     # データフレーム生成
     df = pd.merge(df_asset_profit["資産額"], df_target["資産額"],
                   left_index=True, right_index=True,suffixes=("_実績", "_目標"))
-    #print(df)
-    # PXでグラフ生成
-    x_values = df.index.strftime("%Y-%m-%d").tolist()
-    y1_values = df["資産額_実績"].astype(float).tolist()
-    y2_values = df["資産額_目標"].astype(float).tolist()
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=x_values, y=y1_values, mode="lines", name="資産額_実績"))
-    fig.add_trace(go.Scatter(x=x_values, y=y2_values, mode="lines", name="資産額_目標"))
-    fig = graph_common_setting(fig, "日付", "資産額")
+    traces = _daily_traces(df[["資産額_実績", "資産額_目標"]], "assets", max_points)
     # metaでID付与
-    fig.update_layout(meta={"id": "total_assets"})
-
-    fig_dict = fig.to_dict()
-    json_str = json.dumps(fig_dict)
-    #fig.show()
-    return json_str
+    return figure(traces, "total_assets", "日付", "資産額")
 
-def build_total_returns(df_asset_profit, df_target):
+@timed()
+def build_total_returns(df_asset_profit, df_target, max_points: int = None):
     # データフレーム生成
     df_cumsum_target = df_target["トータルリターン"]
     df = pd.merge(df_asset_profit["トータルリターン"], df_cumsum_target,
                   left_index=True, right_index=True,suffixes=("_実績", "_目標"))
-    # PXでグラフ生成
-    x_values = df.index.strftime("%Y-%m-%d").tolist()
-    y1_values = df["トータルリターン_実績"].astype(float).tolist()
-    y2_values = df["トータルリターン_目標"].astype(float).tolist()
-
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=x_values, y=y1_values, mode="lines", name="トータルリターン_実績"))
-    fig.add_trace(go.Scatter(x=x_values, y=y2_values, mode="lines", name="トータルリターン_目標"))
-
-    fig = graph_common_setting(fig,"日付", "トータルリターン")
-
+    traces = _daily_traces(df[["トータルリターン_実績", "トータルリターン_目標"]], "returns", max_points)
     # metaでID付与
-    fig.update_layout(meta={"id": "total_returns"})
-
-    fig_dict = fig.to_dict()
-    json_str = json.dumps(fig_dict)
-    #fig.show()
-    #print(json_str)
-    return json_str
-
-def make_general_and_special_balance(df, balance_type: str):
+    return figure(traces, "total_returns", "日付", "トータルリターン")
+
+# make_general_and_special_balance が必ず返す列
+BALANCE_COLUMNS = ["金額_収入", "金額_支出", "目標_収入", "目標_支出"]
+
+@timed("balance")
+def make_general_and_special_balance(df, balance_type: str, opening: Dict[str, float] = None):
+    """
+    収支タイプごとに月次の収入・支出・収支を集計する。
+
+    Args:
+        df (pd.DataFrame): read_table_from_db の df_balance
+        balance_type (str): "一般収支" または "特別収支"
+        opening (dict, optional): 特別収支の累積の初期値 {"金額_収入": ..., "目標_支出": ...}。
+                                  df が途中の月から始まる場合に、それより前の合計を渡す。
+    """
     if balance_type not in ["一般収支", "特別収支"]:
         raise ValueError
 
     df_filtered = df.query('収支タイプ == @balance_type')
 
-    df_filtered = df_filtered.pivot_table(
-        index="date", columns="収支カテゴリー",values=["金額", "目標"], aggfunc="sum")
-    df_filtered.columns = [f"{val}_{cat}" for val, cat in df_filtered.columns]
+    if df_filtered.empty:
+        df_filtered = pd.DataFrame(0.0, index=pd.DatetimeIndex([], name="date"), columns=BALANCE_COLUMNS)
+    else:
+        df_filtered = df_filtered.pivot_table(
+            index="date", columns="収支カテゴリー",values=["金額", "目標"], aggfunc="sum")
+        df_filtered.columns = [f"{val}_{cat}" for val, cat in df_filtered.columns]
+        df_filtered = df_filtered.resample('ME').sum()
+    # 期間内に収入または支出が無い場合も列を揃える
+    for col in BALANCE_COLUMNS:
+        if col not in df_filtered.columns:
+            df_filtered[col] = 0.0
 
-    df_filtered = df_filtered.resample('ME').sum()
     if balance_type == "一般収支":
         df_filtered["目標_収支"] = df_filtered["目標_収入"] + df_filtered["目標_支出"]
         df_filtered["金額_収支"] = df_filtered["金額_収入"] + df_filtered["金額_支出"]
     else:
-        df_filtered["目標_収支"] = df_filtered["目標_収入"].cumsum() + df_filtered["目標_支出"].cumsum()
-        df_filtered["金額_収支"] = df_filtered["金額_収入"].cumsum() + df_filtered["金額_支出"].cumsum()
+        opening = opening or {}
+        df_filtered["目標_収支"] = (df_filtered["目標_収入"].cumsum() + opening.get("目標_収入", 0.0)
+                                    + df_filtered["目標_支出"].cumsum() + opening.get("目標_支出", 0.0))
+        df_filtered["金額_収支"] = (df_filtered["金額_収入"].cumsum() + opening.get("金額_収入", 0.0)
+                                    + df_filtered["金額_支出"].cumsum() + opening.get("金額_支出", 0.0))
 
     return df_filtered
 
+def _income_expenditure_traces(df, graph_key: str):
+    x_values = format_dates(df.index, "M")
+    return [
+        bar(x_values, df["金額_収入"].to_numpy(), "収入実績", series_uid(graph_key, "収入実績")),
+        bar(x_values, df["金額_支出"].to_numpy(), "支出実績", series_uid(graph_key, "支出実績")),
+        scatter(x_values, df["目標_収入"].to_numpy(), "収入目標", series_uid(graph_key, "収入目標"), mode="lines+markers"),
+        scatter(x_values, df["目標_支出"].to_numpy(), "支出目標", series_uid(graph_key, "支出目標"), mode="lines+markers"),
+    ]
+
+@timed()
 def build_general_income_expenditure(df):
-    # PXでグラフ生成
-    x_values = df.index.strftime("%Y-%m").tolist()
-    y1_values = df["金額_収入"].astype(float).tolist()
-    y2_values = df["金額_支出"].astype(float).tolist()
-    y3_values = df["目標_収入"].astype(float).tolist()
-    y4_values = df["目標_支出"].astype(float).tolist()
-
-    fig = go.Figure()
-    fig.add_trace(go.Bar(x=x_values, y=y1_values, name="収入実績"))
-    fig.add_trace(go.Bar(x=x_values, y=y2_values, name="支出実績"))
-    fig.add_trace(go.Scatter(x=x_values, y=y3_values, mode="lines+markers", name="収入目標"))
-    fig.add_trace(go.Scatter(x=x_values, y=y4_values, mode="lines+markers", name="支出目標"))
-
-    fig = graph_common_setting(fig, "日付", "金額")
+    traces = _income_expenditure_traces(df, "general_income_expenditure")
     # metaでID付与
-    fig.update_layout(meta={"id": "general_income_expenditure"})
-
-    fig_dict = fig.to_dict()
-    json_str = json.dumps(fig_dict)
-    #fig.show()
-    return json_str
+    return figure(traces, "general_income_expenditure", "日付", "金額")
 
+@timed()
 def build_general_balance(df):
-    x_values = df.index.strftime("%Y-%m").tolist()
-    y1_values = df["金額_収支"].astype(float).tolist()
-    y2_values = df["目標_収支"].astype(float).tolist()
-    fig = go.Figure()
-    fig.add_trace(go.Bar(x=x_values, y=y1_values, name="収支実績"))
-    fig.add_trace(go.Scatter(x=x_values, y=y2_values, mode="lines+markers", name="収支目標"))
-
-    fig = graph_common_setting(fig, "日付", "金額")
+    x_values = format_dates(df.index, "M")
+    traces = [
+        bar(x_values, df["金額_収支"].to_numpy(), "収支実績", series_uid("general_balance", "収支実績")),
+        scatter(x_values, df["目標_収支"].to_numpy(), "収支目標", series_uid("general_balance", "収支目標"),
+                mode="lines+markers"),
+    ]
     # metaでID付与
-    fig.update_layout(meta={"id": "general_balance"})
-
-    fig_dict = fig.to_dict()
-    json_str = json.dumps(fig_dict)
-    #fig.show()
-    return json_str
+    return figure(traces, "general_balance", "日付", "金額")
 
+@timed()
 def build_special_income_expenditure(df):
-    # PXでグラフ生成
-    x_values = df.index.strftime("%Y-%m").tolist()
-    y1_values = df["金額_収入"].astype(float).tolist()
-    y2_values = df["金額_支出"].astype(float).tolist()
-    y3_values = df["目標_収入"].astype(float).tolist()
-    y4_values = df["目標_支出"].astype(float).tolist()
-
-    fig = go.Figure()
-    fig.add_trace(go.Bar(x=x_values, y=y1_values, name="収入実績"))
-    fig.add_trace(go.Bar(x=x_values, y=y2_values, name="支出実績"))
-    fig.add_trace(go.Scatter(x=x_values, y=y3_values, mode="lines+markers", name="収入目標"))
-    fig.add_trace(go.Scatter(x=x_values, y=y4_values, mode="lines+markers", name="支出目標"))
-
-    fig = graph_common_setting(fig, "日付", "金額")
+    traces = _income_expenditure_traces(df, "special_income_expenditure")
     # metaでID付与
-    fig.update_layout(meta={"id": "special_income_expenditure"})
-
-    fig_dict = fig.to_dict()
-    json_str = json.dumps(fig_dict)
-    #fig.show()
-    return json_str
+    return figure(traces, "special_income_expenditure", "日付", "金額")
 
+@timed()
 def build_special_balance(df):
-    x_values = df.index.strftime("%Y-%m").tolist()
-    y1_values = df["金額_収支"].astype(float).tolist()
-    y2_values = df["目標_収支"].astype(float).tolist()
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=x_values, y=y1_values, mode="lines+markers", fill="tozeroy", name="収支累積実績"))
-    fig.add_trace(go.Scatter(x=x_values, y=y2_values, mode="lines+markers", name="収支累積目標"))
-
-    fig = graph_common_setting(fig, "日付", "金額")
+    x_values = format_dates(df.index, "M")
+    traces = [
+        scatter(x_values, df["金額_収支"].to_numpy(), "収支累積実績", series_uid("special_balance", "収支累積実績"),
+                mode="lines+markers", fill="tozeroy"),
+        scatter(x_values, df["目標_収支"].to_numpy(), "収支累積目標", series_uid("special_balance", "収支累積目標"),
+                mode="lines+markers"),
+    ]
     # metaでID付与
-    fig.update_layout(meta={"id": "special_balance"})
+    return figure(traces, "special_balance", "日付", "金額")
 
-    fig_dict = fig.to_dict()
-    json_str = json.dumps(fig_dict)
-    #fig.show()
-    return json_str
+def build_dashboard_payload(db_path: str, include_graphs: bool = True, include_summary: bool = True,
+                            max_points: int = None, window=None) -> Dict[str, Any]:
+    """
+    サマリと全グラフを作る。
 
-def build_dashboard_payload(db_path: str, include_graphs: bool = True, include_summary: bool = True) -> Dict[str, Any]:
-    # DBから必要データを読み込みます
-    df_asset_profit, df_balance, df_target = read_table_from_db(db_path)
-    #print(df_target)
+    互いに独立な処理は app.utils.executor のプールで並行して実行する。
+    サマリと3テーブルの読み込みを IO プールで、収支の集計と各グラフの作成を CPU プールで実行し、
+    結果は常に GRAPH_KEYS の順に並べる。
 
+    window (parse_window の (開始日, 終了日)) を指定した場合、グラフはその期間の行だけを日付索引の範囲検索で読む
+    (月次のグラフは開始日・終了日を含む月全体)。特別収支の累積は開始月より前の合計を初期値にする。
+    サマリは window に関わらず最新日のもの。
+    """
     result = {"ok":True, "summary": {}, "graphs": {}}
+    balance_window = _balance_window(window)
+    opening_before = balance_window[0] if balance_window is not None else None
+
+    # データストアに登録済みの DB は常駐しているデータを使い、DB は読まない
+    snap = data_store.snapshot(db_path)
+    # サマリはテーブル全体を読まずに最新日だけを引く
+    reads = [lambda: build_summary_from_db(db_path)] if include_summary else []
+    if include_graphs and snap is None:
+        # DBから必要データを読み込みます
+        reads += [timed("read")(read) for read in data_store.table_reads(
+            db_path, filters=_window_filters(window), balance_filters=_window_filters(balance_window))]
+    if include_graphs and opening_before is not None:
+        reads.append(lambda: read_balance_opening(db_path, "特別収支", opening_before))
+    values = gather(reads, IO)
 
     if include_summary:
-        result["summary"] = build_summary(df_asset_profit, df_target)
-        #print(result)
+        result["summary"] = values.pop(0)
     if include_graphs:
-        df_general = make_general_and_special_balance(df_balance, "一般収支")
-        df_special = make_general_and_special_balance(df_balance, "特別収支")
-
-        result["graphs"] = {
-            "assets": build_total_assets(df_asset_profit, df_target),
-            "returns": build_total_returns(df_asset_profit, df_target),
-            "general_income_expenditure": build_general_income_expenditure(df_general),
-            "general_balance": build_general_balance(df_general),
-            "special_income_expenditure": build_special_income_expenditure(df_special),
-            "special_balance": build_special_balance(df_special)
+        opening = values.pop() if opening_before is not None else None
+        if snap is None:
+            df_asset_profit, df_balance, df_target = values
+        else:
+            with stage("read"):
+                df_asset_profit = snap.daily("asset", window=window)
+                df_balance = snap.balances(window=balance_window)
+                df_target = snap.daily("target", window=window)
+
+        df_general, df_special = gather([
+            lambda: _monthly_window(make_general_and_special_balance(df_balance, "一般収支"), window),
+            lambda: _monthly_window(make_general_and_special_balance(df_balance, "特別収支", opening), window),
+        ], CPU)
+
+        # GRAPH_KEYS と同じ順序で並べること
+        builders = {
+            "assets": lambda: build_total_assets(df_asset_profit, df_target, max_points),
+            "returns": lambda: build_total_returns(df_asset_profit, df_target, max_points),
+            "general_income_expenditure": lambda: build_general_income_expenditure(df_general),
+            "general_balance": lambda: build_general_balance(df_general),
+            "special_income_expenditure": lambda: build_special_income_expenditure(df_special),
+            "special_balance": lambda: build_special_balance(df_special),
         }
+        result["graphs"] = dict(zip(builders, gather(list(builders.values()), CPU)))
     return result
 
+def warm_layouts() -> None:
+    """
+    各グラフの共通レイアウトを作っておく(初回だけ必要な Plotly の import と作成を先に済ませる。app.utils.warmup 用)。
+    """
+    for y_title in ("資産額", "トータルリターン", "金額"):
+        layout_template("日付", y_title)
+
+# build_dashboard_payload が返すグラフのキー
+GRAPH_KEYS = (
+    "assets",
+    "returns",
+    "general_income_expenditure",
+    "general_balance",
+    "special_income_expenditure",
+    "special_balance",
+)
+
+# max_points で間引く日次のグラフ
+DOWNSAMPLED_GRAPHS = ("assets", "returns")
+
+def parse_max_points(value: str) -> int:
+    """
+    max_points パラメータを整数に変換する。
+
+    Raises:
+        ValueError: 整数でない、または MIN_POINTS 未満の場合
+    """
+    try:
+        max_points = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid max_points: {value!r}")
+    if max_points < MIN_POINTS:
+        raise ValueError(f"max_points must be >= {MIN_POINTS}, got {max_points}")
+    return max_points
+
+def parse_window(date_from: str = None, date_to: str = None):
+    """
+    from / to パラメータを日付の組にする。どちらも省略した場合は None。
+
+    Returns:
+        tuple: (開始日, 終了日)。省略した側は None。
+
+    Raises:
+        ValueError: 日付として解釈できない場合、または開始日が終了日より後の場合
+    """
+    if date_from is None and date_to is None:
+        return None
+    start = parse_since(date_from) if date_from is not None else None
+    end = parse_since(date_to) if date_to is not None else None
+    if start is not None and end is not None and start > end:
+        raise ValueError(f"from must not be after to: {date_from!r} > {date_to!r}")
+    return start, end
+
+def _window_filters(window) -> Dict[str, Any]:
+    # 終了日はその日の時刻付きの行も含める
+    if window is None:
+        return {}
+    start, end = window
+    if end is None:
+        return {"date": (">=", start)}
+    if start is None:
+        return {"date": ("<", end + pd.Timedelta(days=1))}
+    return {"date": ("range", start, end + pd.Timedelta(days=1))}
+
+def _balance_window(window):
+    # 収支は月次に集計するので、開始日・終了日を含む月全体を読む
+    if window is None:
+        return None
+    start, end = window
+    return (start.to_period("M").start_time if start is not None else None,
+            end + pd.offsets.MonthEnd(0) if end is not None else None)
+
+def _monthly_window(df, window):
+    # 月次の行は月末日なので、開始日・終了日を含む月を残す
+    if window is None:
+        return df
+    start, end = window
+    return df.loc[start:(end + pd.offsets.MonthEnd(0) if end is not None else None)]
+
+@timed("read")
+def _read_asset_and_target(db_path: str, value_col: str, window=None):
+    snap = data_store.snapshot(db_path)
+    if snap is not None:
+        return snap.daily("asset", [value_col], window), snap.daily("target", [value_col], window)
+    df_asset_profit = get_df_from_db(
+        db_path=db_path, table_name=source_table(db_path, "asset"), index_col="date", columns_col=None,
+        values_col=[value_col], aggfunc="sum", set_index=True, filters=_window_filters(window)
+    )
+    df_target = get_df_from_db(
+        db_path=db_path, table_name=source_table(db_path, "target"), index_col="date", columns_col=None,
+        values_col=[value_col], aggfunc="sum", set_index=True, filters=_window_filters(window)
+    )
+    return df_asset_profit, df_target
+
+def _read_balance(db_path: str, balance_type: str, window=None):
+    balance_window = _balance_window(window)
+    with stage("read"):
+        snap = data_store.snapshot(db_path)
+        if snap is not None:
+            df_balance = snap.balances(balance_type, balance_window)
+        else:
+            df_balance = get_df_from_db(
+                db_path=db_path, table_name=source_table(db_path, "balance"), index_col="date",
+                columns_col=["収支タイプ", "収支カテゴリー"], values_col=["金額", "目標"], aggfunc="sum", set_index=True,
+                filters={"収支タイプ": balance_type, **_window_filters(balance_window)},
+            )
+    # 特別収支の累積は期間より前の合計(ロールアップの月次合計から求める)を初期値にする
+    opening = None
+    if balance_type == "特別収支" and balance_window is not None and balance_window[0] is not None:
+        opening = read_balance_opening(db_path, balance_type, balance_window[0])
+    return _monthly_window(make_general_and_special_balance(df_balance, balance_type, opening), window)
+
+# グラフごとの作成関数 (db_path, max_points, window)。各グラフに必要なテーブル・列・収支タイプだけを読む
+GRAPH_BUILDERS = {
+    "assets": lambda db_path, max_points, window: build_total_assets(
+        *_read_asset_and_target(db_path, "資産額", window), max_points),
+    "returns": lambda db_path, max_points, window: build_total_returns(
+        *_read_asset_and_target(db_path, "トータルリターン", window), max_points),
+    "general_income_expenditure": lambda db_path, max_points, window: build_general_income_expenditure(
+        _read_balance(db_path, "一般収支", window)),
+    "general_balance": lambda db_path, max_points, window: build_general_balance(
+        _read_balance(db_path, "一般収支", window)),
+    "special_income_expenditure": lambda db_path, max_points, window: build_special_income_expenditure(
+        _read_balance(db_path, "特別収支", window)),
+    "special_balance": lambda db_path, max_points, window: build_special_balance(
+        _read_balance(db_path, "特別収支", window)),
+}
+
+def build_graph(db_path: str, graph_key: str, max_points: int = None, window=None) -> Dict[str, Any]:
+    """
+    グラフを1つだけ作る。引数を省略した場合は build_dashboard_payload の graphs[graph_key] と同じ内容になる。
+
+    Args:
+        db_path (str): SQLite データベースのパス
+        graph_key (str): GRAPH_KEYS のいずれか
+        max_points (int, optional): 日次のグラフ(DOWNSAMPLED_GRAPHS)の1トレースあたりの最大点数
+        window (tuple, optional): parse_window の (開始日, 終了日)。ズーム時の表示範囲
+
+    Raises:
+        ValueError: graph_key が GRAPH_KEYS に無い場合
+    """
+    if graph_key not in GRAPH_BUILDERS:
+        raise ValueError(f"Unknown graph: {graph_key!r}")
+    return GRAPH_BUILDERS[graph_key](db_path, max_points, window)
+
+def _graph_cache_key(db_path: str, graph_key: str, max_points: int = None, window=None):
+    # 間引かないグラフは max_points に関わらず同じエントリを使う
+    if graph_key not in DOWNSAMPLED_GRAPHS:
+        max_points = None
+    if max_points is None and window is None:
+        return (db_path, "graph", graph_key)
+    return (db_path, "graph", graph_key, max_points, window)
+
+def _store_payload(cache: PayloadCache, db_path: str, version: str, payload: Dict[str, Any],
+                   include_graphs: bool, include_summary: bool, max_points: int = None, window=None) -> None:
+    # サマリとグラフは別エントリとして保存し、片方だけの要求でも再利用できるようにする
+    if include_summary:
+        cache.set((db_path, "summary"), version, payload["summary"])
+    if include_graphs:
+        for key, graph in payload["graphs"].items():
+            cache.set(_graph_cache_key(db_path, key, max_points, window), version, graph)
+
+def register_precompute(db_path: str, config) -> bool:
+    """
+    setting.yaml の dashboard_precompute が有効なら、db_path の既定のペイロード(期間指定なし、
+    max_points は dashboard_graphs.max_points)を取り込みのコミット後に作る対象にする (app.utils.precomputed)。
+
+    Args:
+        db_path (str): SQLite データベースのパス
+        config (dict): app.config
+
+    Returns:
+        bool: 有効な場合 True
+    """
+    settings = config.get("DASHBOARD_PRECOMPUTE") or {}
+    if not settings.get("enabled", False):
+        return False
+    max_points = (config.get("DASHBOARD_GRAPHS") or {}).get("max_points")
+    precomputed.register(db_path, lambda: build_dashboard_payload(db_path, max_points=max_points),
+                         variant=max_points, path=settings.get("snapshot_path") or f"{db_path}.dashboard.json")
+    return True
+
+def _published(db_path: str, cache: PayloadCache, graph_keys, max_points: int = None, window=None):
+    """
+    取り込み時に作ったペイロード (app.utils.precomputed) が要求に使える場合はそれを返す。
+    期間指定が無い場合に限る。間引くグラフを含む場合は、max_points が作ったときと同じか、それより少ない場合に限る
+    (少ない場合は _published_graph で作ったときのグラフをさらに間引く)。
+    作り直しが終わっていない古いペイロードを返す場合は cache に STALE を記録する(古い値から作った本文は保存されない)。
+    まだ作っていない場合(起動直後でウォームアップが終わっていない場合など)は None を返して通常のキャッシュを使わせ、
+    リクエストでは作らずにバックグラウンドで作る。
+    """
+    if window is not None:
+        return None
+    published, state = precomputed.get(db_path)
+    if published is None:
+        precomputed.rebuild_async(db_path)
+        return None
+    if not _covers(published.variant, max_points) and any(key in DOWNSAMPLED_GRAPHS for key in graph_keys):
+        return None
+    cache.mark(state)
+    return published
+
+def _covers(variant, max_points) -> bool:
+    # variant (作ったときの max_points。None は間引いていない) のグラフから max_points のグラフを作れるか
+    if max_points == variant:
+        return True
+    return max_points is not None and (variant is None or max_points < variant)
+
+def _published_graph(published, graph_key: str, max_points: int = None) -> Dict[str, Any]:
+    """
+    取り込み時に作ったペイロードのグラフを返す。間引くグラフで max_points が作ったときより少ない場合は、
+    各トレースを LTTB でさらに間引く(画面の幅に合わせた max_points の要求でもリクエストでは作り直さない)。
+    """
+    graph = published.payload["graphs"][graph_key]
+    if graph_key not in DOWNSAMPLED_GRAPHS or max_points is None or max_points == published.variant:
+        return graph
+    data = []
+    for trace in graph["data"]:
+        if len(trace["y"]) <= max_points:
+            data.append(trace)
+            continue
+        x = np.asarray(trace["x"])
+        y = np.asarray(trace["y"], dtype=np.float64)
+        idx = lttb_indices(x.astype("datetime64[ns]"), y, max_points)
+        data.append({**trace, "x": x[idx], "y": y[idx]})
+    return {**graph, "data": data}
+
+def get_dashboard_payload(db_path: str, cache: PayloadCache = None,
+                          include_graphs: bool = True, include_summary: bool = True,
+                          max_points: int = None, window=None) -> Dict[str, Any]:
+    """
+    build_dashboard_payload の結果をデータバージョン単位でキャッシュして返す。
+    register_precompute で登録した DB で期間指定が無い場合は、取り込み時に作ったペイロードを返す。
+
+    Args:
+        db_path (str): SQLite データベースのパス
+        cache (PayloadCache, optional): 使用するキャッシュ。None の場合は毎回計算する。
+        include_graphs (bool): グラフを含めるかどうか
+        include_summary (bool): サマリを含めるかどうか
+        max_points (int, optional): 日次のグラフの1トレースあたりの最大点数
+        window (tuple, optional): parse_window の (開始日, 終了日)。グラフをその期間に絞る
+
+    Returns:
+        dict: build_dashboard_payload と同じ形式のペイロード
+    """
+    if cache is None:
+        return build_dashboard_payload(db_path, include_graphs=include_graphs, include_summary=include_summary,
+                                       max_points=max_points, window=window)
+
+    # 取り込み時に作ったものがあれば作らずに返す(作り直している間は前のもの)
+    published = _published(db_path, cache, GRAPH_KEYS if include_graphs else (), max_points, window)
+    if published is not None:
+        graphs = published.payload["graphs"] if include_graphs else {}
+        return {
+            "ok": True,
+            "summary": published.payload["summary"] if include_summary else {},
+            "graphs": {key: _published_graph(published, key, max_points) for key in graphs},
+        }
+
+    version = get_data_version(db_path)
+    keys = []
+    if include_summary:
+        keys.append((db_path, "summary"))
+    if include_graphs:
+        keys.extend(_graph_cache_key(db_path, key, max_points, window) for key in GRAPH_KEYS)
+
+    values = {}
+    states = set()
+    for key in keys:
+        values[key], state = cache.get(key, version)
+        states.add(state)
+
+    if MISS in states:
+        payload = build_dashboard_payload(db_path, include_graphs=include_graphs, include_summary=include_summary,
+                                          max_points=max_points, window=window)
+        _store_payload(cache, db_path, version, payload, include_graphs, include_summary, max_points, window)
+        return payload
+
+    if STALE in states:
+        # 古い値を返しつつ最新バージョンで再計算する
+        def refresh():
+            latest = get_data_version(db_path)
+            payload = build_dashboard_payload(db_path, include_graphs=include_graphs, include_summary=include_summary,
+                                              max_points=max_points, window=window)
+            _store_payload(cache, db_path, latest, payload, include_graphs, include_summary, max_points, window)
+        cache.refresh_async((db_path, include_graphs, include_summary, max_points, window), refresh)
+
+    result = {"ok": True, "summary": {}, "graphs": {}}
+    if include_summary:
+        result["summary"] = values[(db_path, "summary")]
+    if include_graphs:
+        result["graphs"] = {key: values[_graph_cache_key(db_path, key, max_points, window)] for key in GRAPH_KEYS}
+    return result
+
+def get_dashboard_graph(db_path: str, graph_key: str, cache: PayloadCache = None,
+                        max_points: int = None, window=None) -> Dict[str, Any]:
+    """
+    build_graph の結果をデータバージョン単位でキャッシュして返す。
+    キャッシュのエントリは get_dashboard_payload のグラフと共通。取り込み時に作ったペイロードがあればそのグラフを返す。
+
+    Raises:
+        ValueError: graph_key が GRAPH_KEYS に無い場合
+    """
+    if cache is None:
+        return build_graph(db_path, graph_key, max_points, window)
+
+    published = _published(db_path, cache, (graph_key,), max_points, window) if graph_key in GRAPH_KEYS else None
+    if published is not None:
+        return _published_graph(published, graph_key, max_points)
+
+    version = get_data_version(db_path)
+    key = _graph_cache_key(db_path, graph_key, max_points, window)
+    value, state = cache.get(key, version)
+    if state == MISS:
+        value = build_graph(db_path, graph_key, max_points, window)
+        cache.set(key, version, value)
+    elif state == STALE:
+        def refresh():
+            latest = get_data_version(db_path)
+            cache.set(key, latest, build_graph(db_path, graph_key, max_points, window))
+        cache.refresh_async(key, refresh)
+    return value
+
+def get_dashboard_bootstrap(db_path: str, cache: PayloadCache = None, graph_key: str = GRAPH_KEYS[0],
+                            max_points: int = None, window=None) -> Dict[str, Any]:
+    """
+    初回表示用に、サマリと最初に表示するグラフ1つをまとめて返す。
+
+    Args:
+        db_path (str): SQLite データベースのパス
+        cache (PayloadCache, optional): 使用するキャッシュ
+        graph_key (str): 一緒に返すグラフのキー
+        max_points (int, optional): 日次のグラフの1トレースあたりの最大点数
+        window (tuple, optional): parse_window の (開始日, 終了日)。グラフをその期間に絞る
+
+    Returns:
+        dict: {"ok", "summary", "graphs": {graph_key: グラフ}}
+
+    Raises:
+        ValueError: graph_key が GRAPH_KEYS に無い場合
+    """
+    if graph_key not in GRAPH_BUILDERS:
+        raise ValueError(f"Unknown graph: {graph_key!r}")
+    result = get_dashboard_payload(db_path, cache, include_graphs=False, include_summary=True)
+    result["graphs"] = {graph_key: get_dashboard_graph(db_path, graph_key, cache, max_points, window)}
+    return result
+
+# 差分更新用: グラフごとの (トレース名, 列名)。build_* 関数のトレースと同じ順序・名前にすること
+GRAPH_TRACES = {
+    "assets": [("資産額_実績", "資産額_実績"), ("資産額_目標", "資産額_目標")],
+    "returns": [("トータルリターン_実績", "トータルリターン_実績"), ("トータルリターン_目標", "トータルリターン_目標")],
+    "general_income_expenditure": [("収入実績", "金額_収入"), ("支出実績", "金額_支出"),
+                                   ("収入目標", "目標_収入"), ("支出目標", "目標_支出")],
+    "general_balance": [("収支実績", "金額_収支"), ("収支目標", "目標_収支")],
+    "special_income_expenditure": [("収入実績", "金額_収入"), ("支出実績", "金額_支出"),
+                                   ("収入目標", "目標_収入"), ("支出目標", "目標_支出")],
+    "special_balance": [("収支累積実績", "金額_収支"), ("収支累積目標", "目標_収支")],
+}
+
+def parse_since(value: str) -> pd.Timestamp:
+    """
+    since パラメータ(YYYY-MM-DD または YYYY/MM/DD)を日付に変換する。
+
+    Raises:
+        ValueError: 日付として解釈できない場合
+    """
+    ts = pd.to_datetime(value, errors="coerce")
+    if pd.isna(ts):
+        raise ValueError(f"Invalid since: {value!r}")
+    return ts.normalize()
+
+@timed("read")
+def read_balance_opening(db_path: str, balance_type: str, before: pd.Timestamp) -> Dict[str, float]:
+    """
+    before より前の収支カテゴリーごとの金額・目標の合計を返す(累積グラフの初期値)。
+    """
+    snap = data_store.snapshot(db_path)
+    if snap is not None:
+        return snap.balance_opening(balance_type, before)
+    df = get_df_from_db(
+        db_path=db_path, table_name=source_table(db_path, "balance"), index_col="収支カテゴリー", columns_col=None,
+        values_col=["金額", "目標"], aggfunc="sum", set_index=True,
+        filters={"収支タイプ": balance_type, "date": ("<", before)},
+    )
+    return {f"{val}_{cat}": float(df.loc[cat, val]) for cat in df.index for val in ["金額", "目標"]}
+
+def _graph_delta(graph_key: str, df: pd.DataFrame, x_format: str, replace_from: str) -> Dict[str, Any]:
+    x_values = df.index.strftime(x_format).tolist()
+    return {
+        "replace_from": replace_from,
+        "traces": [
+            {"uid": series_uid(graph_key, name), "x": x_values, "y": df[col].astype(float).tolist()}
+            for name, col in GRAPH_TRACES[graph_key]
+        ],
+    }
+
+def build_dashboard_delta(db_path: str, since) -> Dict[str, Any]:
+    """
+    since より後に追加されたデータだけでグラフの差分を作る。
+
+    日次のグラフ(資産額・トータルリターン)は since の翌日以降の点を返す。
+    月次のグラフは since の翌日を含む月以降の点を返し、クライアントは replace_from 以降の点を置き換える。
+    特別収支の累積はそれより前の合計を初期値として加算する。
+
+    Returns:
+        dict: {"ok", "since", "latest_date", "graphs": {key: {"replace_from", "traces": [{"uid", "x", "y"}]}}}
+    """
+    since = parse_since(since) if not isinstance(since, pd.Timestamp) else since.normalize()
+    day_after = since + pd.Timedelta(days=1)
+    month_start = day_after.to_period("M").start_time
+
+    snap = data_store.snapshot(db_path)
+    if snap is not None:
+        df_asset_profit = snap.daily("asset", window=(day_after, None))
+    else:
+        df_asset_profit = get_df_from_db(
+            db_path=db_path, table_name=source_table(db_path, "asset"), index_col="date", columns_col=None,
+            values_col=["資産額", "トータルリターン"], aggfunc="sum", set_index=True,
+            filters={"date": (">=", day_after)},
+        )
+    if df_asset_profit.empty:
+        latest = since
+        df_target = df_asset_profit
+    else:
+        latest = df_asset_profit.index.max()
+        # 目標は将来分まで入っているので、実績の最新日までに絞る
+        if snap is not None:
+            df_target = snap.daily("target", window=(day_after, latest))
+        else:
+            df_target = get_df_from_db(
+                db_path=db_path, table_name=source_table(db_path, "target"), index_col="date", columns_col=None,
+                values_col=["資産額", "トータルリターン"], aggfunc="sum", set_index=True,
+                filters={"date": ("range", day_after, latest + pd.Timedelta(days=1))},
+            )
+    if snap is not None:
+        df_balance = snap.balances(window=(month_start, None))
+    else:
+        df_balance = get_df_from_db(
+            db_path=db_path, table_name=source_table(db_path, "balance"), index_col="date",
+            columns_col=["収支タイプ", "収支カテゴリー"], values_col=["金額", "目標"], aggfunc="sum", set_index=True,
+            filters={"date": (">=", month_start)},
+        )
+
+    df_assets = pd.merge(df_asset_profit["資産額"], df_target["資産額"],
+                         left_index=True, right_index=True, suffixes=("_実績", "_目標"))
+    df_returns = pd.merge(df_asset_profit["トータルリターン"], df_target["トータルリターン"],
+                          left_index=True, right_index=True, suffixes=("_実績", "_目標"))
+    df_general = make_general_and_special_balance(df_balance, "一般収支")
+    df_special = make_general_and_special_balance(
+        df_balance, "特別収支", opening=read_balance_opening(db_path, "特別収支", month_start))
+
+    daily_from = day_after.strftime("%Y-%m-%d")
+    monthly_from = month_start.strftime("%Y-%m")
+    return {
+        "ok": True,
+        "since": since.strftime("%Y-%m-%d"),
+        "latest_date": latest.strftime("%Y-%m-%d"),
+        "graphs": {
+            "assets": _graph_delta("assets", df_assets, "%Y-%m-%d", daily_from),
+            "returns": _graph_delta("returns", df_returns, "%Y-%m-%d", daily_from),
+            "general_income_expenditure": _graph_delta("general_income_expenditure", df_general, "%Y-%m", monthly_from),
+            "general_balance": _graph_delta("general_balance", df_general, "%Y-%m", monthly_from),
+            "special_income_expenditure": _graph_delta("special_income_expenditure", df_special, "%Y-%m", monthly_from),
+            "special_balance": _graph_delta("special_balance", df_special, "%Y-%m", monthly_from),
+        },
+    }
+
+def get_dashboard_delta(db_path: str, since, cache: PayloadCache = None) -> Dict[str, Any]:
+    """
+    build_dashboard_delta の結果を (since, データバージョン) 単位でキャッシュして返す。
+    """
+    since = parse_since(since)
+    if cache is None:
+        return build_dashboard_delta(db_path, since)
+    version = get_data_version(db_path)
+    key = (db_path, "delta", since.strftime("%Y-%m-%d"))
+    # 差分は古い値を返すと欠損が出るので、stale_while_revalidate の設定に関わらず HIT のみ使う
+    payload, state = cache.get(key, version)
+    if state == HIT:
+        return payload
+    payload = build_dashboard_delta(db_path, since)
+    cache.set(key, version, payload)
+    return payload
+
 if __name__ == "__main__":
     import os
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,98 @@
+"""
+plotly.graph_objects を経由せずにダッシュボードのグラフを組み立てる。
+
+go.Figure の作成・プロパティ検証・to_dict() はグラフごとに毎回行うと重いので、
+共通のレイアウト(graph_common_setting を適用したもの)は軸タイトルごとに一度だけ Plotly で作って保持する。
+グラフは {"data": [...], "layout": {...}} の dict で、トレースの x, y は NumPy 配列のまま持ち、
+レスポンスを書き出すときに app.utils.json_provider.dumps_bytes で直接 JSON にする。
+出力は go.Figure(...).to_dict() を JSON にしたものと同じ内容になる。
+"""
+from functools import lru_cache
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.utils.json_provider import dumps_bytes
+
+def graph_common_setting(fig, x_title, y_title):
+    fig.update_xaxes(
+        title = dict(text = x_title, font=dict(size=10)),
+        title_standoff=20,
+        tickformat="%y/%m/%d",
+        tickfont=dict(size=8),
+    )
+    fig.update_yaxes(
+        title = dict(text = y_title, font=dict(size=10)),
+        title_standoff=20,
+        tickprefix="¥",
+        separatethousands=False,  # これを追加すると tickformat が消えない
+        tickfont=dict(size=8),
+    )
+    fig.update_layout(
+        # サイズ調整
+        autosize=True, margin=dict(l=0,r=10,t=0,b=30),
+        # template
+        template="plotly_dark",
+    )
+
+    for trace in fig.data:
+        trace.name = trace.name  # 再設定して凡例マッピングを維持
+
+    fig.update_layout(
+        legend=dict(
+            visible=True,
+            orientation="h",
+            yanchor="top",
+            y=1.2,
+            xanchor="right",
+            x=1,
+            font=dict(size=10),
+        )
+    )
+
+    return fig
+
+@lru_cache(maxsize=None)
+def layout_template(x_title: str, y_title: str) -> Dict[str, Any]:
+    """
+    graph_common_setting を適用したレイアウトを返す。軸タイトルの組み合わせごとに一度だけ Plotly で作る。
+    戻り値は共有されるので変更しないこと。
+    """
+    import plotly.graph_objects as go
+    return graph_common_setting(go.Figure(), x_title, y_title).to_dict()["layout"]
+
+def format_dates(index, unit: str = "D") -> np.ndarray:
+    """
+    日付の配列を文字列にする。unit="D" は "YYYY-MM-DD"、unit="M" は "YYYY-MM"。
+    """
+    return np.datetime_as_string(np.asarray(index, dtype="datetime64[ns]"), unit=unit)
+
+def scatter(x, y, name: str, uid: str, mode: str = "lines", fill: str = None) -> Dict[str, Any]:
+    spec = {"fill": fill, "mode": mode, "name": name, "uid": uid, "x": x, "y": y, "type": "scatter"}
+    return {k: v for k, v in spec.items() if v is not None}
+
+def bar(x, y, name: str, uid: str) -> Dict[str, Any]:
+    return {"name": name, "uid": uid, "x": x, "y": y, "type": "bar"}
+
+def figure(traces: List[Dict[str, Any]], graph_id: str, x_title: str, y_title: str) -> Dict[str, Any]:
+    """
+    トレースと共通レイアウトから Plotly.newPlot 用のグラフを作る。
+
+    Args:
+        traces (list): scatter() / bar() で作ったトレース
+        graph_id (str): layout.meta.id に入れるグラフID
+        x_title (str): x軸タイトル
+        y_title (str): y軸タイトル
+
+    Returns:
+        dict: {"data": [...], "layout": {...}}。x, y は NumPy 配列のまま
+    """
+    layout = dict(layout_template(x_title, y_title))
+    layout["meta"] = {"id": graph_id}
+    return {"data": traces, "layout": layout}
+
+def figure_json(traces: List[Dict[str, Any]], graph_id: str, x_title: str, y_title: str) -> str:
+    """
+    figure の結果を JSON 文字列にする。
+    """
+    return dumps_bytes(figure(traces, graph_id, x_title, y_title)).decode("utf-8")
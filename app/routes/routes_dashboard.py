@@ -1,6 +1,11 @@
-from flask import Blueprint, render_template, current_app,jsonify,make_response
-from .dashboard_service import build_dashboard_payload
-from werkzeug.exceptions import InternalServerError
+from flask import Blueprint, render_template, current_app,jsonify,make_response,request, g
+from app.utils.cache import HIT, MISS, STALE
+from app.utils import timing
+from app.utils.config import finance_db_path
+from app.utils.compression import EncodedBody, IDENTITY, choose_encoding
+from app.utils.json_provider import dumps_bytes
+from werkzeug.exceptions import BadRequest, HTTPException, NotAcceptable, NotFound, InternalServerError
+import hashlib
 import os
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -9,6 +14,197 @@ FINANCE_DB = os.path.join(DB_DIR, "finance.db")
 
 dashboard_bp = Blueprint("dashboard", __name__, url_prefix="/api/dashboard")
 
+# dashboard_service, data_loader, data_store, arrow_ipc は pandas・NumPy・Plotly・pyarrow を読み込むので、
+# 起動を軽くするためにモジュールの先頭ではなく最初に使うところで import する
+
+JSON = "application/json"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+def _timing_settings():
+    return current_app.config.get("TIMING") or {}
+
+@dashboard_bp.before_request
+def _start_timing():
+    # 無効の場合は計測しない(各段階の計測は contextvars を見るだけになる)
+    if _timing_settings().get("enabled", False):
+        g.timing_token = timing.start()
+
+@dashboard_bp.after_request
+def _add_server_timing(resp):
+    """
+    段階ごとの所要時間を Server-Timing ヘッダに付け、構造化ログ (JSON 1行) に出す。
+    """
+    timings = timing.current() if "timing_token" in g else None
+    if timings is not None:
+        resp.headers["Server-Timing"] = timings.server_timing()
+        if _timing_settings().get("log", False):
+            timing.log(timings, method=request.method, path=request.path,
+                       query=request.query_string.decode("utf-8", "replace"), status=resp.status_code)
+    return resp
+
+@dashboard_bp.teardown_request
+def _finish_timing(exc):
+    token = g.pop("timing_token", None)
+    if token is not None:
+        timing.finish(token)
+
+def _variant() -> str:
+    return f"{request.path}?{request.query_string.decode('utf-8', 'replace')}"
+
+def _validators(db_path: str, encoding: str = IDENTITY, mimetype: str = JSON):
+    """
+    条件付きGET用の検証子 (ETag, Last-Modified) を返す。
+    ETag はDBのファイル属性のバージョンとリクエストのパス・クエリ、本文の形式、圧縮方式から作る。
+    プロセス内のカウンタ (get_data_version) は使わないので、複数プロセスや再起動の後も同じデータなら同じ ETag になる。
+    """
+    from app.utils.data_loader import get_file_version, get_last_modified
+    etag = hashlib.sha1(
+        f"{get_file_version(db_path)}|{_variant()}|{mimetype}|{encoding}".encode("utf-8")).hexdigest()
+    return etag, get_last_modified(db_path)
+
+def _is_not_modified(etag: str, last_modified) -> bool:
+    # If-None-Match があればそちらを優先する (RFC 9110)
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+def _with_validators(resp, etag: str, last_modified):
+    resp.set_etag(etag)
+    if last_modified:
+        resp.last_modified = last_modified
+    # 保存は許可し、再利用時は必ず再検証させる
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+def _response_format(arrow=None):
+    """
+    Accept から本文の形式を選ぶ。arrow (ペイロードを Arrow IPC にする関数) を渡したエンドポイントで、
+    Arrow の q 値が JSON より高い場合だけ Arrow にする(同じ場合や Accept が無い場合は JSON)。
+
+    Returns:
+        tuple: (Content-Type, ペイロードを本文にする関数)
+
+    Raises:
+        NotAcceptable: Arrow だけを受け付けるが、pyarrow が無いなどで Arrow を返せない場合
+    """
+    accept = request.accept_mimetypes
+    if accept.quality(ARROW_STREAM) <= accept.quality(JSON):
+        return JSON, dumps_bytes
+    if arrow is not None:
+        from app.utils import arrow_ipc
+        if arrow_ipc.available():
+            return ARROW_STREAM, getattr(arrow_ipc, arrow)
+    if not accept.quality(JSON):
+        raise NotAcceptable(description=f"This endpoint returns {JSON}")
+    return JSON, dumps_bytes
+
+def _encode(payload, serialize=dumps_bytes) -> EncodedBody:
+    with timing.stage("serialize"):
+        body = serialize(payload)
+    with timing.stage("compress"):
+        return EncodedBody(body)
+
+def _encoded_body(db_path: str, build, mimetype: str = JSON, serialize=dumps_bytes):
+    """
+    build(cache) の結果を serialize で本文 (JSON または Arrow IPC) にして圧縮した本文を返す。
+    圧縮済みの本文はデータバージョン・パス・クエリ・形式単位でキャッシュし、リクエストごとには圧縮しない。
+
+    Returns:
+        tuple: (EncodedBody, 状態)。状態は古いデータから作った本文の場合 STALE、それ以外は HIT / MISS
+    """
+    from app.utils.data_loader import get_data_version
+    cache = current_app.extensions.get("dashboard_cache")
+    if cache is None:
+        return _encode(build(None), serialize), MISS
+
+    key = (db_path, "response", _variant(), mimetype)
+    body, state = cache.get(key, get_data_version(db_path))
+    if state == HIT:
+        return body, HIT
+
+    def rebuild():
+        version = get_data_version(db_path)
+        with cache.track() as states:
+            encoded = _encode(build(cache), serialize)
+        # 古いグラフ・サマリから作った本文は保存しない(再計算後の要求で作り直す)
+        if STALE in states:
+            return encoded, STALE
+        cache.set(key, version, encoded)
+        return encoded, MISS
+
+    if state == STALE:
+        cache.refresh_async(key, rebuild)
+        return body, STALE
+    return rebuild()
+
+def _json_response(db_path: str, build, arrow: str = None):
+    """
+    build(cache) の結果を JSON で返す。データが変わっていなければ作らずに 304 を返す。
+    本文は Accept-Encoding に応じて zstd / gzip で圧縮する。
+
+    arrow に app.utils.arrow_ipc の関数名 ("graphs_to_ipc" / "columns_to_ipc") を渡すと、
+    Accept で Arrow (application/vnd.apache.arrow.stream) を優先したリクエストには Arrow IPC ストリームを返す。
+    """
+    mimetype, serialize = _response_format(arrow)
+    encoding = choose_encoding(request.accept_encodings)
+    etag, last_modified = _validators(db_path, encoding, mimetype)
+    if _is_not_modified(etag, last_modified):
+        resp = _with_validators(make_response("", 304), etag, last_modified)
+    else:
+        body, state = _encoded_body(db_path, build, mimetype, serialize)
+        content_encoding, data = body.get(encoding)
+        resp = make_response(data, 200)
+        resp.mimetype = mimetype
+        if content_encoding != IDENTITY:
+            resp.headers["Content-Encoding"] = content_encoding
+        if state == STALE:
+            # 前のデータの本文に今のデータの ETag を付けると、作り直した後も 304 で古い本文が使われ続ける
+            resp.headers["Cache-Control"] = "no-store"
+            resp.vary.add("Accept-Encoding")
+        else:
+            resp = _with_validators(resp, etag, last_modified)
+    if arrow is not None:
+        resp.vary.add("Accept")
+    return resp
+
+def _max_points():
+    """
+    ?max_points= を返す。省略時と上限は設定 dashboard_graphs.max_points(未設定なら間引かない)。
+
+    Raises:
+        BadRequest: max_points が不正な場合
+    """
+    from .dashboard_service import parse_max_points
+    limit = (current_app.config.get("DASHBOARD_GRAPHS") or {}).get("max_points")
+    value = request.args.get("max_points")
+    if value is None:
+        return limit
+    try:
+        max_points = parse_max_points(value)
+    except ValueError as e:
+        raise BadRequest(description=str(e))
+    return min(max_points, limit) if limit else max_points
+
+def _window():
+    """
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD を (開始日, 終了日) にする。どちらも省略した場合は None(全期間)。
+
+    Raises:
+        BadRequest: 日付が不正な場合、または from が to より後の場合
+    """
+    from .dashboard_service import parse_window
+    try:
+        return parse_window(request.args.get("from"), request.args.get("to"))
+    except ValueError as e:
+        raise BadRequest(description=str(e))
+
+def _finance_db_path() -> str:
+    # data_store・dashboard_precompute への登録は起動時に済ませる (app.utils.warmup.register_finance_db)
+    return finance_db_path(current_app.config)
+
 @dashboard_bp.route("/view")
 def view():
     return render_template("dashboard.html")
@@ -24,6 +220,8 @@ def index():
         "version": "1.0",
         "endpoints": {
             "graphs": "/api/dashboard/graphs",
+            "graph": "/api/dashboard/graphs/<graph_id>",
+            "bootstrap": "/api/dashboard/bootstrap",
             "summary": "/api/dashboard/summary"
         }
     }
@@ -34,35 +232,98 @@ def graphs():
     """
     グラフ用データを返すエンドポイント。
     フロントはここから時系列データ・メタ情報を受け取り描画する。
+
+    ?since=YYYY-MM-DD を指定すると、その日より後に追加された点だけを
+    トレースの uid 付きで返す(Plotly.extendTraces で既存グラフに追加する)。
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD でその期間だけを返す(その期間の行だけを読む)。
     """
+    from .dashboard_service import get_dashboard_delta, get_dashboard_payload, parse_since
+    since = request.args.get("since")
+    if since is not None:
+        try:
+            parse_since(since)
+        except ValueError as e:
+            raise BadRequest(description=str(e))
+    window = _window()
+    if since is not None and window is not None:
+        raise BadRequest(description="since and from/to cannot be combined")
+    max_points = _max_points()
     try:
-        db_path = os.path.join(
-            current_app.config["DATABASE_PATH"],
-            current_app.config["DATABASE"]["finance"]
+        db_path = _finance_db_path()
+        if since is not None:
+            return _json_response(db_path, lambda cache: get_dashboard_delta(db_path, since, cache), "graphs_to_ipc")
+        return _json_response(
+            db_path, lambda cache: get_dashboard_payload(db_path, cache, include_graphs=True, include_summary=False,
+                                                         max_points=max_points, window=window),
+            "graphs_to_ipc"
         )
-        payload = build_dashboard_payload(db_path, include_graphs=True, include_summary=False)
-        # 200 OK
-        resp = make_response(jsonify(payload), 200)
-        # キャッシュ挙動（必要に応じ調整）
-        resp.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        return resp
+    except HTTPException:
+        raise
     except Exception as e:
         # ログはアプリ側で出している想定
         raise InternalServerError(description=str(e))
 
+@dashboard_bp.route("/graphs/<graph_id>", methods=["GET"])
+def graph(graph_id):
+    """
+    グラフを1つだけ返すエンドポイント。そのグラフに必要なテーブルだけを読む。
+
+    ?max_points= で日次のグラフの1トレースあたりの点数を LTTB で間引く。
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD でその期間だけを返す(ズーム時に間引かれていない点を取得する)。
+    """
+    from .dashboard_service import GRAPH_KEYS, get_dashboard_graph
+    if graph_id not in GRAPH_KEYS:
+        raise NotFound(description=f"Unknown graph: {graph_id}")
+    window = _window()
+    max_points = _max_points()
+    try:
+        db_path = _finance_db_path()
+        return _json_response(
+            db_path, lambda cache: {"ok": True, "graphs": {
+                graph_id: get_dashboard_graph(db_path, graph_id, cache, max_points, window)
+            }},
+            "graphs_to_ipc"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise InternalServerError(description=str(e))
+
+@dashboard_bp.route("/bootstrap", methods=["GET"])
+def bootstrap():
+    """
+    初回表示用: サマリと最初に表示するグラフ (?graph=、省略時は assets) を1回で返す。
+    残りのグラフはフロントが /graphs/<graph_id> で個別に取得する。
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD でグラフをその期間に絞る(サマリは常に最新日)。
+    """
+    from .dashboard_service import GRAPH_KEYS, get_dashboard_bootstrap
+    graph_id = request.args.get("graph", GRAPH_KEYS[0])
+    if graph_id not in GRAPH_KEYS:
+        raise BadRequest(description=f"Unknown graph: {graph_id}")
+    window = _window()
+    max_points = _max_points()
+    try:
+        db_path = _finance_db_path()
+        return _json_response(
+            db_path, lambda cache: get_dashboard_bootstrap(db_path, cache, graph_id, max_points, window),
+            "graphs_to_ipc")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise InternalServerError(description=str(e))
+
 @dashboard_bp.route("/summary", methods=["GET"])
 def summary():
     """
     サマリ（軽量）だけほしいフロントのための簡易エンドポイント。
     """
+    from .dashboard_service import get_dashboard_payload
     try:
-        db_path = os.path.join(
-            current_app.config["DATABASE_PATH"],
-            current_app.config["DATABASE"]["finance"]
+        db_path = _finance_db_path()
+        return _json_response(
+            db_path, lambda cache: get_dashboard_payload(db_path, cache, include_graphs=False, include_summary=True)
         )
-        payload = build_dashboard_payload(db_path, include_graphs=False, include_summary=True)
-        resp = make_response(jsonify(payload), 200)
-        resp.headers["Cache-Control"] = "no-cache"
-        return resp
+    except HTTPException:
+        raise
     except Exception as e:
-        raise InternalServerError(description=str(e))
+        raise InternalServerError(description=str(e))
\ No newline at end of file
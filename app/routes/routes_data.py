@@ -1,18 +1,138 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Request, request, jsonify, current_app, url_for
 import os
-import pandas as pd
-import sqlite3
-from werkzeug.exceptions import BadRequest, InternalServerError
-from app.utils.data_loader import update_from_csv
+import tempfile
+import threading
+from werkzeug.exceptions import BadRequest, InternalServerError, NotFound
+from app.utils import metrics
+from app.utils.jobs import DEFAULT_KEEP_FINISHED, JobQueue
 
 data_bp = Blueprint("data", __name__, url_prefix="/api/data")
 
+# ingest, db_schema, data_store, precomputed, dashboard_service は pandas を読み込むので、
+# 起動を軽くするために使うところで import する
+
+# アップロードされたファイルをメモリに置く上限(これを超えると一時ファイルに書き出す)
+DEFAULT_SPOOL_MAX_MEMORY = 1024 * 1024
+
+_job_queue_lock = threading.Lock()
+
+class SpoolingRequest(Request):
+    """
+    アップロードファイルを setting.yaml の upload.spool_max_memory を超えた分から
+    一時ファイルに書き出すリクエスト。
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        settings = current_app.config.get("UPLOAD") or {}
+        max_size = settings.get("spool_max_memory", DEFAULT_SPOOL_MAX_MEMORY)
+        return tempfile.SpooledTemporaryFile(max_size=max_size, mode="rb+")
+
+def _job_dir() -> str:
+    settings = current_app.config.get("UPLOAD") or {}
+    return settings.get("job_dir") or os.path.join(current_app.config["DATABASE_PATH"], "jobs")
+
+def _job_queue() -> JobQueue:
+    """
+    取り込みジョブのキュー(アプリごとに1つ、最初のアップロード時に作る)。
+    """
+    queue = current_app.extensions.get("ingest_jobs")
+    if queue is None:
+        with _job_queue_lock:
+            queue = current_app.extensions.get("ingest_jobs")
+            if queue is None:
+                app = current_app._get_current_object()
+                settings = app.config.get("UPLOAD") or {}
+
+                def handler(payload, progress):
+                    with app.app_context():
+                        return _run_ingest_job(payload, progress)
+
+                queue = JobQueue(os.path.join(_job_dir(), "jobs.db"), handler,
+                                 keep_finished=settings.get("keep_finished_jobs", DEFAULT_KEEP_FINISHED))
+                app.extensions["ingest_jobs"] = queue
+    return queue
+
+_INGEST_ROWS = metrics.counter(
+    "ingest_rows_total", "アップロードで取り込んだ行数(inserted / updated / unchanged)", ["table", "change"])
+_INGEST_SECONDS = metrics.histogram(
+    "ingest_duration_seconds", "アップロードの取り込み(ファイルの解析と書き込み)の所要時間", ["mode"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+_INGEST_JOBS = metrics.counter(
+    "ingest_jobs_total", "終了した取り込みジョブの数", ["mode", "status"])
+
+def _run_ingest_job(payload, progress):
+    """
+    取り込みジョブの本体(ジョブキューのワーカースレッドで実行する)。
+    保存しておいたアップロードファイルは成否にかかわらず削除する。
+    """
+    from app.utils import data_store, precomputed
+    from app.utils.db_schema import optimize_database
+    from app.utils.ingest import ingest_files
+    db_path = payload["db_path"]
+    files = payload["files"]
+    sources = {}
+    try:
+        for table, file in files.items():
+            sources[table] = open(file["path"], "rb")
+        result = ingest_files(
+            db_path, sources, chunk_rows=payload["chunk_rows"], mode=payload["mode"],
+            formats={table: file["format"] for table, file in files.items()}, progress=progress,
+        )
+    except Exception:
+        _INGEST_JOBS.inc(mode=payload["mode"], status="failed")
+        raise
+    finally:
+        for f in sources.values():
+            f.close()
+        for file in files.values():
+            try:
+                os.remove(file["path"])
+            except OSError:
+                pass
+
+    _INGEST_JOBS.inc(mode=payload["mode"], status="succeeded")
+    _INGEST_SECONDS.observe(result["elapsed_sec"], mode=payload["mode"])
+    for table, changes in result["changes"].items():
+        for change, rows in changes.items():
+            _INGEST_ROWS.inc(rows, table=table, change=change)
+
+    asset_added = result["counts"].get("asset", 0)
+    balance_added = result["counts"].get("balance", 0)
+    # 変更が無い場合(upsert で送り直した行がすべて同じ値だった場合など)は何もしない
+    if asset_added or balance_added:
+        # 統計情報を更新してクエリプランを最新のデータ量に合わせる
+        optimize_database(db_path)
+
+        # ダッシュボードのキャッシュを無効化
+        cache = current_app.extensions.get("dashboard_cache")
+        if cache is not None:
+            cache.invalidate(lambda key: key[0] == db_path)
+        # 常駐データを読み込み直して入れ替える(次のリクエストで読み込みを待たないように)
+        data_store.refresh(db_path)
+        # ダッシュボードのペイロードを作り直して差し替える(作り終えるまでリクエストには前のものを返す)
+        if precomputed.is_registered(db_path):
+            precomputed.rebuild(db_path)
+
+    return {
+        "mode": payload["mode"],
+        "updated_counts": {"asset": asset_added, "balance": balance_added},
+        "changes": result["changes"],
+        "elapsed_sec": result["elapsed_sec"],
+        "rows_per_sec": result["rows_per_sec"],
+    }
+
 @data_bp.route("/upload", methods=["POST"])
 def upload_update():
     """
     CSVファイル(diff_asset_profit.csv, diff_balance.csv)を受け取り、
-    finance.db の asset, balance テーブルに追記する。
+    finance.db の asset, balance テーブルに追記するジョブを登録する。
+    各ファイルの Content-Type(または拡張子)が Arrow IPC ストリーム / Parquet の場合はその形式で読む。
+
+    取り込みはバックグラウンドのワーカー1本で順番に行い、すぐに 202 とジョブ ID を返す。
+    進捗と結果は /api/data/jobs/<job_id> で確認する。
+    2つのファイルは並行して少しずつ解析し、1トランザクションで書き込む(どちらかが失敗したら何も追加しない)。
+    フォームの mode に "upsert" を指定すると、(date, 資産名) / (date, 収支項目) が同じ行を上書きする。
     """
+    from app.utils.ingest import APPEND, DEFAULT_CHUNK_ROWS, MODES, detect_format
     try:
         # ファイルの取得
         file_asset = request.files.get("file_asset")
@@ -21,26 +141,59 @@ def upload_update():
         if not file_asset and not file_balance:
             raise BadRequest("No files provided. 'file_asset' or 'file_balance' is required.")
 
+        mode = request.form.get("mode", APPEND)
+        if mode not in MODES:
+            raise BadRequest(f"mode must be one of {', '.join(MODES)}: {mode!r}")
+
         db_path = os.path.join(
             current_app.config["DATABASE_PATH"],
             current_app.config["DATABASE"]["finance"]
         )
-        # --- CSV → DB ---
-        asset_added = 0
-        balance_added = 0
-
-        if file_asset:
-            asset_added = update_from_csv(db_path, file_asset, "asset")
-        if file_balance:
-            balance_added = update_from_csv(db_path, file_balance, "balance")
-
-        return jsonify({
-            "status": "success",
-            "updated_counts": {"asset": asset_added, "balance": balance_added}
+        queue = _job_queue()
+
+        # リクエストが終わるとアップロードファイルは消えるので、ジョブ用のディレクトリに保存しておく
+        prefix = os.urandom(8).hex()
+        files = {}
+        for table, file in (("asset", file_asset), ("balance", file_balance)):
+            if file:
+                path = os.path.join(_job_dir(), f"{prefix}_{table}.upload")
+                file.save(path)
+                files[table] = {"path": path, "format": detect_format(file.mimetype, file.filename)}
+
+        job_id = queue.submit({
+            "db_path": db_path,
+            "files": files,
+            "mode": mode,
+            "chunk_rows": (current_app.config.get("UPLOAD") or {}).get("chunk_rows", DEFAULT_CHUNK_ROWS),
         })
+        job_url = url_for("data.get_job", job_id=job_id)
+        response = jsonify({"status": "accepted", "job_id": job_id, "job_url": job_url})
+        response.status_code = 202
+        response.headers["Location"] = job_url
+        return response
 
     except BadRequest as e:
         return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Database update failed: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
+
+@data_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """
+    取り込みジョブの状態(queued / running / succeeded / failed)、処理済みの行数、結果、所要時間を返す。
+    """
+    job = _job_queue().get(job_id)
+    if job is None:
+        raise NotFound(f"Unknown job: {job_id}")
+    return jsonify(job)
+
+@data_bp.route("/store", methods=["GET"])
+def get_store():
+    """
+    常駐データ (app.utils.data_store) の DB ごとの行数・メモリ使用量・読み込み時間と、
+    取り込み時に作るペイロード (app.utils.precomputed) の作成時刻・作成時間を返す。
+    """
+    from app.utils import data_store, precomputed
+    enabled = (current_app.config.get("DATA_STORE") or {}).get("enabled", False)
+    return jsonify({"enabled": enabled, "stores": data_store.stats(), "payloads": precomputed.stats()})
@@ -0,0 +1,57 @@
+from flask import Blueprint, g, make_response, request
+from app.utils import metrics
+from app.utils.cache import HIT, STALE, MISS
+import time
+
+metrics_bp = Blueprint("metrics", __name__, url_prefix="/api")
+
+_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "リクエストの処理時間(レスポンスを返すまで)", ["endpoint", "method"])
+_REQUESTS = metrics.counter(
+    "http_requests_total", "リクエスト数", ["endpoint", "method", "status"])
+_RESPONSE_BYTES = metrics.histogram(
+    "http_response_bytes", "レスポンス本文のバイト数(圧縮後)", ["endpoint"], buckets=metrics.BYTES_BUCKETS)
+
+def _endpoint() -> str:
+    # パラメータを含まないルールにして、ラベルの種類が増えないようにする
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+@metrics_bp.before_app_request
+def _start_request_timer():
+    g.metrics_started = time.perf_counter()
+
+@metrics_bp.after_app_request
+def _record_request(resp):
+    started = g.pop("metrics_started", None)
+    if started is not None:
+        endpoint = _endpoint()
+        _REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        _REQUESTS.inc(endpoint=endpoint, method=request.method, status=resp.status_code)
+        if resp.content_length is not None:
+            _RESPONSE_BYTES.observe(resp.content_length, endpoint=endpoint)
+    return resp
+
+def cache_collector(cache):
+    """
+    ダッシュボードのペイロードキャッシュの参照回数・ヒット率・エントリ数を返す collector。
+    """
+    def collect():
+        counts = cache.counts()
+        total = sum(counts.values())
+        return [
+            ("dashboard_cache_requests_total", metrics.COUNTER, "ペイロードキャッシュの参照回数(結果ごと)",
+             [({"result": state}, counts[state]) for state in (HIT, STALE, MISS)]),
+            ("dashboard_cache_hit_ratio", metrics.GAUGE, "ペイロードキャッシュのヒット率 (hit / 参照回数)",
+             [({}, counts[HIT] / total if total else 0.0)]),
+            ("dashboard_cache_entries", metrics.GAUGE, "ペイロードキャッシュのエントリ数", [({}, len(cache))]),
+        ]
+    return collect
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """
+    メトリクスを Prometheus のテキスト形式で返す。
+    """
+    resp = make_response(metrics.render(), 200)
+    resp.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return resp
@@ -0,0 +1,63 @@
+from flask import Blueprint, current_app, request
+from werkzeug.exceptions import BadRequest, HTTPException, InternalServerError
+from .routes_dashboard import _finance_db_path, _json_response
+
+query_bp = Blueprint("query", __name__, url_prefix="/api")
+
+# app.utils.query は pandas を読み込む data_loader を使うので、最初に使うところで import する
+
+def _list_arg(name: str):
+    # ?name=a,b と ?name=a&name=b のどちらでも指定できる
+    return [v.strip() for value in request.args.getlist(name) for v in value.split(",") if v.strip()]
+
+def _filters_arg():
+    """
+    ?filter=列:値 を {列: [値, ...]} にする(同じ列を複数指定すると、いずれかに一致する行)。
+    """
+    filters = {}
+    for value in request.args.getlist("filter"):
+        column, sep, item = value.partition(":")
+        if not sep or not column:
+            raise BadRequest(description=f"filter must be column:value, got {value!r}")
+        filters.setdefault(column, []).append(item)
+    return filters
+
+@query_bp.route("/query", methods=["GET"])
+def query():
+    """
+    任意の集計クエリ。1本の GROUP BY クエリにして SQLite で集計した結果を列ごとに返す。
+
+    ?table=asset|balance|target
+    &measures=sum(資産額),max(トータルリターン)   集計値 (sum / avg / min / max / count、count(*) は行数)
+    &group_by=資産タイプ,資産カテゴリー          グループ化する列
+    &granularity=day|week|month|year          日付の粒度(省略時は日付でグループ化しない)
+    &from=YYYY-MM-DD&to=YYYY-MM-DD            期間
+    &filter=資産タイプ:リスク資産               絞り込み(複数指定可)
+
+    Accept: application/vnd.apache.arrow.stream を JSON より優先すると Arrow IPC ストリームで返す。
+    """
+    from app.routes.dashboard_service import parse_window
+    from app.utils.query import DEFAULT_MAX_ROWS, get_query_result, parse_query
+    try:
+        spec = parse_query(
+            request.args.get("table", ""),
+            _list_arg("measures"),
+            group_by=_list_arg("group_by"),
+            granularity=request.args.get("granularity") or None,
+            filters=_filters_arg(),
+            window=parse_window(request.args.get("from"), request.args.get("to")),
+        )
+    except ValueError as e:
+        raise BadRequest(description=str(e))
+    max_rows = (current_app.config.get("QUERY") or {}).get("max_rows", DEFAULT_MAX_ROWS)
+    try:
+        db_path = _finance_db_path()
+        return _json_response(
+            db_path, lambda cache: {"ok": True, "table": spec.table, "granularity": spec.granularity,
+                                    **get_query_result(db_path, spec, cache, max_rows)},
+            "columns_to_ipc"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise InternalServerError(description=str(e))
@@ -1,40 +1,71 @@
+// グラフのキー -> 描画先の div (差分更新で使う)
+const graphDivs = {};
+// 取得済みデータの最新日 (YYYY-MM-DD)
+let latestDate = null;
+
+// ★ 表示順を定義
+const order = [
+    "assets",
+    "general_balance",
+    "special_balance",
+    "returns",
+    "general_income_expenditure",
+    "special_income_expenditure",
+];
+
+// 日次のグラフ (ズーム時に表示範囲を取得し直す)
+const dailyGraphs = ["assets", "returns"];
+
+// 日次グラフの1トレースあたりの点数。画面の横幅 (物理ピクセル) 程度にし、
+// サーバー側のキャッシュが効くように 250 単位で切り上げる
+const maxPoints = Math.max(250, Math.ceil(window.innerWidth * (window.devicePixelRatio || 1) / 250) * 250);
+
+const graphTitles = {
+    "assets": "総資産推移",
+    "returns": "トータルリターン",
+    "general_income_expenditure": "一般収入・支出",
+    "general_balance": "一般支出",
+    "special_income_expenditure": "特別収入・支出",
+    "special_balance": "特別支出"
+};
+
 document.addEventListener("DOMContentLoaded", async () => {
     try {
-        // summary API を取得
-        const res = await fetch("/api/dashboard/summary");
+        // 表示順どおりに並ぶよう、先に枠だけ作っておく
+        const main = document.getElementById("graphs-area");
+        const slots = {};
+        order.forEach(key => {
+            slots[key] = document.createElement("div");
+            main?.appendChild(slots[key]);
+        });
+        const render = (key, figJson) => {
+            if (!figJson) return; // 存在しないキーはスキップ
+            graphDivs[key] = displaySingleGraph(figJson, graphTitles[key] || key, slots[key]);
+            if (graphDivs[key] && dailyGraphs.includes(key)) enableZoomDetail(key, graphDivs[key]);
+        };
+
+        // summary と最初のグラフを1回で取得
+        const [first, ...rest] = order;
+        const res = await fetch(`/api/dashboard/bootstrap?graph=${first}&max_points=${maxPoints}`);
         const data = await res.json();
         displaySummary(data.summary);
+        latestDate = data.summary.latest_date.replaceAll("/", "-");
+        render(first, data.graphs[first]);
 
-        // graphs
-        const gres = await fetch("/api/dashboard/graphs");
-        const gdata = await gres.json();
-
-        // ★ 表示順を定義
-        const order = [
-            "assets",
-            "general_balance",
-            "special_balance",
-            "returns",
-            "general_income_expenditure",
-            "special_income_expenditure",
-        ];
+        // 残りのグラフは個別に取得し、届いたものから描画する
+        await Promise.all(rest.map(async key => {
+            try {
+                const gres = await fetch(`/api/dashboard/graphs/${key}?max_points=${maxPoints}`);
+                const gdata = await gres.json();
+                render(key, gdata.graphs[key]);
+            } catch (err) {
+                console.error(`Failed to load graph ${key}:`, err);
+            }
+        }));
 
-        order.forEach(key => {
-            const figJson = gdata.graphs[key];
-            if (!figJson) return; // 存在しないキーはスキップ
-            let titleText = {
-                "assets": "総資産推移",
-                "returns": "トータルリターン",
-                "general_income_expenditure": "一般収入・支出",
-                "general_balance": "一般支出",
-                "special_income_expenditure": "特別収入・支出",
-                "special_balance": "特別支出"
-            }[key] || key;
-
-            //console.log(key);
-            //console.log(figJson);
-
-            displaySingleGraph(figJson, titleText);
+        // タブに戻ったときに追加分だけ取得する
+        document.addEventListener("visibilitychange", () => {
+            if (document.visibilityState === "visible") refreshGraphs();
         });
 
     } catch (err) {
@@ -42,6 +73,86 @@ document.addEventListener("DOMContentLoaded", async () => {
     }
 });
 
+// 前回取得以降に追加された点だけを取得して既存のグラフに追加する
+async function refreshGraphs() {
+    if (!latestDate) return;
+    try {
+        const res = await fetch(`/api/dashboard/graphs?since=${latestDate}`);
+        if (!res.ok) return;
+        const delta = await res.json();
+        Object.entries(delta.graphs).forEach(([key, graphDelta]) => {
+            if (!graphDivs[key]) return;
+            // 日次のグラフは間引き・ズームしているので、間引いていない差分の点を足すと max_points を超える。
+            // 表示中の範囲で取得し直す
+            if (key in graphQueries) reloadGraph(key, graphDivs[key]);
+            else applyGraphDelta(graphDivs[key], graphDelta);
+        });
+        latestDate = delta.latest_date;
+    } catch (err) {
+        console.error("Failed to refresh graphs:", err);
+    }
+}
+
+// 日次のグラフのキー -> 表示中の点を取得するクエリ (max_points と、ズーム中は from, to)
+const graphQueries = {};
+// グラフのキー -> 最後に送った取得要求の番号 (古い応答で上書きしないように)
+const latestReloads = {};
+
+// ズームしたら表示範囲の点を取得し直し (間引かれていない点になる)、ズームを戻したら全体表示に戻す
+function enableZoomDetail(key, graphDiv) {
+    graphQueries[key] = `max_points=${maxPoints}`;
+    graphDiv.on("plotly_relayout", ev => {
+        const range = ev["xaxis.range"] || [ev["xaxis.range[0]"], ev["xaxis.range[1]"]];
+        let query;
+        if (ev["xaxis.autorange"]) {
+            query = `max_points=${maxPoints}`;
+        } else if (range[0] !== undefined && range[1] !== undefined) {
+            const from = String(range[0]).slice(0, 10);
+            const to = String(range[1]).slice(0, 10);
+            query = `from=${from}&to=${to}&max_points=${maxPoints}`;
+        } else {
+            return;
+        }
+        graphQueries[key] = query;
+        reloadGraph(key, graphDiv);
+    });
+}
+
+// graphQueries のクエリでグラフの点を取得し直して置き換える
+async function reloadGraph(key, graphDiv) {
+    const requestId = latestReloads[key] = (latestReloads[key] || 0) + 1;
+    try {
+        const res = await fetch(`/api/dashboard/graphs/${key}?${graphQueries[key]}`);
+        if (!res.ok || requestId !== latestReloads[key]) return;
+        const fig = (await res.json()).graphs[key];
+        // restyle は軸の範囲を変えない
+        Plotly.restyle(graphDiv, { x: fig.data.map(t => t.x), y: fig.data.map(t => t.y) });
+    } catch (err) {
+        console.error(`Failed to load graph ${key}:`, err);
+    }
+}
+
+// replace_from 以降の点を取り除いてから、差分の点を uid が一致するトレースに追加する (間引いていないグラフ用)
+function applyGraphDelta(graphDiv, graphDelta) {
+    const indices = [];
+    const xs = [];
+    const ys = [];
+    graphDelta.traces.forEach(trace => {
+        const i = graphDiv.data.findIndex(t => t.uid === trace.uid);
+        if (i < 0) return;
+        const current = graphDiv.data[i];
+        const cut = Array.from(current.x).findIndex(x => x >= graphDelta.replace_from);
+        if (cut >= 0) {
+            current.x = Array.from(current.x).slice(0, cut);
+            current.y = Array.from(current.y).slice(0, cut);
+        }
+        indices.push(i);
+        xs.push(trace.x);
+        ys.push(trace.y);
+    });
+    if (indices.length) Plotly.extendTraces(graphDiv, { x: xs, y: ys }, indices);
+}
+
 // サイドバー下に summary を表示
 function displaySummary(summary) {
     const sidebar = document.querySelector(".sidebar");
@@ -66,11 +177,25 @@ function displaySummary(summary) {
             <div>目標資産:</div><div>${summary.total_target_assets.toLocaleString()} 円</div>
             <div>総リターン:</div><div>${summary.total_returns.toLocaleString()} 円</div>
             <div>目標リターン:</div><div>${summary.total_target_returns.toLocaleString()} 円</div>
+            ${formatChanges(summary.changes)}
         </div>
     `;
 }
 
-function displaySingleGraph(figJson, titleText) {
+// 前日比・前週比・前月比 (総資産)
+function formatChanges(changes) {
+    if (!changes) return "";
+    const labels = { "1d": "前日比", "1w": "前週比", "1m": "前月比" };
+    return Object.entries(labels).map(([key, label]) => {
+        const change = changes[key];
+        if (!change) return "";
+        const sign = change.total_assets > 0 ? "+" : "";
+        return `<div>${label}:</div><div>${sign}${change.total_assets.toLocaleString()} 円</div>`;
+    }).join("");
+}
+
+// slot を指定した場合はその位置に描画する (slot は置き換える)
+function displaySingleGraph(figJson, titleText, slot) {
     const main = document.getElementById("graphs-area");
     if (!main || !figJson) return;
 
@@ -91,7 +216,11 @@ function displaySingleGraph(figJson, titleText) {
     const graphDiv = document.createElement("div");
     wrap.appendChild(graphDiv);
 
-    main.appendChild(wrap);
+    if (slot) {
+        slot.replaceWith(wrap);
+    } else {
+        main.appendChild(wrap);
+    }
 
     const fig = typeof figJson === "string" ? JSON.parse(figJson) : figJson;
 
@@ -169,4 +298,6 @@ function displaySingleGraph(figJson, titleText) {
         Plotly.Plots.resize(graphDiv);
         resetFonts();
     });
+
+    return graphDiv;
 }
\ No newline at end of file
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+グラフ・集計結果の Arrow IPC ストリーム形式 (application/vnd.apache.arrow.stream) での書き出し。
+
+Accept で Arrow を JSON より優先したリクエストに、JSON の代わりに返す(routes_dashboard._json_response)。
+数値の列は NumPy 配列から Arrow の配列をコピーせずに作るので、長い時系列でも 10 進数の文字列にしない。
+
+- グラフ (graphs_to_ipc): 列は graph, uid(辞書型), x(date32), y(float64)。トレースごとに1つのレコードバッチ。
+  x, y 以外の内容(レイアウト、トレース名、サマリなど)は JSON にしてスキーマのメタデータ "payload" に入れる。
+- 集計結果 (columns_to_ipc): app.utils.query の結果の列をそのまま Arrow の列にする。日付の列は date32。
+  "data" 以外の内容はメタデータ "payload" に入れる。
+
+pyarrow が無い環境では available() が False になり、JSON だけを返す。
+
+    import pyarrow as pa
+    table = pa.ipc.open_stream(body).read_all()
+    meta = json.loads(table.schema.metadata[b"payload"])
+"""
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.utils.json_provider import dumps_bytes
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pyarrow が無い環境では JSON のみ
+    pa = pc = None
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+# スキーマのメタデータで x, y 以外の内容を入れるキー
+PAYLOAD_METADATA = b"payload"
+
+def available() -> bool:
+    return pa is not None
+
+def _date_array(values):
+    """
+    "YYYY-MM-DD" / "YYYY-MM" の文字列を date32 にする("YYYY-MM" は月初日)。日付でない場合は文字列のまま。
+    """
+    arr = np.asarray(values)
+    if arr.size == 0:
+        return pa.array([], type=pa.date32())
+    if arr.dtype.kind not in "UO":
+        return pa.array(arr)
+    # 日付の解釈は NumPy の datetime64 より Arrow の cast の方が速い
+    strings = pa.array(arr, type=pa.string())
+    try:
+        return strings.cast(pa.date32())
+    except pa.ArrowInvalid:
+        pass
+    try:
+        return pc.binary_join_element_wise(strings, "-01", "").cast(pa.date32())
+    except pa.ArrowInvalid:
+        return strings
+
+def _float_array(values):
+    # float64 の NumPy 配列はバッファをそのまま使う(コピーしない)
+    return pa.array(np.asarray(values, dtype=np.float64), type=pa.float64())
+
+def _stream(schema, batches) -> bytes:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+def _traces(graph: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # 全体のグラフは {"data": [...], "layout"}、差分は {"replace_from", "traces": [...]}
+    return graph.get("data", graph.get("traces", []))
+
+def _without_values(graph: Dict[str, Any]) -> Dict[str, Any]:
+    # メタデータに入れるグラフ(トレースの x, y を除く)
+    key = "data" if "data" in graph else "traces"
+    return {**graph, key: [{k: v for k, v in trace.items() if k not in ("x", "y")} for trace in _traces(graph)]}
+
+def graphs_to_ipc(payload: Dict[str, Any]) -> bytes:
+    """
+    グラフのペイロード(/graphs, /graphs/<id>, /bootstrap, ?since= の差分)を Arrow IPC ストリームにする。
+    """
+    graphs = payload.get("graphs") or {}
+    graph_ids = list(graphs)
+    uids = [trace["uid"] for graph in graphs.values() for trace in _traces(graph)]
+    # 辞書はストリーム全体で共通にして、バッチごとに辞書を送り直さないようにする
+    graph_dictionary = pa.array(graph_ids, type=pa.string())
+    uid_dictionary = pa.array(uids, type=pa.string())
+    dictionary_type = pa.dictionary(pa.int32(), pa.string())
+    schema = pa.schema(
+        [("graph", dictionary_type), ("uid", dictionary_type), ("x", pa.date32()), ("y", pa.float64())],
+        metadata={PAYLOAD_METADATA: dumps_bytes({
+            **payload, "graphs": {graph_id: _without_values(graph) for graph_id, graph in graphs.items()},
+        })},
+    )
+
+    batches = []
+    trace_index = 0
+    # 同じグラフのトレースは x を共有しているので、日付の変換は x ごとに1回だけ行う
+    dates = {}
+    for graph_index, graph in enumerate(graphs.values()):
+        for trace in _traces(graph):
+            n = len(trace["x"])
+            x = dates.get(id(trace["x"]))
+            if x is None:
+                x = dates[id(trace["x"])] = _date_array(trace["x"])
+            batches.append(pa.record_batch([
+                pa.DictionaryArray.from_arrays(pa.array(np.full(n, graph_index, dtype=np.int32)), graph_dictionary),
+                pa.DictionaryArray.from_arrays(pa.array(np.full(n, trace_index, dtype=np.int32)), uid_dictionary),
+                x,
+                _float_array(trace["y"]),
+            ], schema=schema))
+            trace_index += 1
+    return _stream(schema, batches)
+
+def columns_to_ipc(payload: Dict[str, Any], date_columns=("date",)) -> bytes:
+    """
+    列ごとの値 {"columns": [...], "data": {列名: 値のリスト}} を持つペイロードを Arrow IPC ストリームにする。
+    """
+    arrays = [
+        _date_array(payload["data"][name]) if name in date_columns else pa.array(payload["data"][name])
+        for name in payload["columns"]
+    ]
+    metadata = {PAYLOAD_METADATA: dumps_bytes({k: v for k, v in payload.items() if k != "data"})}
+    batch = pa.record_batch(arrays, names=payload["columns"]).replace_schema_metadata(metadata)
+    return _stream(batch.schema, [batch])
@@ -0,0 +1,140 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# キャッシュ参照結果の状態
+HIT = "hit"
+STALE = "stale"
+MISS = "miss"
+
+class PayloadCache:
+    """
+    データバージョンをキーにしたプロセス内の LRU キャッシュ。
+
+    エントリは (バージョン, 値) で保持し、参照時のバージョンと一致すれば HIT、
+    一致しない場合は stale_while_revalidate が有効なら STALE として古い値を返す。
+
+    Args:
+        max_entries (int): 保持するエントリの上限。超えた分は古いものから破棄する。
+        stale_while_revalidate (bool): バージョン不一致時に古い値を返しつつ
+                                       バックグラウンドで再計算するかどうか。
+    """
+    def __init__(self, max_entries: int = 64, stale_while_revalidate: bool = False):
+        if max_entries < 1:
+            raise ValueError(f"max_entries must be >= 1, got {max_entries}")
+        self.max_entries = max_entries
+        self.stale_while_revalidate = stale_while_revalidate
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._local = threading.local()
+        self._counts = {HIT: 0, STALE: 0, MISS: 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, version) -> Tuple[Any, str]:
+        """
+        キャッシュを参照する。
+
+        Returns:
+            tuple: (値, 状態)。状態は HIT / STALE / MISS のいずれか。MISS の場合の値は None。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                value, state = None, MISS
+            else:
+                self._entries.move_to_end(key)
+                if entry[0] == version:
+                    value, state = entry[1], HIT
+                elif self.stale_while_revalidate:
+                    value, state = entry[1], STALE
+                else:
+                    value, state = None, MISS
+            self._counts[state] += 1
+        self.mark(state)
+        return value, state
+
+    def mark(self, state: str) -> None:
+        """
+        キャッシュ以外から得た値の状態を track() に記録する(古いデータから作った値を使った場合は STALE)。
+        """
+        for states in getattr(self._local, "tracking", ()):
+            states.add(state)
+
+    def counts(self) -> Dict[str, int]:
+        """
+        これまでの get の状態 (HIT / STALE / MISS) ごとの回数。
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    @contextmanager
+    def track(self):
+        """
+        ブロック内でこのスレッドが get で得た状態 (HIT / STALE / MISS) の集合を返す。
+        キャッシュした値から作った値が古い値を含むかどうかの判定に使う。
+
+            with cache.track() as states:
+                payload = build(cache)
+            if STALE not in states:
+                ...
+        """
+        if not hasattr(self._local, "tracking"):
+            self._local.tracking = []
+        states = set()
+        self._local.tracking.append(states)
+        try:
+            yield states
+        finally:
+            self._local.tracking.pop()
+
+    def set(self, key: Hashable, version, value) -> None:
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, predicate: Optional[Callable[[Hashable], bool]] = None) -> None:
+        """
+        エントリを無効化する。
+
+        stale_while_revalidate が有効な場合は値を残してバージョンだけ落とし、
+        次回参照時に STALE として扱う。無効な場合はエントリを削除する。
+
+        Args:
+            predicate (callable, optional): 対象キーを選ぶ関数。None の場合は全エントリ。
+        """
+        with self._lock:
+            keys = [k for k in self._entries if predicate is None or predicate(k)]
+            for k in keys:
+                if self.stale_while_revalidate:
+                    self._entries[k] = (None, self._entries[k][1])
+                else:
+                    del self._entries[k]
+
+    def refresh_async(self, token: Hashable, refresh: Callable[[], None]) -> bool:
+        """
+        バックグラウンドスレッドで refresh を実行する。同じ token の再計算が
+        実行中であれば何もしない。
+
+        Returns:
+            bool: 新たにスレッドを起動した場合 True。
+        """
+        with self._lock:
+            if token in self._refreshing:
+                return False
+            self._refreshing.add(token)
+
+        def run():
+            try:
+                refresh()
+            finally:
+                with self._lock:
+                    self._refreshing.discard(token)
+
+        threading.Thread(target=run, name="payload-cache-refresh", daemon=True).start()
+        return True
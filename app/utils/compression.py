@@ -0,0 +1,73 @@
+"""
+レスポンス本文の圧縮(Content-Encoding)。
+
+本文は EncodedBody で一度だけ圧縮してキャッシュに保存し、リクエストごとに
+Accept-Encoding から選んだ圧縮済みの本文を返す。zstd は zstandard がある場合のみ使う。
+"""
+import gzip
+from typing import Dict, List
+
+try:
+    import zstandard
+except ImportError:  # zstandard が無い環境では gzip のみ
+    zstandard = None
+
+IDENTITY = "identity"
+GZIP = "gzip"
+ZSTD = "zstd"
+
+# これより小さい本文は圧縮しない
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+def available_encodings() -> List[str]:
+    """
+    使える圧縮方式を優先順に返す。
+    """
+    return [ZSTD, GZIP] if zstandard is not None else [GZIP]
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == GZIP:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == ZSTD and zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    raise ValueError(f"Unsupported encoding: {encoding!r}")
+
+def choose_encoding(accept_encodings, encodings: List[str] = None) -> str:
+    """
+    Accept-Encoding (werkzeug の Accept) から使う圧縮方式を選ぶ。
+    q 値が最も高いものを、同じ場合は encodings の順で選ぶ。どれも受け付けない場合は identity。
+    """
+    best, best_quality = IDENTITY, 0
+    for encoding in encodings if encodings is not None else available_encodings():
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+class EncodedBody:
+    """
+    レスポンス本文と、圧縮方式ごとの圧縮済み本文。
+
+    Args:
+        body (bytes): 圧縮前の本文
+        encodings (list, optional): 事前に圧縮しておく方式。None の場合は available_encodings()。
+        min_size (int): これより小さい本文は圧縮しない
+    """
+    def __init__(self, body: bytes, encodings: List[str] = None, min_size: int = MIN_COMPRESS_SIZE):
+        self.bodies: Dict[str, bytes] = {IDENTITY: body}
+        if len(body) >= min_size:
+            for encoding in encodings if encodings is not None else available_encodings():
+                self.bodies[encoding] = compress(body, encoding)
+
+    def get(self, encoding: str):
+        """
+        encoding の本文を返す。圧縮していない場合は identity の本文を返す。
+
+        Returns:
+            tuple: (実際の Content-Encoding, 本文)
+        """
+        if encoding in self.bodies:
+            return encoding, self.bodies[encoding]
+        return IDENTITY, self.bodies[IDENTITY]
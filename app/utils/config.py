@@ -16,6 +16,18 @@ def load_settings(path="setting.yaml"):
         settings = yaml.safe_load(f)
     return settings
 
+def finance_db_path(config) -> str:
+    """
+    設定 (app.config) の finance.db のパスを返す。
+
+    Args:
+        config (dict): app.config
+
+    Returns:
+        str: DATABASE_PATH と DATABASE.finance をつないだパス。
+    """
+    return os.path.join(config["DATABASE_PATH"], config["DATABASE"]["finance"])
+
 if __name__ == '__main__':
     # Test the function
     base_dir = os.path.dirname(os.path.abspath(__file__))
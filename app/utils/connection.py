@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite 接続の管理(プロセス内で共有)。
+
+- 読み込み: 読み取り専用 (mode=ro) の URI 接続をプールして使い回す。
+  接続ごとの PRAGMA 設定は接続を開いたときに1回だけ行う。
+- 書き込み: DB ごとに1本の書き込み用接続を使い、ロックで直列化する。
+- ジャーナルは WAL にして、書き込み中も読み込みがブロックされないようにする。
+
+開発サーバーはリクエストごとにスレッドを作るので、スレッドローカルではなくプールで使い回す。
+DB ファイルが作り直された場合(inode が変わった場合)は開き直す。
+"""
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 接続を開いたときに設定する PRAGMA(configure で上書きできる)
+DEFAULT_PRAGMAS = {
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # 負の値は KiB 単位 (64 MiB)
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+# プールに残しておく読み込み用接続の数(DB ごと)
+DEFAULT_MAX_IDLE_READERS = 8
+
+_settings = {"pragmas": dict(DEFAULT_PRAGMAS), "max_idle_readers": DEFAULT_MAX_IDLE_READERS}
+_lock = threading.Lock()
+_readers: Dict[str, List[Tuple[Tuple[int, int], sqlite3.Connection]]] = {}
+_writers: Dict[str, "_Writer"] = {}
+
+class _Writer:
+    def __init__(self, conn: sqlite3.Connection, identity: Tuple[int, int]):
+        self.conn = conn
+        self.identity = identity
+        self.lock = threading.RLock()
+
+def configure(pragmas: Optional[Dict] = None, max_idle_readers: Optional[int] = None) -> None:
+    """
+    接続の設定を変更する(create_app から setting.yaml の sqlite セクションで呼ぶ)。
+    省略した項目は既定値に戻す。開いている接続は閉じ、次回から新しい設定で開く。
+
+    Args:
+        pragmas (dict, optional): DEFAULT_PRAGMAS を上書きする PRAGMA
+        max_idle_readers (int, optional): プールに残す読み込み用接続の数
+    """
+    for name in (pragmas or {}):
+        if not str(name).isidentifier():
+            raise ValueError(f"Invalid pragma: {name!r}")
+    close_connections()
+    with _lock:
+        _settings["pragmas"] = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        _settings["max_idle_readers"] = DEFAULT_MAX_IDLE_READERS if max_idle_readers is None else max_idle_readers
+
+def _key(db_path: str) -> str:
+    return os.path.abspath(db_path)
+
+def _identity(db_path: str) -> Tuple[int, int]:
+    st = os.stat(db_path)
+    return st.st_dev, st.st_ino
+
+def _apply_pragmas(conn: sqlite3.Connection) -> None:
+    for name, value in _settings["pragmas"].items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+def _open_reader(db_path: str) -> sqlite3.Connection:
+    uri = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    _apply_pragmas(conn)
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+def _open_writer(db_path: str) -> sqlite3.Connection:
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"DBファイルが存在しません: {db_path}")
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    _apply_pragmas(conn)
+    mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    if mode.lower() != "wal":
+        logger.warning(f"{db_path}: journal_mode を WAL にできませんでした ({mode})")
+    # WAL では NORMAL でもコミット済みのデータは壊れない(電源断時に直近のコミットが失われうるだけ)
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+@contextmanager
+def read_connection(db_path: str):
+    """
+    読み込み用の接続をプールから借りる。ブロックを抜けるとプールに戻す。
+
+        with read_connection(db_path) as conn:
+            conn.execute("SELECT ...")
+
+    Raises:
+        sqlite3.OperationalError: DB ファイルを開けない場合
+    """
+    key = _key(db_path)
+    try:
+        identity = _identity(db_path)
+    except FileNotFoundError:
+        raise sqlite3.OperationalError(f"unable to open database file: {db_path}")
+
+    conn = None
+    stale = []
+    with _lock:
+        pool = _readers.get(key, [])
+        while pool:
+            conn_identity, pooled = pool.pop()
+            if conn_identity == identity:
+                conn = pooled
+                break
+            stale.append(pooled)
+    for old in stale:
+        old.close()
+    if conn is None:
+        conn = _open_reader(db_path)
+
+    try:
+        yield conn
+    except Exception:
+        conn.close()
+        raise
+    with _lock:
+        pool = _readers.setdefault(key, [])
+        if len(pool) < _settings["max_idle_readers"]:
+            pool.append((identity, conn))
+            conn = None
+    if conn is not None:
+        conn.close()
+
+@contextmanager
+def write_connection(db_path: str):
+    """
+    書き込み用の接続を排他的に使う。正常に抜けるとコミット、例外時はロールバックする。
+
+        with write_connection(db_path) as conn:
+            df.to_sql(table_name, conn, if_exists="append", index=False)
+
+    Raises:
+        FileNotFoundError: DB ファイルが存在しない場合
+    """
+    key = _key(db_path)
+    with _lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = _Writer(None, None)
+    with writer.lock:
+        identity = _identity(db_path) if os.path.exists(db_path) else None
+        if writer.conn is None or writer.identity != identity:
+            if writer.conn is not None:
+                writer.conn.close()
+            writer.conn = _open_writer(db_path)
+            writer.identity = _identity(db_path)
+        try:
+            yield writer.conn
+            writer.conn.commit()
+        except Exception:
+            writer.conn.rollback()
+            raise
+
+def close_connections(db_path: Optional[str] = None) -> None:
+    """
+    プールの読み込み用接続と書き込み用接続を閉じる。DB ファイルを削除・置換する前に呼ぶ。
+
+    Args:
+        db_path (str, optional): 対象の DB。None の場合はすべて。
+    """
+    keys = None if db_path is None else {_key(db_path)}
+    with _lock:
+        readers = [(k, _readers.pop(k)) for k in list(_readers) if keys is None or k in keys]
+        writers = [(k, _writers.pop(k)) for k in list(_writers) if keys is None or k in keys]
+    for _, pool in readers:
+        for _, conn in pool:
+            conn.close()
+    for _, writer in writers:
+        with writer.lock:
+            if writer.conn is not None:
+                writer.conn.close()
+                writer.conn = None
@@ -1,21 +1,257 @@
 import pandas as pd
 import sqlite3
 import os
+import threading
+import time
+from datetime import datetime, timezone
 from typing import Union, List
 from pathlib import Path
+from werkzeug.exceptions import InternalServerError
+from app.utils import metrics
+from app.utils.connection import read_connection, write_connection
 
 # DBアクセスは with 文を使うことにします
 # 1. commit/rollback/close を自動化して安全
 # 2. コードが短く、読みやすい
 # 3. 例外発生時も DB が壊れない
+# 接続は app.utils.connection の read_connection / write_connection で使い回す
+
+# get_df_from_db のクエリの実行と取得にかかった時間
+_DB_READ_SECONDS = metrics.histogram(
+    "db_read_duration_seconds", "SQLite からの読み込み (get_df_from_db) の所要時間", ["table"])
+
+# --- データバージョン管理 ---
+# append_to_table で書き込むたびにカウンタを進め、ファイルの mtime/size と組み合わせて
+# キャッシュのキーに使う。別プロセスからの更新もファイル属性の変化で検知できる。
+# WAL モードではコミットは -wal ファイルに書かれるので、-wal の mtime/size も含める。
+_data_version_counters = {}
+_data_version_lock = threading.Lock()
+
+def bump_data_version(db_path: str) -> int:
+    """
+    指定DBのデータバージョンカウンタを進める。
+
+    Args:
+        db_path (str): SQLite データベースのパス
+
+    Returns:
+        int: 更新後のカウンタ値
+    """
+    key = os.path.abspath(db_path)
+    with _data_version_lock:
+        _data_version_counters[key] = _data_version_counters.get(key, 0) + 1
+        return _data_version_counters[key]
+
+def get_file_version(db_path: str) -> str:
+    """
+    指定DBのファイル属性だけから作るバージョン。プロセスをまたいで比較できる(ディスクに保存した結果の照合用)。
+
+    Args:
+        db_path (str): SQLite データベースのパス
+
+    Returns:
+        str: "<mtime_ns>-<size>-<wal の mtime_ns>-<wal の size>" 形式のトークン。無いファイルの mtime_ns, size は 0
+    """
+    parts = []
+    for path in (db_path, f"{db_path}-wal"):
+        try:
+            st = os.stat(path)
+            parts += [str(st.st_mtime_ns), str(st.st_size)]
+        except FileNotFoundError:
+            parts += ["0", "0"]
+    return "-".join(parts)
+
+def get_data_version(db_path: str) -> str:
+    """
+    指定DBの現在のデータバージョンを表すトークンを返す。
+
+    Args:
+        db_path (str): SQLite データベースのパス
+
+    Returns:
+        str: "<カウンタ>-<get_file_version>" 形式のトークン
+    """
+    key = os.path.abspath(db_path)
+    with _data_version_lock:
+        counter = _data_version_counters.get(key, 0)
+    return f"{counter}-{get_file_version(db_path)}"
+
+# SQLite で集計できる関数と、その結果をさらに pandas で集約し直すときの関数
+# (日付表記の揺れで同じ日付が複数グループになった場合に備えて再集計する)
+SQL_AGGFUNCS = {"sum": "SUM", "min": "MIN", "max": "MAX", "count": "COUNT"}
+_REAGGFUNCS = {"sum": "sum", "min": "min", "max": "max", "count": "sum"}
+
+# filters で使える比較演算子
+_FILTER_OPERATORS = {"=", "!=", "<", "<=", ">", ">=", "between", "range"}
+
+def quote_identifier(name: str) -> str:
+    """
+    SQLite の識別子(テーブル名・列名)をダブルクォートで囲んでエスケープする。
+    """
+    if not isinstance(name, str) or not name:
+        raise ValueError(f"Invalid identifier: {name!r}")
+    return '"' + name.replace('"', '""') + '"'
+
+def _to_sql_param(value):
+    # 日付は文字列として比較する。時刻が 0:00 の場合は "YYYY-MM-DD" にすることで、
+    # "YYYY-MM-DD" と "YYYY-MM-DD HH:MM:SS" のどちらで格納された行も >= / < で正しく比較できる
+    if hasattr(value, "isoformat") and not isinstance(value, str):
+        ts = pd.Timestamp(value)
+        if ts == ts.normalize():
+            return ts.strftime("%Y-%m-%d")
+        return ts.strftime("%Y-%m-%d %H:%M:%S")
+    if hasattr(value, "item"):
+        # NumPy のスカラー
+        return value.item()
+    return value
+
+def build_where_clause(filters=None, where_clause=None):
+    """
+    filters 辞書からパラメータ化した WHERE 句を組み立てる。
+
+    Args:
+        filters (dict, optional): {列名: 条件}。条件は次のいずれか。
+            - スカラー値: 列 = 値
+            - list / set: 列 IN (...)
+            - tuple: (演算子, 値) または ("between", 下限, 上限)。演算子は =, !=, <, <=, >, >=
+              ("range", 下限, 上限) は 下限 <= 列 < 上限。日付の範囲指定にはこちらを使う
+        where_clause (str, optional): 追加で AND 結合する生の WHERE 句(後方互換用)。
+
+    Returns:
+        tuple: (" WHERE ..." 形式の文字列(条件が無ければ空文字), パラメータのリスト)
+    """
+    conditions = []
+    params = []
+    for col, cond in (filters or {}).items():
+        column = quote_identifier(col)
+        if isinstance(cond, (list, set, frozenset)):
+            values = list(cond)
+            if not values:
+                # 空の IN は常に偽
+                conditions.append("0")
+                continue
+            conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(_to_sql_param(v) for v in values)
+        elif isinstance(cond, tuple):
+            op = cond[0]
+            if op not in _FILTER_OPERATORS:
+                raise ValueError(f"Unsupported filter operator for {col}: {op!r}")
+            if op in ("between", "range"):
+                if len(cond) != 3:
+                    raise ValueError(f"'{op}' filter for {col} needs ({op!r}, low, high)")
+                if op == "between":
+                    conditions.append(f"{column} BETWEEN ? AND ?")
+                else:
+                    conditions.append(f"{column} >= ? AND {column} < ?")
+                params.extend([_to_sql_param(cond[1]), _to_sql_param(cond[2])])
+            else:
+                if len(cond) != 2:
+                    raise ValueError(f"Filter for {col} needs (operator, value)")
+                conditions.append(f"{column} {op} ?")
+                params.append(_to_sql_param(cond[1]))
+        elif cond is None:
+            conditions.append(f"{column} IS NULL")
+        else:
+            conditions.append(f"{column} = ?")
+            params.append(_to_sql_param(cond))
+    if where_clause:
+        conditions.append(f"({where_clause})")
+    if not conditions:
+        return "", params
+    return " WHERE " + " AND ".join(conditions), params
+
+def build_aggregate_query(table_name: str, group_keys: List[str], values: List[str],
+                          aggfunc: str = "sum", filters=None, where_clause=None):
+    """
+    SELECT <group_keys>, <AGG(values)> FROM table WHERE ... GROUP BY <group_keys> を組み立てる。
+
+    Returns:
+        tuple: (SQL文字列, パラメータのリスト)
+    """
+    if aggfunc not in SQL_AGGFUNCS:
+        raise ValueError(f"SQLite では集計できない関数です: {aggfunc}")
+    func = SQL_AGGFUNCS[aggfunc]
+    keys = ", ".join(quote_identifier(k) for k in group_keys)
+    aggs = ", ".join(f"{func}({quote_identifier(v)}) AS {quote_identifier(v)}" for v in values)
+    where, params = build_where_clause(filters, where_clause)
+    query = f"SELECT {keys}, {aggs} FROM {quote_identifier(table_name)}{where} GROUP BY {keys}"
+    return query, params
+
+def get_last_modified(db_path: str):
+    """
+    指定DBの最終更新日時(UTC)を返す。-wal ファイルがあればその更新日時も考慮する。
+    ファイルが無い場合は None。
+
+    Args:
+        db_path (str): SQLite データベースのパス
+
+    Returns:
+        datetime or None: 最終更新日時
+    """
+    try:
+        mtime = os.stat(db_path).st_mtime
+    except FileNotFoundError:
+        return None
+    try:
+        mtime = max(mtime, os.stat(f"{db_path}-wal").st_mtime)
+    except FileNotFoundError:
+        pass
+    return datetime.fromtimestamp(int(mtime), tz=timezone.utc)
+
+def get_latest_date(db_path: str, table_name: str, date_col: str = "date", filters=None):
+    """
+    MAX(date_col) を日付(時刻は切り捨て)で返す。date_col に索引があれば索引の端を読むだけで済む。
+
+    Args:
+        db_path (str): SQLiteデータベースのパス。
+        table_name (str): テーブル名。
+        date_col (str, optional): 日付列名。デフォルトは"date"。
+        filters (dict, optional): パラメータ化したフィルタ条件。書式は build_where_clause を参照。
+
+    Returns:
+        pd.Timestamp or None: 最新日。該当行が無い場合は None。
+    """
+    where, params = build_where_clause(filters)
+    query = f"SELECT MAX({quote_identifier(date_col)}) FROM {quote_identifier(table_name)}{where}"
+    with read_connection(db_path) as conn:
+        value = conn.execute(query, params).fetchone()[0]
+    if value is None:
+        return None
+    return pd.Timestamp(value).normalize()
+
+def get_totals(db_path: str, table_name: str, values_col, filters=None):
+    """
+    条件に合う行の values_col の合計を1回のクエリで返す(DataFrame を作らない軽量版)。
+
+    Args:
+        db_path (str): SQLiteデータベースのパス。
+        table_name (str): テーブル名。
+        values_col (str or list): 合計する列名。
+        filters (dict, optional): パラメータ化したフィルタ条件。書式は build_where_clause を参照。
+
+    Returns:
+        dict or None: {列名: 合計}。該当行が無い場合は None。
+    """
+    values = [values_col] if isinstance(values_col, str) else list(values_col)
+    sums = ", ".join(f"TOTAL({quote_identifier(v)})" for v in values)
+    where, params = build_where_clause(filters)
+    query = f"SELECT COUNT(*), {sums} FROM {quote_identifier(table_name)}{where}"
+    with read_connection(db_path) as conn:
+        row = conn.execute(query, params).fetchone()
+    if not row[0]:
+        return None
+    return dict(zip(values, row[1:]))
 
 def get_df_from_db(
     db_path: str, table_name: str, index_col: str, columns_col, values_col,
-    aggfunc="sum", where_clause=None, set_index: bool=False
+    aggfunc="sum", where_clause=None, set_index: bool=False, filters=None, pushdown: bool=True
 ):
     """
     指定されたデータベースからデータを読み込み、DataFrameを返す。
 
+    集計関数が SQLite で実行できるもの(sum, min, max, count)であれば、
+    必要な列だけを GROUP BY で集計した状態で読み込む。それ以外は必要な列を読み込んで pandas で集計する。
+
     Args:
         db_path (str): SQLiteデータベースのパス。
         table_name (str): データを取得するテーブル名。
@@ -25,35 +261,42 @@ def get_df_from_db(
         values_col (str or list): 集計対象の列名。
         aggfunc (str, optional): 集計関数。デフォルトは"sum"。
         where_clause (str, optional): データをフィルタリングするためのWHERE句。デフォルトはNone。
+                                      新しいコードでは filters を使うこと。
         set_index (bool, optional): index_col をDataFrameのインデックスとして設定するかどうか。デフォルトはFalse。
+        filters (dict, optional): パラメータ化したフィルタ条件。書式は build_where_clause を参照。
+        pushdown (bool, optional): 集計を SQLite 側で行うかどうか。デフォルトはTrue。
 
     Returns:
         pd.DataFrame: 処理されたDataFrame。
     """
-    query = f'SELECT * FROM "{table_name}"'
-    if where_clause:
-        query += f" WHERE {where_clause}"
+    group_keys = [index_col] + ([] if columns_col is None else
+                                [columns_col] if isinstance(columns_col, str) else list(columns_col))
+    values = [values_col] if isinstance(values_col, str) else list(values_col)
+
+    use_sql = pushdown and isinstance(aggfunc, str) and aggfunc in SQL_AGGFUNCS
+    if use_sql:
+        query, params = build_aggregate_query(table_name, group_keys, values, aggfunc, filters, where_clause)
+    else:
+        columns = ", ".join(quote_identifier(c) for c in dict.fromkeys(group_keys + values))
+        where, params = build_where_clause(filters, where_clause)
+        query = f"SELECT {columns} FROM {quote_identifier(table_name)}{where}"
     # --- with を使って接続管理 ---
-    with sqlite3.connect(db_path) as conn:
-        df = pd.read_sql_query(query, conn)
+    start = time.perf_counter()
+    with read_connection(db_path) as conn:
+        df = pd.read_sql_query(query, conn, params=params)
+    _DB_READ_SECONDS.observe(time.perf_counter() - start, table=table_name)
 
     # --- 日付列があれば変換 ---
+    # "YYYY-MM-DD" と "YYYY-MM-DD HH:MM:SS" が混在しても NaT にならないよう ISO8601 として解釈する
     if isinstance(index_col, str):
         if any(key in index_col.lower() for key in ["date", "日", "年月", "timestamp"]):
-            df[index_col] = pd.to_datetime(df[index_col], errors="coerce")
-
-    # --- 列の指定がない場合のデフォルト動作 ---
-    if columns_col is None:
-        # index_col でグループ化して values_col を集計
-        values = [values_col] if isinstance(values_col, str) else values_col
-        grouped = df.groupby(index_col, as_index=False)[values].agg(aggfunc)
-        return grouped.set_index(index_col) if set_index else grouped
-
-    # --- 通常のgroupby処理 ---
-    group_keys = [index_col] + ([columns_col] if isinstance(columns_col, str) else columns_col)
-    values = [values_col] if isinstance(values_col, str) else values_col
+            df[index_col] = pd.to_datetime(df[index_col], errors="coerce", format="ISO8601")
 
-    grouped = df.groupby(group_keys, as_index=False)[values].agg(aggfunc)
+    # --- groupby処理 ---
+    # SQL で集計済みの場合も、日付変換後のキーで集約し直して並び順と型を pandas の結果に揃える
+    func = _REAGGFUNCS[aggfunc] if use_sql else aggfunc
+    keys = group_keys[0] if columns_col is None else group_keys
+    grouped = df.groupby(keys, as_index=False)[values].agg(func)
 
     return grouped.set_index(index_col) if set_index else grouped
 
@@ -82,9 +325,10 @@ def append_to_table(db_path: str, df: pd.DataFrame, table_name: str) -> int:
 
     # --- DB接続、withで管理 ---
     try:
-        with sqlite3.connect(db_path) as conn:
+        with write_connection(db_path) as conn:
             df.to_sql(table_name, conn, if_exists="append", index=False)
-            return len(df)
+        bump_data_version(db_path)
+        return len(df)
     except Exception as e:
         raise InternalServerError(f"DB追加に失敗しました: {e}")
 
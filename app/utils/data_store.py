@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+ダッシュボード用の集計済みデータをプロセス内に常駐させるストア。
+
+- register した DB について、asset・target の日次合計と balance の日付×収支タイプ×収支カテゴリー合計を
+  一度だけ読み込み、NumPy の列(DatetimeIndex と float64)で保持する(Snapshot)。
+- Snapshot は読み込み開始時のデータバージョン付き。参照時にバージョン(ファイル属性のみで判定し、
+  SQL は実行しない)が変わっていれば読み込み直す。アップロードの取り込み後は refresh で入れ替える。
+- 入れ替えは参照の差し替えだけなので、リクエストは常にどちらか一方の Snapshot を丸ごと使う。
+
+register していない DB では snapshot() が None を返し、呼び出し側は SQLite から直接読む。
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.utils import metrics
+from app.utils.data_loader import get_data_version, get_df_from_db
+from app.utils.executor import gather, IO
+from app.utils.rollups import rollup_table
+
+logger = logging.getLogger(__name__)
+
+DAILY_VALUES = ["資産額", "トータルリターン"]
+BALANCE_GROUPS = ["収支タイプ", "収支カテゴリー"]
+BALANCE_VALUES = ["金額", "目標"]
+
+def table_reads(db_path: str, filters: Optional[Dict] = None,
+                balance_filters: Optional[Dict] = None) -> List[Callable[[], pd.DataFrame]]:
+    """
+    asset, balance, target の集計を SQLite から読む関数(互いに独立なので並行して実行できる)。
+    ロールアップテーブルがあればそちらを読む。
+
+    Args:
+        db_path (str): SQLite データベースのパス
+        filters (dict, optional): asset, target の get_df_from_db の filters(期間で絞る場合)
+        balance_filters (dict, optional): balance の get_df_from_db の filters
+    """
+    def read(table_name, columns_col, values_col, table_filters):
+        return lambda: get_df_from_db(
+            db_path=db_path, table_name=rollup_table(db_path, table_name) or table_name, index_col="date",
+            columns_col=columns_col, values_col=values_col, aggfunc="sum", set_index=True, filters=table_filters,
+        )
+    return [
+        read("asset", None, DAILY_VALUES, filters),
+        read("balance", BALANCE_GROUPS, BALANCE_VALUES, balance_filters),
+        read("target", None, DAILY_VALUES, filters),
+    ]
+
+def _in_window(index: pd.DatetimeIndex, window) -> np.ndarray:
+    # window は (開始日, 終了日)。終了日はその日の時刻付きの行も含める(dashboard_service._window_filters と同じ)
+    mask = np.ones(len(index), dtype=bool)
+    if window is None:
+        return mask
+    start, end = window
+    if start is not None:
+        mask &= index >= start
+    if end is not None:
+        mask &= index < end + pd.Timedelta(days=1)
+    return mask
+
+class Snapshot:
+    """
+    ある時点のデータバージョンの集計済みデータ。読み込み後は変更しない。
+
+    Attributes:
+        version (str): 読み込み開始時の get_data_version
+        asset (pd.DataFrame): date ごとの 資産額, トータルリターン
+        target (pd.DataFrame): date ごとの 資産額, トータルリターン
+        balance (pd.DataFrame): date ごとの 収支タイプ, 収支カテゴリー, 金額, 目標
+        load_sec (float): 読み込みにかかった時間(秒)
+        loaded_at (float): 読み込みを終えた時刻 (time.time())
+    """
+    def __init__(self, version: str, asset: pd.DataFrame, balance: pd.DataFrame, target: pd.DataFrame,
+                 load_sec: float):
+        self.version = version
+        self.asset = asset
+        self.balance = balance
+        self.target = target
+        self.load_sec = load_sec
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, db_path: str) -> "Snapshot":
+        start = time.perf_counter()
+        version = get_data_version(db_path)
+        asset, balance, target = gather(table_reads(db_path), IO)
+        return cls(version, asset, balance, target, time.perf_counter() - start)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(int(df.memory_usage(index=True, deep=True).sum()) for df in (self.asset, self.balance, self.target))
+
+    def frames(self):
+        """
+        read_table_from_db と同じ (df_asset_profit, df_balance, df_target) を返す。
+        """
+        return self.asset.copy(), self.balance.copy(), self.target.copy()
+
+    def daily(self, table_name: str, values: Optional[List[str]] = None, window=None) -> pd.DataFrame:
+        """
+        asset または target の日次合計。window は (開始日, 終了日)。
+        """
+        df = self.asset if table_name == "asset" else self.target
+        return df.loc[_in_window(df.index, window), values or DAILY_VALUES].copy()
+
+    def balances(self, balance_type: Optional[str] = None, window=None) -> pd.DataFrame:
+        """
+        balance の合計(balance_type を指定した場合はその収支タイプだけ)。window は (開始日, 終了日)。
+        """
+        df = self.balance
+        mask = _in_window(df.index, window)
+        if balance_type is not None:
+            mask &= (df["収支タイプ"] == balance_type).to_numpy()
+        return df.loc[mask].copy()
+
+    def latest_date(self, table_name: str, before: Optional[pd.Timestamp] = None) -> Optional[pd.Timestamp]:
+        """
+        最新日(before を指定した場合はそれより前で最新の日)。該当が無い場合は None。
+        """
+        index = (self.asset if table_name == "asset" else self.target).index
+        if before is not None:
+            index = index[index < before]
+        return index.max().normalize() if len(index) else None
+
+    def totals_on(self, table_name: str, day: pd.Timestamp) -> Optional[Dict[str, float]]:
+        """
+        day の 資産額・トータルリターンの合計。該当が無い場合は None。
+        """
+        df = self.daily(table_name, window=(day, day))
+        if df.empty:
+            return None
+        return {col: float(df[col].sum()) for col in DAILY_VALUES}
+
+    def balance_opening(self, balance_type: str, before: pd.Timestamp) -> Dict[str, float]:
+        """
+        before より前の収支カテゴリーごとの金額・目標の合計(dashboard_service.read_balance_opening と同じ)。
+        """
+        df = self.balances(balance_type, (None, before - pd.Timedelta(days=1)))
+        df = df.groupby("収支カテゴリー")[BALANCE_VALUES].sum()
+        return {f"{val}_{cat}": float(df.loc[cat, val]) for cat in df.index for val in BALANCE_VALUES}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": True,
+            "version": self.version,
+            "rows": {"asset": len(self.asset), "balance": len(self.balance), "target": len(self.target)},
+            "nbytes": self.nbytes,
+            "load_sec": round(self.load_sec, 4),
+            "loaded_at": self.loaded_at,
+        }
+
+class _Entry:
+    def __init__(self):
+        self.snapshot: Optional[Snapshot] = None
+        self.lock = threading.Lock()
+
+_lock = threading.Lock()
+_entries: Dict[str, _Entry] = {}
+
+def _key(db_path: str) -> str:
+    return os.path.abspath(db_path)
+
+def register(db_path: str, preload: bool = False) -> None:
+    """
+    db_path をストアの対象にする。登録済みの場合は何もしない。
+
+    Args:
+        db_path (str): SQLite データベースのパス
+        preload (bool): True の場合、バックグラウンドスレッドで読み込んでおく
+    """
+    with _lock:
+        if _key(db_path) in _entries:
+            return
+        _entries[_key(db_path)] = _Entry()
+    if preload:
+        threading.Thread(target=snapshot, args=(db_path,), name="data-store-preload", daemon=True).start()
+
+def unregister(db_path: Optional[str] = None) -> None:
+    """
+    登録を解除して保持しているデータを捨てる。None の場合はすべて。
+    """
+    with _lock:
+        if db_path is None:
+            _entries.clear()
+        else:
+            _entries.pop(_key(db_path), None)
+
+def is_registered(db_path: str) -> bool:
+    return _key(db_path) in _entries
+
+def _load(db_path: str, entry: _Entry) -> Optional[Snapshot]:
+    try:
+        snap = Snapshot.load(db_path)
+    except Exception as e:
+        logger.warning(f"{db_path}: データストアを読み込めません: {e}")
+        return None
+    entry.snapshot = snap
+    stats = snap.stats()
+    logger.info(
+        f"{db_path}: データストアを読み込みました "
+        f"(rows={stats['rows']}, {stats['nbytes'] / 1024:.0f} KiB, {stats['load_sec'] * 1000:.1f} ms)"
+    )
+    return snap
+
+def snapshot(db_path: str) -> Optional[Snapshot]:
+    """
+    db_path の現在のデータバージョンの Snapshot を返す。バージョンが変わっていれば読み込み直す。
+
+    Returns:
+        Snapshot or None: 登録されていない場合、または読み込めない場合は None(呼び出し側は SQLite から読む)
+    """
+    entry = _entries.get(_key(db_path))
+    if entry is None:
+        return None
+    version = get_data_version(db_path)
+    snap = entry.snapshot
+    if snap is not None and snap.version == version:
+        return snap
+    with entry.lock:
+        # 待っている間に他のスレッドが読み込んでいればそれを使う
+        snap = entry.snapshot
+        if snap is not None and snap.version == get_data_version(db_path):
+            return snap
+        return _load(db_path, entry)
+
+def refresh(db_path: str) -> Optional[Snapshot]:
+    """
+    登録済みの db_path を読み込み直して入れ替える(取り込みのコミット後に呼ぶ)。未登録の場合は何もしない。
+    """
+    entry = _entries.get(_key(db_path))
+    if entry is None:
+        return None
+    with entry.lock:
+        return _load(db_path, entry)
+
+def stats() -> List[Dict[str, Any]]:
+    """
+    登録済みの DB ごとの保持データの行数・メモリ使用量 (nbytes)・読み込み時間を返す。
+    """
+    with _lock:
+        entries = list(_entries.items())
+    return [{"db_path": key, **(entry.snapshot.stats() if entry.snapshot is not None else {"loaded": False})}
+            for key, entry in entries]
+
+def _collect_metrics():
+    loaded = [s for s in stats() if s["loaded"]]
+    return [
+        ("data_store_bytes", metrics.GAUGE, "常駐データのメモリ使用量(バイト)",
+         [({"db": os.path.basename(s["db_path"])}, s["nbytes"]) for s in loaded]),
+        ("data_store_load_seconds", metrics.GAUGE, "常駐データの直近の読み込み時間(秒)",
+         [({"db": os.path.basename(s["db_path"])}, s["load_sec"]) for s in loaded]),
+    ]
+
+metrics.register_collector("data_store", _collect_metrics)
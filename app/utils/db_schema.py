@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+finance.db のスキーマ管理(マイグレーション)。
+
+asset, balance, target の各テーブルを自然キーでクラスタ化した WITHOUT ROWID テーブルとして定義し、
+ダッシュボードの集計クエリ用のカバリングインデックスとロールアップテーブル(app.utils.rollups)を作成する。
+適用済みのバージョンは PRAGMA user_version に記録する。
+
+使い方:
+    python -m app.utils.db_schema ./database/finance.db
+"""
+import logging
+import sqlite3
+import sys
+from typing import Dict, List, Tuple
+
+from app.utils.connection import write_connection
+from app.utils.data_loader import quote_identifier
+from app.utils.rollups import create_rollups
+
+logger = logging.getLogger(__name__)
+
+class SchemaMigrationError(Exception):
+    pass
+
+# テーブル定義: 列(名前, 型)、主キー、インデックス{名前: 列}
+TABLE_SCHEMAS: Dict[str, Dict] = {
+    "asset": {
+        "columns": [
+            ("date", "TEXT"), ("資産名", "TEXT"), ("資産タイプ", "TEXT"), ("資産カテゴリー", "TEXT"),
+            ("資産サブタイプ", "TEXT"), ("金融機関口座", "TEXT"), ("資産額", "REAL"),
+            ("トータルリターン", "REAL"), ("含み損益", "REAL"), ("実現損益", "REAL"), ("取得価格", "REAL"),
+        ],
+        "primary_key": ["date", "資産名"],
+        "indexes": {
+            # 日付ごとの資産額・トータルリターン合計
+            "ix_asset_date_totals": ["date", "資産額", "トータルリターン"],
+        },
+    },
+    "balance": {
+        "columns": [
+            ("date", "TEXT"), ("収支項目", "TEXT"), ("金額", "REAL"),
+            ("収支タイプ", "TEXT"), ("収支カテゴリー", "TEXT"), ("目標", "REAL"),
+        ],
+        "primary_key": ["date", "収支項目"],
+        "indexes": {
+            # 日付×収支タイプ×収支カテゴリーごとの金額・目標合計
+            "ix_balance_date_type_category": ["date", "収支タイプ", "収支カテゴリー", "金額", "目標"],
+        },
+    },
+    "target": {
+        "columns": [
+            ("date", "TEXT"), ("資産タイプ", "TEXT"), ("資産額", "REAL"),
+            ("資産配分率", "REAL"), ("トータルリターン", "REAL"), ("利回り", "REAL"),
+        ],
+        "primary_key": ["date", "資産タイプ"],
+        "indexes": {
+            "ix_target_date_totals": ["date", "資産額", "トータルリターン"],
+        },
+    },
+}
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")]
+
+def _invalid_keys(conn: sqlite3.Connection, table: str, key_exprs: List[str], limit: int = 10) -> List[str]:
+    """
+    主キーが NULL の行の件数と、主キーが重複する値(最大 limit 件)を説明する文字列のリストを返す。
+    """
+    problems = []
+    is_null = " OR ".join(f"{e} IS NULL" for e in key_exprs)
+    nulls = conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(table)} WHERE {is_null}").fetchone()[0]
+    if nulls:
+        problems.append(f"主キーが NULL の行が {nulls} 行")
+    keys = ", ".join(key_exprs)
+    duplicates = conn.execute(
+        f"SELECT {keys}, COUNT(*) FROM {quote_identifier(table)} WHERE NOT ({is_null}) "
+        f"GROUP BY {keys} HAVING COUNT(*) > 1 LIMIT {int(limit) + 1}"
+    ).fetchall()
+    problems += [f"{tuple(row[:-1])} が {row[-1]} 行" for row in duplicates[:limit]]
+    if len(duplicates) > limit:
+        problems.append("...")
+    return problems
+
+def _create_table_sql(name: str, columns: List[Tuple[str, str]], primary_key: List[str]) -> str:
+    cols = ", ".join(f"{quote_identifier(c)} {t}".rstrip() for c, t in columns)
+    pk = ", ".join(quote_identifier(c) for c in primary_key)
+    return f"CREATE TABLE {quote_identifier(name)} ({cols}, PRIMARY KEY ({pk})) WITHOUT ROWID"
+
+def _create_indexes(conn: sqlite3.Connection, table: str, schema: Dict) -> None:
+    for index_name, cols in schema["indexes"].items():
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {quote_identifier(index_name)} ON {quote_identifier(table)} "
+            f"({', '.join(quote_identifier(c) for c in cols)})"
+        )
+
+def rebuild_table(conn: sqlite3.Connection, table: str) -> None:
+    """
+    テーブルを TABLE_SCHEMAS の定義で作り直す(既存データは移行する)。
+
+    - 主キーで WITHOUT ROWID のクラスタ化テーブルにする
+    - date 列を "YYYY-MM-DD HH:MM:SS" 形式に正規化する
+    - 定義に無い既存列はそのまま残す
+
+    Raises:
+        SchemaMigrationError: 既存テーブルに主キー列が無い場合、主キーが NULL または
+                              (date の正規化後に)重複する行がある場合。行を捨てずに止めるので、データを直してから再実行する
+    """
+    schema = TABLE_SCHEMAS[table]
+    primary_key = schema["primary_key"]
+    existing = _table_columns(conn, table)
+
+    if not existing:
+        conn.execute(_create_table_sql(table, schema["columns"], primary_key))
+        _create_indexes(conn, table, schema)
+        return
+
+    missing_keys = [c for c in primary_key if c not in existing]
+    if missing_keys:
+        raise SchemaMigrationError(f"{table} に主キー列がありません: {missing_keys}")
+
+    declared = [c for c, _ in schema["columns"]]
+    columns = list(schema["columns"]) + [(c, "") for c in existing if c not in declared]
+    copy_cols = [c for c, _ in columns if c in existing]
+
+    def select_expr(c: str) -> str:
+        return "COALESCE(datetime(\"date\"), \"date\")" if c == "date" else quote_identifier(c)
+
+    problems = _invalid_keys(conn, table, [select_expr(c) for c in primary_key])
+    if problems:
+        raise SchemaMigrationError(f"{table} の主キー {primary_key} が不正です: {', '.join(problems)}")
+
+    tmp = f"_{table}_migrating"
+    conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(tmp)}")
+    conn.execute(_create_table_sql(tmp, columns, primary_key))
+
+    conn.execute(
+        f"INSERT INTO {quote_identifier(tmp)} ({', '.join(quote_identifier(c) for c in copy_cols)}) "
+        f"SELECT {', '.join(select_expr(c) for c in copy_cols)} FROM {quote_identifier(table)}"
+    )
+
+    conn.execute(f"DROP TABLE {quote_identifier(table)}")
+    conn.execute(f"ALTER TABLE {quote_identifier(tmp)} RENAME TO {quote_identifier(table)}")
+    _create_indexes(conn, table, schema)
+
+def _migration_v1(conn: sqlite3.Connection) -> None:
+    for table in TABLE_SCHEMAS:
+        rebuild_table(conn, table)
+
+def _migration_v2(conn: sqlite3.Connection) -> None:
+    create_rollups(conn)
+
+# (バージョン, 説明, 関数)。関数は何度実行しても同じ結果になるように書くこと
+MIGRATIONS = [
+    (1, "asset/balance/target をクラスタ化キー付きテーブルにしてカバリングインデックスを作成", _migration_v1),
+    (2, "日次・月次のロールアップテーブルと更新トリガーを作成", _migration_v2),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(db_path: str, reapply: bool = False) -> int:
+    """
+    未適用のマイグレーションを順に適用する。各マイグレーションは1トランザクションで実行する。
+
+    Args:
+        db_path (str): SQLite データベースのパス
+        reapply (bool): True の場合、適用済みのものも含めてすべて実行する
+                        (to_sql(if_exists="replace") でテーブルを作り直した後など)
+
+    Returns:
+        int: 適用後のスキーマバージョン
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        current = 0 if reapply else get_schema_version(conn)
+        for version, description, func in MIGRATIONS:
+            if version <= current:
+                continue
+            logger.info(f"Applying migration {version}: {description}")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                func(conn)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            current = version
+        conn.execute("ANALYZE")
+        # 読み込みが書き込みにブロックされないようにする(DB ファイルに記録され、以降の接続にも効く)
+        conn.execute("PRAGMA journal_mode = WAL")
+        return get_schema_version(conn)
+    finally:
+        conn.close()
+
+def optimize_database(db_path: str) -> None:
+    """
+    書き込み後に統計情報を更新する。PRAGMA optimize は必要なテーブルだけを ANALYZE する。
+    """
+    with write_connection(db_path) as conn:
+        conn.execute("PRAGMA analysis_limit = 1000")
+        conn.execute("PRAGMA optimize")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) != 2:
+        print("usage: python -m app.utils.db_schema <finance.db>")
+        sys.exit(1)
+    version = migrate(sys.argv[1])
+    print(f"{sys.argv[1]}: schema version {version}")
@@ -0,0 +1,58 @@
+"""
+時系列の間引き (Largest-Triangle-Three-Buckets)。
+
+点を max_points 個に減らしても折れ線の形(山・谷)が残るように、各バケットから
+「前に選んだ点」と「次のバケットの平均点」とで作る三角形の面積が最大の点を選ぶ。
+先頭と末尾の点は必ず残す。
+
+各バケットで選ぶ点は前のバケットで選んだ点に依存するので、バケットの選択は Python のループで順に行う。
+NumPy で一度に計算するのはバケットの境界と平均点、各バケット内の面積の計算だけ。
+"""
+import numpy as np
+
+# 間引きできる最小の点数(先頭・末尾 + 1バケット)
+MIN_POINTS = 3
+
+def lttb_indices(x, y, max_points: int) -> np.ndarray:
+    """
+    LTTB で残す点のインデックスを返す。
+
+    Args:
+        x (array-like): x 座標(昇順)。datetime64 の場合は数値に変換して使う。
+        y (array-like): y 座標
+        max_points (int): 残す点の数
+
+    Returns:
+        np.ndarray: 残す点のインデックス(昇順)。点数が max_points 以下の場合は全点。
+    """
+    x = np.asarray(x)
+    if x.dtype.kind == "M":
+        x = x.astype("datetime64[ns]").astype(np.int64)
+    x = x.astype(np.float64)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    n = len(x)
+    if max_points < MIN_POINTS or n <= max_points:
+        return np.arange(n)
+
+    # 先頭と末尾を除く n-2 点を max_points-2 個のバケットに分ける
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+
+    # 各バケットの平均点(累積和から一度に計算する)。最後のバケットの次は末尾の点
+    cx = np.concatenate(([0.0], np.cumsum(x)))
+    cy = np.concatenate(([0.0], np.cumsum(y)))
+    counts = ends - starts
+    next_x = np.append(((cx[ends] - cx[starts]) / counts)[1:], x[-1])
+    next_y = np.append(((cy[ends] - cy[starts]) / counts)[1:], y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    # バケットごとのループ(前に選んだ点 a を次のバケットで使うので一度には計算できない)
+    for b, (lo, hi) in enumerate(zip(starts.tolist(), ends.tolist())):
+        xs, ys = x[lo:hi], y[lo:hi]
+        # 面積の 2 倍(比較にしか使わないので 1/2 は省く)
+        area = np.abs((x[a] - next_x[b]) * (ys - y[a]) - (x[a] - xs) * (next_y[b] - y[a]))
+        a = lo + int(area.argmax())
+        selected[b + 1] = a
+    return selected
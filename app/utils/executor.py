@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+ダッシュボードの読み込み・グラフ作成を並行して実行するスレッドプール(プロセス内で共有)。
+
+- IO: SQLite の読み込み用。クエリの実行中は GIL が解放されるので、複数の読み込みが同時に進む。
+- CPU: グラフ作成用。NumPy・pandas の処理の多くも GIL を解放する。
+  結果のグラフは NumPy 配列を含む dict なので、プロセスプールにすると受け渡しのコピーの方が高くつく。
+
+ワーカー数が 1 以下の場合は呼び出し元のスレッドで順に実行する(並行実行しない)。
+既定のワーカー数は CPU コア数まで。1コアの環境ではスレッドの切り替えの分だけ遅くなるので順に実行する。
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+IO = "io"
+CPU = "cpu"
+POOLS = (IO, CPU)
+
+# 並行して実行する処理の数(読み込みはサマリ + 3テーブル、グラフは6つ)に合わせた上限
+MAX_DEFAULT_WORKERS = 4
+DEFAULT_WORKERS = {
+    IO: min(MAX_DEFAULT_WORKERS, os.cpu_count() or 1),
+    CPU: min(MAX_DEFAULT_WORKERS, os.cpu_count() or 1),
+}
+
+_settings = {"workers": dict(DEFAULT_WORKERS)}
+_lock = threading.Lock()
+_executors: Dict[str, ThreadPoolExecutor] = {}
+
+def _thread_prefix(pool: str) -> str:
+    return f"dashboard-{pool}"
+
+def configure(io_workers: Optional[int] = None, cpu_workers: Optional[int] = None) -> None:
+    """
+    ワーカー数を変更する(create_app から setting.yaml の dashboard_executor セクションで呼ぶ)。
+    省略した項目は既定値に戻す。起動済みのプールは終了し、次回から新しい設定で作る。
+
+    Args:
+        io_workers (int, optional): 読み込み用のスレッド数
+        cpu_workers (int, optional): グラフ作成用のスレッド数
+    """
+    workers = {
+        IO: DEFAULT_WORKERS[IO] if io_workers is None else int(io_workers),
+        CPU: DEFAULT_WORKERS[CPU] if cpu_workers is None else int(cpu_workers),
+    }
+    with _lock:
+        _settings["workers"] = workers
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=False)
+
+def _executor(pool: str) -> Optional[ThreadPoolExecutor]:
+    workers = _settings["workers"][pool]
+    if workers <= 1:
+        return None
+    # プールのスレッドから同じプールに投入すると、空きを待ち合って止まることがあるのでその場で実行する
+    if threading.current_thread().name.startswith(_thread_prefix(pool)):
+        return None
+    with _lock:
+        executor = _executors.get(pool)
+        if executor is None:
+            executor = _executors[pool] = ThreadPoolExecutor(workers, thread_name_prefix=_thread_prefix(pool))
+        return executor
+
+def gather(calls: Sequence[Callable[[], T]], pool: str = IO) -> List[T]:
+    """
+    引数なしの関数をプールで並行して実行し、結果を calls と同じ順序で返す。
+
+    Args:
+        calls (list): 実行する関数
+        pool (str): "io" または "cpu"
+
+    Raises:
+        Exception: いずれかの関数が送出した例外(calls の順で最初のもの)。他の関数の終了を待ってから送出する。
+    """
+    if pool not in POOLS:
+        raise ValueError(f"Unknown pool: {pool!r}")
+    executor = _executor(pool) if len(calls) > 1 else None
+    if executor is None:
+        return [call() for call in calls]
+    # 呼び出し元のコンテキスト(計測中の app.utils.timing など)を引き継いで実行する
+    futures = [executor.submit(contextvars.copy_context().run, call) for call in calls]
+    errors = [future.exception() for future in futures]
+    for error in errors:
+        if error is not None:
+            raise error
+    return [future.result() for future in futures]
+
+def shutdown() -> None:
+    """
+    起動済みのプールを終了する。
+    """
+    with _lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""
+アップロードファイルのストリーミング取り込み(/api/data/upload 用)。
+
+- 形式は CSV / Arrow IPC ストリーム / Parquet。Arrow と Parquet は型付きのまま読むので、
+  テキストへの変換や型推論が要らない(update_master は Arrow IPC で送る)。
+- chunk_rows 行ずつ、テーブル定義から決めた型(日付・float64・category)に揃えて読む。
+  ファイル全体を DataFrame にしないので、大きなファイルでもメモリ使用量は一定。
+- 複数ファイルはスレッドで並行して解析し、書き込み用接続1本で executemany する。
+- 1回の取り込みは1トランザクション。途中で失敗した場合はすべてロールバックする。
+- date 列は migrate 後のテーブルと同じ "YYYY-MM-DD HH:MM:SS" 形式で書き込む。
+- mode="upsert" では主キーが同じ行を上書きする(値が同じ行は書き換えない)。
+  直近 N 日分を送り直しても行が重複しないので、再同期に DB の作り直しが要らない。
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from app.utils.connection import read_connection, write_connection
+from app.utils.data_loader import bump_data_version, quote_identifier
+from app.utils.db_schema import TABLE_SCHEMAS
+
+# 1チャンクの行数と、解析済みで書き込み待ちにしておけるチャンク数
+DEFAULT_CHUNK_ROWS = 20_000
+MAX_PENDING_CHUNKS = 4
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 取り込みモード: 追記(主キーの重複はエラー)/ 主キーで上書き
+APPEND = "append"
+UPSERT = "upsert"
+MODES = (APPEND, UPSERT)
+
+# ファイル形式と、multipart の Content-Type / 拡張子との対応
+CSV = "csv"
+ARROW = "arrow"
+PARQUET = "parquet"
+FORMATS = (CSV, ARROW, PARQUET)
+CONTENT_TYPES = {
+    "text/csv": CSV,
+    "application/vnd.apache.arrow.stream": ARROW,
+    "application/vnd.apache.arrow.file": ARROW,
+    "application/vnd.apache.parquet": PARQUET,
+    "application/x-parquet": PARQUET,
+}
+EXTENSIONS = {".csv": CSV, ".arrow": ARROW, ".arrows": ARROW, ".feather": ARROW, ".parquet": PARQUET}
+
+class IngestError(ValueError):
+    """
+    取り込むデータの内容が不正な場合のエラー(列名・日付・主キーの重複など)。
+    """
+    pass
+
+def _is_numeric_type(declared: str) -> bool:
+    # SQLite の型アフィニティ (INTEGER / REAL / NUMERIC) の判定
+    declared = (declared or "").upper()
+    return any(t in declared for t in ("INT", "REAL", "FLOA", "DOUB", "NUM", "DEC"))
+
+def table_column_types(db_path: str, table_name: str) -> Dict[str, str]:
+    """
+    テーブルの列ごとの読み込み時の型を返す。TABLE_SCHEMAS の定義を優先し、無い列は宣言型から決める。
+
+    Returns:
+        dict: {列名: "date" / "float64" / "category"}
+
+    Raises:
+        IngestError: テーブルが存在しない場合
+    """
+    declared = dict(TABLE_SCHEMAS.get(table_name, {}).get("columns", []))
+    with read_connection(db_path) as conn:
+        rows = conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()
+    if not rows:
+        raise IngestError(f"テーブルが存在しません: {table_name}")
+    types = {}
+    for _, name, decl_type, *_ in rows:
+        if name == "date":
+            types[name] = "date"
+        elif _is_numeric_type(declared.get(name, decl_type)):
+            types[name] = "float64"
+        else:
+            types[name] = "category"
+    return types
+
+def table_primary_key(db_path: str, table_name: str) -> List[str]:
+    """
+    テーブルの主キー列を定義順に返す。主キーが無い場合は空のリスト。
+    """
+    with read_connection(db_path) as conn:
+        rows = conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()
+    return [name for _, name, _, _, _, pk in sorted(rows, key=lambda r: r[5]) if pk]
+
+def detect_format(content_type: Optional[str], filename: Optional[str] = None) -> str:
+    """
+    Content-Type(無ければ拡張子)からファイル形式を決める。どちらでも決まらない場合は CSV。
+    """
+    fmt = CONTENT_TYPES.get((content_type or "").split(";")[0].strip().lower())
+    if fmt is None and filename:
+        fmt = EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+    return fmt or CSV
+
+def _prepare_chunk(chunk: pd.DataFrame, table_name: str, types: Dict[str, str]) -> pd.DataFrame:
+    unknown = [c for c in chunk.columns if c not in types]
+    if unknown:
+        raise IngestError(f"{table_name} に存在しない列があります: {unknown}")
+    if "date" in chunk.columns:
+        dates = chunk["date"]
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            try:
+                dates = pd.to_datetime(dates, format="ISO8601")
+            except (ValueError, TypeError) as e:
+                raise IngestError(f"{table_name} の date を解釈できません: {e}")
+        chunk["date"] = dates.dt.strftime(DATE_FORMAT)
+    for column in chunk.columns:
+        # Arrow / Parquet の整数列なども REAL 列に合わせて float64 にする(CSV は読み込み時に変換済み)
+        if types[column] == "float64" and chunk[column].dtype != "float64":
+            try:
+                chunk[column] = pd.to_numeric(chunk[column]).astype("float64")
+            except (ValueError, TypeError) as e:
+                raise IngestError(f"{table_name} の {column} を数値にできません: {e}")
+    return chunk
+
+def iter_csv_chunks(source, table_name: str, types: Dict[str, str],
+                    chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    CSV を chunk_rows 行ずつ読み、列の型を揃えた DataFrame を返す。
+
+    Args:
+        source: CSV のパスまたはファイルオブジェクト
+        table_name (str): 書き込み先テーブル名(エラーメッセージ用)
+        types (dict): table_column_types の結果
+        chunk_rows (int): 1チャンクの行数
+
+    Raises:
+        IngestError: 列名・型・日付が不正な場合
+    """
+    dtype = {c: ("str" if t == "date" else t) for c, t in types.items()}
+    try:
+        # 既定の高速なパーサーは最後の桁がずれることがあり、送り直した同じ値が upsert で更新扱いになる
+        reader = pd.read_csv(source, chunksize=chunk_rows, dtype=dtype, float_precision="round_trip")
+    except pd.errors.EmptyDataError:
+        # ヘッダーも無い空ファイル
+        return
+    try:
+        with reader:
+            for chunk in reader:
+                yield _prepare_chunk(chunk, table_name, types)
+    except (ValueError, TypeError) as e:
+        if isinstance(e, IngestError):
+            raise
+        raise IngestError(f"{table_name} の CSV を解釈できません: {e}")
+
+def _record_batches(source, fmt: str, chunk_rows: int):
+    # pyarrow は import が重いので Arrow / Parquet を受け取ったときだけ読み込む
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if fmt == PARQUET:
+        yield from pq.ParquetFile(source).iter_batches(batch_size=chunk_rows)
+        return
+    try:
+        reader = pa.ipc.open_stream(source)
+    except pa.ArrowInvalid:
+        # IPC ファイル形式 (Feather v2)。先頭に戻して開き直す
+        source.seek(0)
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+        return
+    yield from reader
+
+def iter_arrow_chunks(source, table_name: str, types: Dict[str, str], fmt: str = ARROW,
+                      chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Arrow IPC または Parquet を chunk_rows 行以下ずつ読み、列の型を揃えた DataFrame を返す。
+
+    Args:
+        source: パスまたはファイルオブジェクト(Arrow IPC ファイル形式と Parquet はシーク可能なもの)
+        table_name (str): 書き込み先テーブル名(エラーメッセージ用)
+        types (dict): table_column_types の結果
+        fmt (str): "arrow" または "parquet"
+        chunk_rows (int): 1チャンクの最大行数
+
+    Raises:
+        IngestError: ファイルを読めない場合、または列名・型・日付が不正な場合
+    """
+    import pyarrow as pa
+
+    try:
+        for batch in _record_batches(source, fmt, chunk_rows):
+            for offset in range(0, batch.num_rows, chunk_rows):
+                yield _prepare_chunk(batch.slice(offset, chunk_rows).to_pandas(), table_name, types)
+    except (pa.ArrowException, OSError) as e:
+        raise IngestError(f"{table_name} の {fmt} ファイルを読めません: {e}")
+
+def iter_chunks(source, table_name: str, types: Dict[str, str], fmt: str = CSV,
+                chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    fmt に応じて iter_csv_chunks / iter_arrow_chunks で読む。
+    """
+    if fmt == CSV:
+        return iter_csv_chunks(source, table_name, types, chunk_rows)
+    return iter_arrow_chunks(source, table_name, types, fmt, chunk_rows)
+
+def _rows(chunk: pd.DataFrame) -> List[Tuple[Any, ...]]:
+    # NaN は NULL にする
+    return list(chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None))
+
+def _insert_sql(table_name: str, columns: List[str]) -> str:
+    cols = ", ".join(quote_identifier(c) for c in columns)
+    return f"INSERT INTO {quote_identifier(table_name)} ({cols}) VALUES ({', '.join('?' * len(columns))})"
+
+def _staging_table(table_name: str) -> str:
+    return f"temp.{quote_identifier(f'_ingest_{table_name}')}"
+
+def _upsert_chunk(conn: sqlite3.Connection, table_name: str, columns: List[str],
+                  rows: List[Tuple[Any, ...]], key: List[str]) -> Tuple[int, int]:
+    """
+    チャンクを一時テーブルに入れてから、主キーで元テーブルに上書きする。
+    ロールアップのトリガーが差分を反映できるように INSERT OR REPLACE ではなく ON CONFLICT DO UPDATE を使う。
+    同じキーの行が複数ある場合は後の行を採用する。
+
+    Returns:
+        tuple: (追加した行数, 更新した行数)。採用しなかった同じキーの行はどちらにも数えない
+    """
+    missing = [c for c in key if c not in columns]
+    if missing:
+        raise IngestError(f"{table_name} に主キー列がありません: {missing}")
+    staging = _staging_table(table_name)
+    table = quote_identifier(table_name)
+    cols = ", ".join(quote_identifier(c) for c in columns)
+    conn.execute(f"DELETE FROM {staging}")
+    conn.executemany(f"INSERT INTO {staging} ({cols}) VALUES ({', '.join('?' * len(columns))})", rows)
+    # 同じキーの行は後の行だけを残す(残さないと1行の追加が複数の追加・更新として数えられる)
+    key_list = ", ".join(quote_identifier(c) for c in key)
+    conn.execute(f"DELETE FROM {staging} WHERE rowid NOT IN (SELECT MAX(rowid) FROM {staging} GROUP BY {key_list})")
+
+    match = " AND ".join(f"t.{quote_identifier(c)} = s.{quote_identifier(c)}" for c in key)
+    inserted = conn.execute(
+        f"SELECT COUNT(*) FROM {staging} AS s WHERE NOT EXISTS (SELECT 1 FROM {table} AS t WHERE {match})"
+    ).fetchone()[0]
+
+    values = [quote_identifier(c) for c in columns if c not in key]
+    conflict = f"ON CONFLICT ({key_list}) "
+    if values:
+        conflict += (
+            f"DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in values)} "
+            f"WHERE {' OR '.join(f'{table}.{c} IS NOT excluded.{c}' for c in values)}"
+        )
+    else:
+        conflict += "DO NOTHING"
+    # "WHERE true" は INSERT ... SELECT と ON CONFLICT を併用するときの構文上の決まり
+    changed = conn.execute(
+        f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {staging} WHERE true {conflict}"
+    ).rowcount
+    return inserted, changed - inserted
+
+_DONE = object()
+
+def _put(out: queue.Queue, item, stop: threading.Event) -> bool:
+    # 書き込み側が失敗して止まった場合に解析スレッドが queue.put で止まったままにならないようにする
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _parse(table_name: str, source, fmt: str, types: Dict[str, str], chunk_rows: int,
+           out: queue.Queue, stop: threading.Event) -> None:
+    try:
+        for chunk in iter_chunks(source, table_name, types, fmt, chunk_rows):
+            if not _put(out, (table_name, list(chunk.columns), _rows(chunk)), stop):
+                return
+        _put(out, (table_name, None, _DONE), stop)
+    except Exception as e:
+        _put(out, (table_name, None, e), stop)
+
+def ingest_files(db_path: str, sources: Dict[str, Any], chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                 mode: str = APPEND, formats: Optional[Dict[str, str]] = None,
+                 progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    複数のファイルをそれぞれのテーブルに1トランザクションで書き込む。
+
+    Args:
+        db_path (str): SQLite データベースのパス
+        sources (dict): {テーブル名: パスまたはファイルオブジェクト}
+        chunk_rows (int): 1チャンクの行数
+        mode (str): "append"(追記)または "upsert"(主キーが同じ行を上書き)
+        formats (dict, optional): {テーブル名: "csv" / "arrow" / "parquet"}。省略したものは CSV。
+        progress (callable, optional): チャンクを書き込むたびに {"rows": {テーブル名: 処理済みの行数}} で呼ぶ
+
+    Returns:
+        dict: {"counts": {テーブル名: 追加・更新した行数},
+               "changes": {テーブル名: {"inserted": 追加, "updated": 更新, "unchanged": 変更なし}},
+               "rows": 読み込んだ合計行数, "elapsed_sec": 所要時間, "rows_per_sec": 1秒あたりの行数}
+
+    Raises:
+        IngestError: ファイルの内容が不正な場合、append で主キーが重複する場合、
+                     upsert で主キーの無いテーブルを指定した場合(いずれも何も書き込まない)
+    """
+    if mode not in MODES:
+        raise IngestError(f"mode は {' / '.join(MODES)} のいずれかを指定してください: {mode!r}")
+    formats = {table: (formats or {}).get(table, CSV) for table in sources}
+    for table, fmt in formats.items():
+        if fmt not in FORMATS:
+            raise IngestError(f"{table} の形式に対応していません: {fmt!r}")
+    start = time.perf_counter()
+    types = {table: table_column_types(db_path, table) for table in sources}
+    keys = {}
+    if mode == UPSERT:
+        for table in sources:
+            keys[table] = table_primary_key(db_path, table)
+            if not keys[table]:
+                raise IngestError(f"{table} に主キーが無いため upsert できません(migrate を実行してください)")
+    changes = {table: {"inserted": 0, "updated": 0, "unchanged": 0} for table in sources}
+
+    out: queue.Queue = queue.Queue(maxsize=MAX_PENDING_CHUNKS)
+    stop = threading.Event()
+    parsers = [
+        threading.Thread(target=_parse, args=(table, source, formats[table], types[table], chunk_rows, out, stop),
+                         name=f"ingest-{table}", daemon=True)
+        for table, source in sources.items()
+    ]
+    for parser in parsers:
+        parser.start()
+    try:
+        with write_connection(db_path) as conn:
+            if mode == UPSERT:
+                for table in sources:
+                    cols = ", ".join(quote_identifier(c) for c in types[table])
+                    conn.execute(f"DROP TABLE IF EXISTS {_staging_table(table)}")
+                    conn.execute(f"CREATE TABLE {_staging_table(table)} ({cols})")
+            remaining = len(parsers)
+            while remaining:
+                table, columns, rows = out.get()
+                if rows is _DONE:
+                    remaining -= 1
+                    continue
+                if isinstance(rows, Exception):
+                    raise rows
+                try:
+                    if mode == UPSERT:
+                        inserted, updated = _upsert_chunk(conn, table, columns, rows, keys[table])
+                    else:
+                        conn.executemany(_insert_sql(table, columns), rows)
+                        inserted, updated = len(rows), 0
+                except sqlite3.IntegrityError as e:
+                    raise IngestError(f"{table} に書き込めません: {e}")
+                changes[table]["inserted"] += inserted
+                changes[table]["updated"] += updated
+                changes[table]["unchanged"] += len(rows) - inserted - updated
+                if progress is not None:
+                    progress({"rows": {t: sum(c.values()) for t, c in changes.items()}})
+            if mode == UPSERT:
+                for table in sources:
+                    conn.execute(f"DROP TABLE {_staging_table(table)}")
+    finally:
+        stop.set()
+        for parser in parsers:
+            parser.join()
+
+    counts = {table: c["inserted"] + c["updated"] for table, c in changes.items()}
+    if any(counts.values()):
+        bump_data_version(db_path)
+    total = sum(sum(c.values()) for c in changes.values())
+    elapsed = time.perf_counter() - start
+    return {
+        "counts": counts,
+        "changes": changes,
+        "rows": total,
+        "elapsed_sec": round(elapsed, 3),
+        "rows_per_sec": round(total / elapsed) if elapsed > 0 else 0,
+    }
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+バックグラウンドのジョブキュー(/api/data/upload の取り込み用)。
+
+- ジョブは SQLite の jobs テーブルに記録する(finance.db とは別ファイル)。
+  取り込み中の finance.db のトランザクションとは独立に、進捗をすぐに読めるようにするため。
+- ワーカースレッド1本が登録順に実行するので、取り込みの書き込みは常に1つずつになる。
+- プロセスが途中で終了した場合、実行中だったジョブは次回起動時に queued に戻して再実行する
+  (取り込みは1トランザクションなので、途中まで書き込まれていることはない)。
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from app.utils.connection import read_connection, write_connection
+
+logger = logging.getLogger(__name__)
+
+# ジョブの状態
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+# 完了したジョブを残しておく件数
+DEFAULT_KEEP_FINISHED = 200
+
+_CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+)
+"""
+
+def _isoformat(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts).isoformat(timespec="milliseconds") if ts is not None else None
+
+class JobQueue:
+    """
+    SQLite に記録するジョブキュー。submit したジョブをワーカースレッドで1つずつ handler に渡す。
+
+    handler(payload, progress) は payload(submit に渡した dict)を処理して結果の dict を返す。
+    progress(dict) を呼ぶと途中経過をジョブに記録する。例外を送出するとジョブは failed になる。
+
+    Args:
+        db_path (str): ジョブを記録する SQLite データベースのパス(無ければ作成する)
+        handler (callable): ジョブを処理する関数
+        keep_finished (int): 完了したジョブを残しておく件数
+        poll_interval (float): ジョブが無いときに jobs テーブルを確認する間隔(秒)
+    """
+    def __init__(self, db_path: str, handler: Callable[[Dict, Callable[[Dict], None]], Dict],
+                 keep_finished: int = DEFAULT_KEEP_FINISHED, poll_interval: float = 1.0):
+        self.db_path = db_path
+        self.handler = handler
+        self.keep_finished = keep_finished
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        sqlite3.connect(db_path).close()
+        with write_connection(db_path) as conn:
+            conn.execute(_CREATE_TABLE_SQL)
+            recovered = conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, progress = NULL WHERE status = ?", (QUEUED, RUNNING)
+            ).rowcount
+            pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+        if recovered:
+            logger.warning(f"{db_path}: 中断していたジョブ {recovered} 件を再実行します")
+        if pending:
+            self.start()
+
+    def start(self) -> None:
+        """
+        ワーカースレッドを起動する(起動済みの場合は何もしない)。
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="job-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        ワーカースレッドを止める。実行中のジョブがあれば終わるまで待つ。
+        """
+        self._stop.set()
+        self._wakeup.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    def submit(self, payload: Dict[str, Any]) -> str:
+        """
+        ジョブを登録して ID を返す。
+
+        Args:
+            payload (dict): handler に渡す内容(JSON にできるもの)
+        """
+        job_id = uuid.uuid4().hex
+        with write_connection(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(payload, ensure_ascii=False), time.time()),
+            )
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        ジョブの状態を返す。存在しない場合は None。
+
+        Returns:
+            dict: {"job_id", "status", "progress", "result", "error",
+                   "created_at", "started_at", "finished_at", "queued_sec", "elapsed_sec"}
+        """
+        with read_connection(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT status, progress, result, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        status, progress, result, error, created_at, started_at, finished_at = row
+        now = time.time()
+        return {
+            "job_id": job_id,
+            "status": status,
+            "progress": json.loads(progress) if progress else None,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": _isoformat(created_at),
+            "started_at": _isoformat(started_at),
+            "finished_at": _isoformat(finished_at),
+            "queued_sec": round((started_at or now) - created_at, 3),
+            "elapsed_sec": round((finished_at or now) - started_at, 3) if started_at is not None else None,
+        }
+
+    def _claim(self) -> Optional[tuple]:
+        # 選ぶのと実行中にするのを1つの文で行い、複数のワーカー(別プロセスを含む)が同じジョブを取らないようにする
+        with write_connection(self.db_path) as conn:
+            rows = conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ? WHERE status = ? AND id = "
+                "(SELECT id FROM jobs WHERE status = ? ORDER BY created_at, rowid LIMIT 1) RETURNING id, payload",
+                (RUNNING, time.time(), QUEUED, QUEUED),
+            ).fetchall()
+        return rows[0] if rows else None
+
+    def _update(self, job_id: str, **columns) -> None:
+        assignments = ", ".join(f"{name} = ?" for name in columns)
+        with write_connection(self.db_path) as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*columns.values(), job_id))
+            if "finished_at" in columns:
+                conn.execute(
+                    "DELETE FROM jobs WHERE status IN (?, ?) AND id NOT IN "
+                    "(SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY finished_at DESC LIMIT ?)",
+                    (*FINISHED, *FINISHED, self.keep_finished),
+                )
+
+    def _execute(self, job_id: str, payload: Dict[str, Any]) -> None:
+        def progress(values: Dict[str, Any]) -> None:
+            self._update(job_id, progress=json.dumps(values, ensure_ascii=False))
+
+        try:
+            result = self.handler(payload, progress)
+        except Exception as e:
+            logger.warning(f"Job {job_id} failed: {e}")
+            self._update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+        else:
+            self._update(job_id, status=SUCCEEDED, result=json.dumps(result, ensure_ascii=False),
+                         finished_at=time.time())
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"{self.db_path}: ジョブを取得できません: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            job_id, payload = job
+            try:
+                self._execute(job_id, json.loads(payload))
+            except Exception:
+                # jobs テーブルに書き込めない場合でもワーカーは止めない
+                logger.exception(f"Job {job_id}: 状態を記録できません")
@@ -0,0 +1,77 @@
+"""
+NumPy 配列・日時をそのまま書き出す JSON エンコーダと Flask の JSON プロバイダ。
+
+orjson があれば OPT_SERIALIZE_NUMPY で数値配列を直接書き出し、無ければ標準の json で代替する。
+NumPy は import しない(起動を軽くするため)。NumPy を読み込む前に NumPy のオブジェクトは存在しないので、
+読み込み済みの場合だけ sys.modules から参照する。
+"""
+import datetime
+import decimal
+import json
+import sys
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson が無い環境では標準の json で代替する
+    orjson = None
+
+def _default(obj: Any) -> Any:
+    # orjson が直接扱えない型(文字列の配列、非連続の配列、pd.Timestamp など)
+    np = sys.modules.get("numpy")
+    if np is not None and isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist() if isinstance(obj, np.ndarray) else obj.item()
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps_bytes(obj: Any) -> bytes:
+    """
+    obj を UTF-8 の JSON にする。NumPy 配列・スカラー、datetime / date を扱える。
+    NaN は null になる(orjson が無い場合も同じ)。
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(_nan_to_none(obj), default=_default, ensure_ascii=False,
+                      separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+def _nan_to_none(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {k: _nan_to_none(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_nan_to_none(v) for v in obj]
+    np = sys.modules.get("numpy")
+    if np is not None and isinstance(obj, np.ndarray) and obj.dtype.kind == "f":
+        return [None if v != v else v for v in obj.tolist()]
+    if isinstance(obj, float) and obj != obj:
+        return None
+    return obj
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    jsonify などで dumps_bytes を使う JSON プロバイダ。
+    indent などの引数が渡された場合は Flask 標準の実装で書き出す。
+    """
+    # ペイロードの並び順(GRAPH_KEYS の順など)をそのまま保つ
+    sort_keys = False
+
+    @staticmethod
+    def default(obj: Any) -> Any:
+        try:
+            return _default(obj)
+        except TypeError:
+            return DefaultJSONProvider.default(obj)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
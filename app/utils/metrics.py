@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+プロセス内のメトリクス(カウンタ・ヒストグラム)と Prometheus テキスト形式への書き出し (/api/metrics)。
+
+- メトリクスは記録するモジュールで counter() / histogram() を呼んで定義する(同じ名前なら同じオブジェクト)。
+- 記録はメトリクスごとのロックで dict を1回更新するだけ。ヒストグラムの区間の探索はロックの外で行う。
+- キャッシュのヒット数など、既にある値は register_collector で書き出し時に集める(その時点の値)。
+- configure(multiprocess_dir=...) を指定すると、各プロセスが定期的に自分の値を
+  multiprocess_dir/metrics-<pid>.json に書き出し、render は全プロセスの値を合算して返す
+  (gunicorn などで複数プロセスを動かす場合)。collector の値はそのプロセスのものだけ。
+"""
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# 秒単位の既定の区間(5ms〜10s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# バイト単位の区間(1KiB〜16MiB)
+BYTES_BUCKETS = tuple(float(1024 * 4 ** i) for i in range(8))
+
+DEFAULT_FLUSH_INTERVAL = 5.0
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if labels.keys() != set(self.labelnames):
+            raise ValueError(f"{self.name}: labels must be {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def state(self) -> Dict:
+        with self._lock:
+            values = [[list(key), _copy(value)] for key, value in self._values.items()]
+        return {"type": self.type, "help": self.documentation, "labelnames": list(self.labelnames), "values": values}
+
+def _copy(value):
+    return [list(value[0]), value[1]] if isinstance(value, list) else value
+
+class Counter(_Metric):
+    """
+    増えるだけの値。
+    """
+    type = COUNTER
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Histogram(_Metric):
+    """
+    観測値の区間ごとの件数・合計・件数。buckets は区間の上限(昇順、+Inf は自動で加える)。
+    """
+    type = HISTOGRAM
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def state(self) -> Dict:
+        return {**super().state(), "buckets": list(self.buckets)}
+
+_settings = {"multiprocess_dir": None, "flush_interval": DEFAULT_FLUSH_INTERVAL}
+_lock = threading.Lock()
+_metrics: Dict[str, _Metric] = {}
+_collectors: Dict[str, Callable[[], Iterable[Tuple]]] = {}
+_flusher: Optional[threading.Thread] = None
+_flush_stop = threading.Event()
+
+def _get_or_create(cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = cls(name, documentation, labelnames, **kwargs)
+        elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+            raise ValueError(f"Metric {name} is already defined as a different type or labels")
+        return metric
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return _get_or_create(Counter, name, documentation, labelnames)
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+def register_collector(name: str, collect: Callable[[], Iterable[Tuple]]) -> None:
+    """
+    書き出し時に呼ぶ関数を登録する(同じ name の登録は置き換える)。
+
+    collect() は (メトリクス名, "counter" または "gauge", 説明, [(ラベルの dict, 値), ...]) を返す。
+    """
+    with _lock:
+        _collectors[name] = collect
+
+def unregister_collector(name: str) -> None:
+    with _lock:
+        _collectors.pop(name, None)
+
+def configure(multiprocess_dir: Optional[str] = None, flush_interval: float = DEFAULT_FLUSH_INTERVAL) -> None:
+    """
+    複数プロセスの合算の設定(create_app から setting.yaml の metrics セクションで呼ぶ)。
+
+    Args:
+        multiprocess_dir (str, optional): 各プロセスの値を書き出すディレクトリ。None の場合はプロセス内だけ
+        flush_interval (float): 値を書き出す間隔(秒)
+    """
+    global _flusher
+    with _lock:
+        _settings["multiprocess_dir"] = multiprocess_dir
+        _settings["flush_interval"] = float(flush_interval)
+        if multiprocess_dir:
+            os.makedirs(multiprocess_dir, exist_ok=True)
+        if multiprocess_dir and (_flusher is None or not _flusher.is_alive()):
+            _flush_stop.clear()
+            _flusher = threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True)
+            _flusher.start()
+        elif not multiprocess_dir and _flusher is not None:
+            _flush_stop.set()
+            _flusher = None
+
+def _state() -> Dict[str, Dict]:
+    with _lock:
+        metrics = list(_metrics.values())
+    return {metric.name: metric.state() for metric in metrics}
+
+def _state_path(directory: str, pid: int) -> str:
+    return os.path.join(directory, f"metrics-{pid}.json")
+
+def flush() -> None:
+    """
+    このプロセスの値を multiprocess_dir に書き出す(書き出し中のファイルを他のプロセスが読まないよう置き換える)。
+    """
+    directory = _settings["multiprocess_dir"]
+    if not directory:
+        return
+    path = _state_path(directory, os.getpid())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_state(), f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def _flush_loop() -> None:
+    while not _flush_stop.wait(_settings["flush_interval"]):
+        try:
+            flush()
+        except OSError as e:
+            logger.warning(f"メトリクスを書き出せません: {e}")
+
+def _merge(states: List[Dict[str, Dict]]) -> Dict[str, Dict]:
+    merged: Dict[str, Dict] = {}
+    for state in states:
+        for name, metric in state.items():
+            target = merged.setdefault(name, {**metric, "values": {}})
+            if target["type"] != metric["type"] or target.get("buckets") != metric.get("buckets"):
+                continue
+            for labels, value in metric["values"]:
+                key = tuple(labels)
+                current = target["values"].get(key)
+                if current is None:
+                    target["values"][key] = _copy(value)
+                elif metric["type"] == HISTOGRAM:
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+                else:
+                    target["values"][key] = current + value
+    return merged
+
+def _other_process_states() -> List[Dict[str, Dict]]:
+    directory = _settings["multiprocess_dir"]
+    if not directory:
+        return []
+    own = _state_path(directory, os.getpid())
+    states = []
+    for path in sorted(glob.glob(os.path.join(directory, "metrics-*.json"))):
+        if path == own:
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                states.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"{path}: メトリクスを読めません: {e}")
+    return states
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _header(name: str, kind: str, documentation: str) -> List[str]:
+    return [f"# HELP {name} {_escape(documentation)}", f"# TYPE {name} {kind}"]
+
+def render() -> str:
+    """
+    全メトリクスを Prometheus のテキスト形式 (version 0.0.4) で返す。
+    """
+    merged = _merge([_state()] + _other_process_states())
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines += _header(name, metric["type"], metric["help"])
+        names = metric["labelnames"]
+        for key in sorted(metric["values"]):
+            value = metric["values"][key]
+            if metric["type"] != HISTOGRAM:
+                lines.append(f"{name}{_labels(names, key)} {_number(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for upper, count in zip(list(metric["buckets"]) + [float("inf")], counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(names, key, ('le', _number(upper)))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, key)} {_number(float(total))}")
+            lines.append(f"{name}_count{_labels(names, key)} {cumulative}")
+
+    with _lock:
+        collectors = list(_collectors.items())
+    for collector_name, collect in collectors:
+        try:
+            samples = list(collect())
+        except Exception as e:
+            logger.warning(f"{collector_name}: メトリクスを集められません: {e}")
+            continue
+        for name, kind, documentation, values in samples:
+            lines += _header(name, kind, documentation)
+            for labels, value in values:
+                lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {_number(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+書き込み時に作っておくダッシュボードのペイロード(setting.yaml の dashboard_precompute.enabled で有効にする)。
+
+- register した DB について、アップロードの取り込みのコミット後に rebuild でペイロードを作り直し、
+  作り終えたら参照を差し替える(Published)。リクエストは常にどちらか一方の Published を丸ごと使う。
+- データが変わった後、作り直しが終わるまでは前の Published を返す (get の状態が STALE)。
+  取り込み以外(別プロセスからの書き込みなど)でデータが変わっていた場合も、get がバックグラウンドで作り直す。
+- Published はディスク (path) にも書き出し、再起動後は register 時に読み込む。
+  ファイル属性のバージョン (get_file_version) が一致すればそのまま使い、一致しなければ STALE として扱う。
+
+register していない DB、またはまだ一度も作っていない DB では get が (None, MISS) を返し、呼び出し側は自分で作る。
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from app.utils.cache import HIT, MISS, STALE
+from app.utils.data_loader import get_data_version, get_file_version
+from app.utils.json_provider import dumps_bytes
+
+logger = logging.getLogger(__name__)
+
+class Published(NamedTuple):
+    """
+    作り終えたペイロード。作成後は変更しない。
+
+    Attributes:
+        version (str or None): 作成開始時の get_data_version。ディスクから読んでデータが変わっていた場合は None
+        file_version (str): 作成開始時の get_file_version
+        variant: register で指定した作り方の区別(ダッシュボードでは max_points)
+        payload (dict): ペイロード
+        built_at (float): 作り終えた時刻 (time.time())
+        build_sec (float): 作成にかかった時間(秒)
+    """
+    version: Optional[str]
+    file_version: str
+    variant: Any
+    payload: Dict[str, Any]
+    built_at: float
+    build_sec: float
+
+class _Entry:
+    def __init__(self, build: Callable[[], Dict[str, Any]], variant: Any, path: Optional[str]):
+        self.build = build
+        self.variant = variant
+        self.path = path
+        self.published: Optional[Published] = None
+        # 作成を直列化するロック
+        self.lock = threading.Lock()
+        # rebuild_async のスレッドが動いているか
+        self.pending = False
+
+_lock = threading.Lock()
+_entries: Dict[str, _Entry] = {}
+
+def _key(db_path: str) -> str:
+    return os.path.abspath(db_path)
+
+def _read(path: str, db_path: str, variant: Any) -> Optional[Published]:
+    try:
+        with open(path, "rb") as f:
+            saved = json.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"{path}: 保存したペイロードを読めません: {e}")
+        return None
+    if saved.get("variant") != variant:
+        return None
+    # ファイル属性が保存時と同じならデータは変わっていない(カウンタはプロセスごとなので今の値を使う)
+    version = get_data_version(db_path) if saved["file_version"] == get_file_version(db_path) else None
+    return Published(version, saved["file_version"], variant, saved["payload"], saved["built_at"], saved["build_sec"])
+
+def _write(path: str, published: Published) -> None:
+    # 書き出し中のファイルを読まないよう、一時ファイルに書いてから置き換える
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(dumps_bytes({k: v for k, v in published._asdict().items() if k != "version"}))
+    os.replace(tmp_path, path)
+
+def register(db_path: str, build: Callable[[], Dict[str, Any]], variant: Any = None, path: str = None) -> None:
+    """
+    db_path のペイロードを書き込み時に作る対象にする。同じ variant・path で登録済みなら何もしない。
+
+    Args:
+        db_path (str): SQLite データベースのパス
+        build (callable): ペイロードを作る関数
+        variant: 作り方の区別。get の呼び出し側が、自分の要求に使えるかどうかの判定に使う
+        path (str, optional): ペイロードを書き出すファイル。None の場合はディスクに書き出さない
+    """
+    key = _key(db_path)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry.variant == variant and entry.path == path:
+            return
+        entry = _entries[key] = _Entry(build, variant, path)
+    if path is not None:
+        entry.published = _read(path, db_path, variant)
+
+def unregister(db_path: Optional[str] = None) -> None:
+    """
+    登録を解除して保持しているペイロードを捨てる(ディスクのファイルは残す)。None の場合はすべて。
+    """
+    with _lock:
+        if db_path is None:
+            _entries.clear()
+        else:
+            _entries.pop(_key(db_path), None)
+
+def is_registered(db_path: str) -> bool:
+    return _key(db_path) in _entries
+
+def get(db_path: str) -> Tuple[Optional[Published], str]:
+    """
+    db_path の最新の Published を返す。データが変わっていればバックグラウンドで作り直す(作り終えるまでは古いまま)。
+
+    Returns:
+        tuple: (Published, 状態)。状態は HIT(現在のデータから作ったもの)/ STALE(それより前のデータから作ったもの)/
+               MISS(登録されていない、またはまだ作っていない。Published は None)
+    """
+    entry = _entries.get(_key(db_path))
+    published = entry.published if entry is not None else None
+    if published is None:
+        return None, MISS
+    if published.version == get_data_version(db_path):
+        return published, HIT
+    rebuild_async(db_path)
+    return published, STALE
+
+def rebuild(db_path: str) -> Optional[Published]:
+    """
+    登録済みの db_path のペイロードを作り直して差し替え、ディスクに書き出す(取り込みのコミット後に呼ぶ)。
+    現在のデータから作ったものが既にあれば作らない。作成に失敗した場合は警告を出して前のものを残す。
+
+    Returns:
+        Published or None: 差し替え後の Published。未登録の場合は None
+    """
+    entry = _entries.get(_key(db_path))
+    if entry is None:
+        return None
+    with entry.lock:
+        version = get_data_version(db_path)
+        if entry.published is not None and entry.published.version == version:
+            return entry.published
+        file_version = get_file_version(db_path)
+        start = time.perf_counter()
+        try:
+            payload = entry.build()
+        except Exception as e:
+            logger.warning(f"{db_path}: ペイロードを作れません: {e}")
+            return entry.published
+        published = Published(version, file_version, entry.variant, payload, time.time(),
+                              time.perf_counter() - start)
+        entry.published = published
+        logger.info(f"{db_path}: ペイロードを作り直しました ({published.build_sec * 1000:.1f} ms)")
+        if entry.path is not None:
+            try:
+                _write(entry.path, published)
+            except OSError as e:
+                logger.warning(f"{entry.path}: ペイロードを書き出せません: {e}")
+        return published
+
+def rebuild_async(db_path: str) -> bool:
+    """
+    rebuild をバックグラウンドスレッドで実行する。同じ DB の作り直しが実行中であれば何もしない。
+
+    Returns:
+        bool: 新たにスレッドを起動した場合 True
+    """
+    entry = _entries.get(_key(db_path))
+    if entry is None:
+        return False
+    with _lock:
+        if entry.pending:
+            return False
+        entry.pending = True
+
+    def run():
+        try:
+            rebuild(db_path)
+        finally:
+            with _lock:
+                entry.pending = False
+
+    threading.Thread(target=run, name="dashboard-precompute", daemon=True).start()
+    return True
+
+def stats() -> List[Dict[str, Any]]:
+    """
+    登録済みの DB ごとの Published の状態(作成時刻・作成時間・現在のデータから作ったものか)を返す。
+    """
+    with _lock:
+        entries = list(_entries.items())
+    result = []
+    for key, entry in entries:
+        published = entry.published
+        if published is None:
+            result.append({"db_path": key, "built": False})
+            continue
+        result.append({
+            "db_path": key,
+            "built": True,
+            "fresh": published.version == get_data_version(key),
+            "built_at": published.built_at,
+            "build_sec": published.build_sec,
+        })
+    return result
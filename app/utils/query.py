@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+任意の集計クエリ (/api/query)。
+
+テーブル (asset, balance, target)・集計値・グループ化する列・日付の粒度 (day / week / month / year) を受け取り、
+パラメータ化した SQLite の GROUP BY クエリ1本にして実行する。行を pandas に読み込まずに集計結果だけを返す。
+
+- 使えるテーブルと列は db_schema.TABLE_SCHEMAS の定義に限る(TEXT 列がグループ化・絞り込み、REAL 列が集計値)。
+- sum だけの集計で、グループ化・絞り込みの列と日付の粒度・期間がロールアップで表せる場合はロールアップテーブルを読む。
+- 結果はデータバージョン単位でキャッシュする (get_query_result)。
+
+    spec = parse_query("asset", ["sum(資産額)"], group_by=["資産タイプ"], granularity="month")
+    get_query_result(db_path, spec, cache)
+"""
+import re
+from datetime import timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.utils.cache import PayloadCache, MISS, STALE
+from app.utils.connection import read_connection
+from app.utils.data_loader import build_where_clause, get_data_version, quote_identifier
+from app.utils.db_schema import TABLE_SCHEMAS
+from app.utils.rollups import ROLLUPS, rollup_table
+from app.utils.timing import timed
+
+# SQLite の集計関数
+AGGFUNCS = {"sum": "SUM", "avg": "AVG", "min": "MIN", "max": "MAX", "count": "COUNT"}
+
+# 日付の粒度ごとの期間の開始日の式 (week は月曜始まり)
+GRANULARITIES = {
+    "day": "date({date})",
+    "week": "date({date}, 'weekday 0', '-6 days')",
+    "month": "strftime('%Y-%m-01', {date})",
+    "year": "strftime('%Y-01-01', {date})",
+}
+# 細かい順。ロールアップの日付キーより細かい粒度ではロールアップを使えない
+_GRAIN_ORDER = ("day", "week", "month", "year")
+
+# 1回のクエリで返す行数の上限の既定値
+DEFAULT_MAX_ROWS = 10000
+
+# 結果の日付の列名
+DATE_COLUMN = "date"
+
+_MEASURE = re.compile(r"^\s*(\w+)\s*\(\s*(.+?)\s*\)\s*$")
+
+def _columns(table: str, kind: str) -> List[str]:
+    return [c for c, t in TABLE_SCHEMAS[table]["columns"] if t == kind and c != "date"]
+
+# テーブルごとのグループ化・絞り込みに使える列と集計できる列
+TABLES: Dict[str, Dict[str, List[str]]] = {
+    table: {"dimensions": _columns(table, "TEXT"), "measures": _columns(table, "REAL")}
+    for table in TABLE_SCHEMAS
+}
+
+class Measure(NamedTuple):
+    aggfunc: str
+    column: Optional[str]  # count(*) の場合は None
+
+    @property
+    def name(self) -> str:
+        return f"{self.aggfunc}({self.column or '*'})"
+
+class QuerySpec(NamedTuple):
+    """
+    検証済みのクエリ。同じ内容のクエリは同じ値になる(キャッシュのキーに使う)。
+    """
+    table: str
+    measures: Tuple[Measure, ...]
+    group_by: Tuple[str, ...]
+    granularity: Optional[str]
+    filters: Tuple[Tuple[str, Tuple[str, ...]], ...]
+    window: Optional[Tuple[Any, Any]]
+
+def parse_measure(text: str) -> Measure:
+    """
+    "sum(資産額)" 形式の集計値を Measure にする。列名だけの場合は sum、count(*) は行数。
+
+    Raises:
+        ValueError: 集計関数が AGGFUNCS に無い場合
+    """
+    m = _MEASURE.match(text)
+    if m is None:
+        return Measure("sum", text.strip())
+    aggfunc, column = m.group(1).lower(), m.group(2)
+    if aggfunc not in AGGFUNCS:
+        raise ValueError(f"Unsupported aggregate: {m.group(1)!r} (use one of {', '.join(AGGFUNCS)})")
+    if column == "*":
+        if aggfunc != "count":
+            raise ValueError(f"Only count can take '*': {text!r}")
+        return Measure(aggfunc, None)
+    return Measure(aggfunc, column)
+
+def parse_query(table: str, measures: Sequence[str], group_by: Sequence[str] = (), granularity: str = None,
+                filters: Dict[str, Sequence[str]] = None, window=None) -> QuerySpec:
+    """
+    クエリの指定を検証して QuerySpec にする。
+
+    Args:
+        table (str): テーブル名 (TABLES のキー)
+        measures (list): 集計値 ("sum(資産額)", "max(トータルリターン)", "count(*)" など)
+        group_by (list): グループ化する列 (TABLES[table]["dimensions"])
+        granularity (str, optional): 日付の粒度 (GRANULARITIES のキー)。None の場合は日付でグループ化しない
+        filters (dict, optional): {列: 値のリスト}。列の値がいずれかに一致する行だけを集計する
+        window (tuple, optional): (開始日, 終了日)。どちらも None 可
+
+    Raises:
+        ValueError: テーブル・列・集計関数・粒度が使えない場合
+    """
+    if table not in TABLES:
+        raise ValueError(f"Unknown table: {table!r} (use one of {', '.join(TABLES)})")
+    dimensions, numeric = TABLES[table]["dimensions"], TABLES[table]["measures"]
+    if not measures:
+        raise ValueError("measures is required")
+    parsed = tuple(dict.fromkeys(parse_measure(m) for m in measures))
+    for measure in parsed:
+        if measure.column is not None and measure.column not in numeric:
+            raise ValueError(f"Unknown measure column for {table}: {measure.column!r}")
+    group_by = tuple(dict.fromkeys(group_by))
+    for column in group_by:
+        if column not in dimensions:
+            raise ValueError(f"Unknown group_by column for {table}: {column!r}")
+    if granularity is not None and granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity!r} (use one of {', '.join(GRANULARITIES)})")
+    for column in (filters or {}):
+        if column not in dimensions:
+            raise ValueError(f"Unknown filter column for {table}: {column!r}")
+    return QuerySpec(
+        table=table,
+        measures=parsed,
+        group_by=group_by,
+        granularity=granularity,
+        filters=tuple(sorted((c, tuple(sorted(set(v)))) for c, v in (filters or {}).items())),
+        window=window,
+    )
+
+def _window_filter(window) -> Dict[str, tuple]:
+    # 終了日はその日の時刻付きの行も含める
+    if window is None:
+        return {}
+    start, end = window
+    if end is None:
+        return {"date": (">=", start)}
+    if start is None:
+        return {"date": ("<", end + timedelta(days=1))}
+    return {"date": ("range", start, end + timedelta(days=1))}
+
+def _aligned(window, grain: str) -> bool:
+    # 日付キーが月初日のロールアップでは、期間が月単位の場合だけ期間で絞り込める
+    if window is None or grain == "day":
+        return True
+    start, end = window
+    return ((start is None or start.day == 1)
+            and (end is None or (end + timedelta(days=1)).day == 1))
+
+def _rollup_source(db_path: str, spec: QuerySpec) -> Optional[str]:
+    """
+    spec をロールアップテーブルで集計できる場合はその名前を返す。
+    ロールアップは列ごとの合計しか持たないので、集計値がすべて sum の場合に限る。
+    """
+    rollup = ROLLUPS.get(spec.table)
+    if rollup is None or any(m.aggfunc != "sum" or m.column not in rollup["value_cols"] for m in spec.measures):
+        return None
+    columns = set(spec.group_by) | {c for c, _ in spec.filters}
+    if not columns <= set(rollup["group_cols"]):
+        return None
+    grain = rollup["grain"]
+    if spec.granularity is not None and _GRAIN_ORDER.index(spec.granularity) < _GRAIN_ORDER.index(grain):
+        return None
+    if not _aligned(spec.window, grain):
+        return None
+    return rollup_table(db_path, spec.table)
+
+def compile_query(spec: QuerySpec, source: str = None, limit: int = None) -> Tuple[str, List[Any], List[str]]:
+    """
+    spec を SELECT ... GROUP BY ... ORDER BY ... にする。
+
+    Args:
+        spec (QuerySpec): parse_query の結果
+        source (str, optional): 読むテーブル(ロールアップテーブルなど)。省略時は spec.table
+        limit (int, optional): LIMIT
+
+    Returns:
+        tuple: (SQL文字列, パラメータのリスト, 結果の列名のリスト)
+    """
+    keys, names = [], []
+    if spec.granularity is not None:
+        keys.append(GRANULARITIES[spec.granularity].format(date=quote_identifier("date")))
+        names.append(DATE_COLUMN)
+    keys += [quote_identifier(c) for c in spec.group_by]
+    names += list(spec.group_by)
+
+    aggs = []
+    for measure in spec.measures:
+        column = "*" if measure.column is None else quote_identifier(measure.column)
+        aggs.append(f"{AGGFUNCS[measure.aggfunc]}({column})")
+        names.append(measure.name)
+
+    filters = {**{c: list(v) for c, v in spec.filters}, **_window_filter(spec.window)}
+    where, params = build_where_clause(filters)
+    query = f"SELECT {', '.join(keys + aggs)} FROM {quote_identifier(source or spec.table)}{where}"
+    if keys:
+        positions = ", ".join(str(i + 1) for i in range(len(keys)))
+        query += f" GROUP BY {positions} ORDER BY {positions}"
+    if limit is not None:
+        query += f" LIMIT {int(limit)}"
+    return query, params, names
+
+@timed("query")
+def run_query(db_path: str, spec: QuerySpec, max_rows: int = DEFAULT_MAX_ROWS) -> Dict[str, Any]:
+    """
+    spec を実行して列ごとの値を返す。
+
+    Returns:
+        dict: {"columns": 列名のリスト, "data": {列名: 値のリスト}, "source": 読んだテーブル,
+               "truncated": max_rows 行で打ち切った場合 True}
+    """
+    source = _rollup_source(db_path, spec) or spec.table
+    query, params, names = compile_query(spec, source, limit=max_rows + 1)
+    with read_connection(db_path) as conn:
+        rows = conn.execute(query, params).fetchall()
+    truncated = len(rows) > max_rows
+    rows = rows[:max_rows]
+    return {
+        "columns": names,
+        "data": {name: [row[i] for row in rows] for i, name in enumerate(names)},
+        "source": source,
+        "truncated": truncated,
+    }
+
+def get_query_result(db_path: str, spec: QuerySpec, cache: PayloadCache = None,
+                     max_rows: int = DEFAULT_MAX_ROWS) -> Dict[str, Any]:
+    """
+    run_query の結果を (spec, データバージョン) 単位でキャッシュして返す。
+    """
+    if cache is None:
+        return run_query(db_path, spec, max_rows)
+
+    version = get_data_version(db_path)
+    key = (db_path, "query", spec, max_rows)
+    value, state = cache.get(key, version)
+    if state == MISS:
+        value = run_query(db_path, spec, max_rows)
+        cache.set(key, version, value)
+    elif state == STALE:
+        def refresh():
+            latest = get_data_version(db_path)
+            cache.set(key, latest, run_query(db_path, spec, max_rows))
+        cache.refresh_async(key, refresh)
+    return value
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+ダッシュボード用の集計済み(ロールアップ)テーブル。
+
+- asset_daily_total: asset の日次合計(資産額, トータルリターン)
+- target_daily_total: target の日次合計(資産額, トータルリターン)
+- balance_monthly_by_type_category: balance の月次×収支タイプ×収支カテゴリー合計(金額, 目標)
+
+元テーブルへの INSERT / UPDATE / DELETE のたびにトリガーで差分を反映するので、
+append_to_table などの書き込みと同じトランザクションで更新される。
+日付キーは日次が "YYYY-MM-DD"、月次が月初日 "YYYY-MM-01"。
+row_count は集計元の行数で、0 になった行はトリガーで削除する。
+INSERT OR REPLACE は置き換えた行の DELETE トリガーを起動しないので、元テーブルの更新には
+ON CONFLICT ... DO UPDATE を使うこと。
+"""
+import sqlite3
+from typing import Dict, List, Optional
+
+from app.utils.connection import read_connection
+from app.utils.data_loader import quote_identifier
+
+# ロールアップ定義: 元テーブル -> {テーブル名, 日付キーの式, 日付キーの粒度, グループ列, 集計列}
+ROLLUPS: Dict[str, Dict] = {
+    "asset": {
+        "table": "asset_daily_total",
+        "date_expr": "substr({date}, 1, 10)",
+        "grain": "day",
+        "group_cols": [],
+        "value_cols": ["資産額", "トータルリターン"],
+    },
+    "target": {
+        "table": "target_daily_total",
+        "date_expr": "substr({date}, 1, 10)",
+        "grain": "day",
+        "group_cols": [],
+        "value_cols": ["資産額", "トータルリターン"],
+    },
+    "balance": {
+        "table": "balance_monthly_by_type_category",
+        "date_expr": "substr({date}, 1, 7) || '-01'",
+        "grain": "month",
+        "group_cols": ["収支タイプ", "収支カテゴリー"],
+        "value_cols": ["金額", "目標"],
+    },
+}
+
+def _date_key(spec: Dict, ref: str) -> str:
+    return spec["date_expr"].format(date=f"{ref}.\"date\"")
+
+def _not_null(columns: List[str], prefix: str = "") -> str:
+    # キーが NULL の行はロールアップに含めない(pandas の groupby が NaN のキーを落とすのと同じ)
+    return " AND ".join(f"{prefix}{quote_identifier(c)} IS NOT NULL" for c in columns)
+
+def _trigger_sql(source: str, spec: Dict, event: str) -> str:
+    """
+    元テーブルの1行の変更をロールアップに反映するトリガー。
+    INSERT は NEW を加算、DELETE は OLD を減算、UPDATE は両方を行う。
+    """
+    table = quote_identifier(spec["table"])
+    keys = ["date"] + spec["group_cols"]
+    key_list = ", ".join(quote_identifier(k) for k in keys)
+    value_list = ", ".join(quote_identifier(v) for v in spec["value_cols"])
+
+    def key_values(ref: str) -> List[str]:
+        return [_date_key(spec, ref)] + [f"{ref}.{quote_identifier(c)}" for c in spec["group_cols"]]
+
+    def has_keys(ref: str) -> str:
+        return _not_null(["date"] + spec["group_cols"], f"{ref}.")
+
+    def upsert(ref: str, sign: str) -> str:
+        values = ", ".join(f"{sign}COALESCE({ref}.{quote_identifier(v)}, 0)" for v in spec["value_cols"])
+        updates = ", ".join(
+            f"{quote_identifier(v)} = {quote_identifier(v)} + excluded.{quote_identifier(v)}"
+            for v in spec["value_cols"] + ["row_count"]
+        )
+        return (
+            f"INSERT INTO {table} ({key_list}, {value_list}, \"row_count\") "
+            f"SELECT {', '.join(key_values(ref))}, {values}, {sign}1 WHERE {has_keys(ref)} "
+            f"ON CONFLICT ({key_list}) DO UPDATE SET {updates};"
+        )
+
+    def remove_empty(ref: str) -> str:
+        match = " AND ".join(f"{quote_identifier(k)} IS {v}" for k, v in zip(keys, key_values(ref)))
+        return f"DELETE FROM {table} WHERE {match} AND \"row_count\" <= 0;"
+
+    body = []
+    if event in ("DELETE", "UPDATE"):
+        body.append(upsert("OLD", "-"))
+        body.append(remove_empty("OLD"))
+    if event in ("INSERT", "UPDATE"):
+        body.append(upsert("NEW", ""))
+    name = quote_identifier(f"trg_{source}_{event.lower()}_rollup")
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {quote_identifier(source)} "
+        f"BEGIN {' '.join(body)} END"
+    )
+
+def create_rollups(conn: sqlite3.Connection) -> None:
+    """
+    ロールアップテーブルとトリガーを作成し、元テーブルから内容を作り直す。何度実行してもよい。
+    元テーブルが存在しないものはスキップする。
+    """
+    for source, spec in ROLLUPS.items():
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (source,)
+        ).fetchone()
+        if not exists:
+            continue
+
+        table = quote_identifier(spec["table"])
+        keys = ["date"] + spec["group_cols"]
+        key_defs = ", ".join(f"{quote_identifier(k)} TEXT NOT NULL" for k in keys)
+        value_defs = ", ".join(f"{quote_identifier(v)} REAL NOT NULL DEFAULT 0" for v in spec["value_cols"])
+        value_defs += ", \"row_count\" INTEGER NOT NULL DEFAULT 0"
+        key_list = ", ".join(quote_identifier(k) for k in keys)
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ({key_defs}, {value_defs}, PRIMARY KEY ({key_list})) WITHOUT ROWID"
+        )
+
+        # 全件を作り直す
+        group_exprs = [spec["date_expr"].format(date='"date"')] + [quote_identifier(c) for c in spec["group_cols"]]
+        sums = ", ".join(f"COALESCE(SUM({quote_identifier(v)}), 0)" for v in spec["value_cols"])
+        value_list = ", ".join(quote_identifier(v) for v in spec["value_cols"])
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(
+            f"INSERT INTO {table} ({key_list}, {value_list}, \"row_count\") "
+            f"SELECT {', '.join(group_exprs)}, {sums}, COUNT(*) FROM {quote_identifier(source)} "
+            f"WHERE {_not_null(keys)} GROUP BY {', '.join(group_exprs)}"
+        )
+
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(_trigger_sql(source, spec, event))
+
+def drop_rollups(conn: sqlite3.Connection) -> None:
+    """
+    ロールアップテーブルとトリガーを削除する。
+    """
+    for source, spec in ROLLUPS.items():
+        for event in ("insert", "update", "delete"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {quote_identifier(f'trg_{source}_{event}_rollup')}")
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(spec['table'])}")
+
+def rollup_table(db_path: str, source: str) -> Optional[str]:
+    """
+    source のロールアップテーブルが使える場合はその名前を、無ければ None を返す。
+    """
+    spec = ROLLUPS.get(source)
+    if spec is None:
+        return None
+    with read_connection(db_path) as conn:
+        row = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+            (f"trg_{source}_insert_rollup",),
+        ).fetchone()
+    return spec["table"] if row else None
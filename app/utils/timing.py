@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+リクエスト内の処理段階ごとの所要時間の計測(Server-Timing ヘッダと構造化ログ用)。
+
+- start() でリクエストごとの Timings を contextvars に置き、stage() / timed() で囲んだ処理の時間を記録する。
+- 計測していないとき(start していない、または設定で無効)の stage() / timed() は contextvars を1回見るだけ。
+- executor.gather のプールで実行した処理も、呼び出し元のコンテキストを引き継ぐので同じ Timings に記録される。
+  並行して実行した段階の時間はそれぞれ足すので、段階の合計がリクエスト全体 (total) を超えることがある。
+"""
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_current: contextvars.ContextVar[Optional["Timings"]] = contextvars.ContextVar("timings", default=None)
+
+class Timings:
+    """
+    1リクエスト分の段階ごとの所要時間(段階名ごとの合計秒数と回数)。
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, sec: float) -> None:
+        with self._lock:
+            total = self.stages.setdefault(name, [0.0, 0])
+            total[0] += sec
+            total[1] += 1
+
+    @property
+    def total_sec(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns:
+            dict: {段階名: {"ms": 合計ミリ秒, "count": 回数}}(記録した順)
+        """
+        with self._lock:
+            stages = list(self.stages.items())
+        return {name: {"ms": round(sec * 1000, 3), "count": count} for name, (sec, count) in stages}
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing ヘッダの値。複数回実行した段階は desc に回数を付ける。
+        """
+        parts = []
+        for name, value in self.as_dict().items():
+            part = f"{name};dur={value['ms']:.1f}"
+            if value["count"] > 1:
+                part += f';desc="x{value["count"]}"'
+            parts.append(part)
+        parts.append(f"total;dur={self.total_sec * 1000:.1f}")
+        return ", ".join(parts)
+
+def start() -> contextvars.Token:
+    """
+    現在のコンテキストで計測を始める。戻り値を finish に渡して終える。
+    """
+    return _current.set(Timings())
+
+def finish(token: contextvars.Token) -> Optional[Timings]:
+    """
+    計測を終えて、記録した Timings を返す。
+    """
+    timings = _current.get()
+    _current.reset(token)
+    return timings
+
+def current() -> Optional[Timings]:
+    """
+    計測中の Timings。計測していない場合は None。
+    """
+    return _current.get()
+
+@contextmanager
+def stage(name: str):
+    """
+    with ブロックの所要時間を name として記録する。
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start_time)
+
+def timed(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """
+    関数の所要時間を記録するデコレータ。name を省略した場合は関数名。
+    """
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = _current.get()
+            if timings is None:
+                return func(*args, **kwargs)
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.add(stage_name, time.perf_counter() - start_time)
+        return wrapper
+    return decorator
+
+def log(timings: Timings, **fields) -> None:
+    """
+    fields と段階ごとの所要時間を JSON 1行で INFO ログに出す。
+    """
+    logger.info(json.dumps({
+        **fields,
+        "total_ms": round(timings.total_sec * 1000, 3),
+        "stages": timings.as_dict(),
+    }, ensure_ascii=False))
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+起動直後のウォームアップ(setting.yaml の warmup.enabled で有効にする)。
+
+create_app は pandas・NumPy・Plotly を import せずに返るので、最初のリクエストがその分だけ遅くなる。
+ウォームアップはリクエストの受付と並行してバックグラウンドスレッドで次を済ませておく。
+
+1. ダッシュボードの処理が使うモジュール (dashboard_service, data_loader, Plotly の共通レイアウト) の import
+2. finance.db を data_store・dashboard_precompute の対象に登録する (register_finance_db)
+3. data_store が有効なら常駐データを読み込む
+4. dashboard_precompute が有効なら、ダッシュボードのペイロードを作る(保存したものが今のデータと同じなら作らない)
+
+ウォームアップを無効にした場合は、create_app が register_on_first_request で最初のリクエストの前に1回だけ登録する
+(create_app の時点では pandas などを import しない)。
+"""
+import importlib
+import logging
+import os
+import threading
+import time
+
+from app.utils.config import finance_db_path
+
+logger = logging.getLogger(__name__)
+
+# 先に import しておくモジュール(ダッシュボード・アップロードの処理で使うもの)
+WARMUP_MODULES = (
+    "app.routes.dashboard_service",
+    "app.utils.data_store",
+    "app.utils.ingest",
+    "app.utils.query",
+    "app.utils.precomputed",
+)
+
+def register_finance_db(app) -> str:
+    """
+    finance.db を、設定で有効な data_store・dashboard_precompute の対象に登録してパスを返す。
+    dashboard_precompute は保存したペイロードがあれば読み込む(作るのは warm_up)。
+    """
+    from app.routes import dashboard_service
+    finance_db = finance_db_path(app.config)
+    if (app.config.get("DATA_STORE") or {}).get("enabled", False):
+        from app.utils import data_store
+        data_store.register(finance_db)
+    dashboard_service.register_precompute(finance_db, app.config)
+    return finance_db
+
+def register_on_first_request(app) -> None:
+    """
+    最初のリクエストの前に register_finance_db を1回だけ呼ぶ。2回目以降のリクエストではフラグを見るだけ。
+    """
+    lock = threading.Lock()
+    registered = False
+
+    @app.before_request
+    def _register_finance_db():
+        nonlocal registered
+        if registered:
+            return
+        with lock:
+            if not registered:
+                register_finance_db(app)
+                registered = True
+
+def warm_up(app) -> float:
+    """
+    ウォームアップを実行して、かかった時間(秒)を返す。失敗してもリクエストの処理には影響しないので警告だけ出す。
+    """
+    start = time.perf_counter()
+    try:
+        for name in WARMUP_MODULES:
+            importlib.import_module(name)
+        # 共通レイアウトは軸タイトルごとに初回だけ Plotly (plotly.graph_objects) で作る
+        from app.routes import dashboard_service
+        dashboard_service.warm_layouts()
+
+        finance_db = register_finance_db(app)
+        if os.path.exists(finance_db):
+            from app.utils import data_store, precomputed
+            if data_store.is_registered(finance_db):
+                data_store.snapshot(finance_db)
+            # 保存したペイロードが無い、またはデータが変わっていれば作る(最初のリクエストで作らないように)
+            if precomputed.is_registered(finance_db):
+                precomputed.rebuild(finance_db)
+    except Exception as e:
+        logger.warning(f"ウォームアップに失敗しました: {e}")
+    elapsed = time.perf_counter() - start
+    logger.info(f"ウォームアップが終わりました ({elapsed * 1000:.0f} ms)")
+    return elapsed
+
+def start_warmup(app) -> threading.Thread:
+    """
+    warm_up をバックグラウンドスレッドで開始する。
+    """
+    thread = threading.Thread(target=warm_up, args=(app,), name="app-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -1,6 +1,8 @@
 import pandas as pd
 import sqlite3
 import os
+# プロジェクトルートから python -m batch.init_db で実行すること
+from app.utils.db_schema import migrate
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -23,7 +25,9 @@ def init_finance_db():
         parquet_to_sqlite(os.path.join(RAW_DATA_DIR, "balance_detail.parquet"), "balance", conn)
         parquet_to_sqlite(os.path.join(RAW_DATA_DIR, "target_asset_profit.parquet"), "target", conn)
 
-    print(f"Finance DB initialized at {FINANCE_DB}")
+    # to_sql(if_exists="replace") でキーとインデックスが消えるので、スキーマを作り直す
+    version = migrate(FINANCE_DB, reapply=True)
+    print(f"Finance DB initialized at {FINANCE_DB} (schema version {version})")
 
 def init_target_parameter():
     with sqlite3.connect(TARGET_PARAMETER_DB) as conn:
@@ -83,3 +83,26 @@ def save_csv(df, filepath):
     finally:
         if os.path.exists(tmp_path):
             os.remove(tmp_path)
+
+def save_arrow_stream(df, filepath):
+    # Arrow IPC ストリーム形式(/api/data/upload に型付きのまま送る用)
+    if df is None:
+        raise ValueError("Attempted to save None dataframe.")
+
+    out_dir = os.path.dirname(filepath)
+    if out_dir and not os.path.exists(out_dir):
+        raise MissingFileError(f"Output directory does not exist: {out_dir}")
+
+    tmp_path = filepath + ".tmp"
+
+    try:
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, filepath)
+    except Exception as e:
+        raise RawDataError(f"Failed to save Arrow stream: {filepath}\n{e}")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -3,22 +3,49 @@ from .utils.asset_aggregation import make_asset_main
 from .utils.balance_aggregation import make_balance_main
 from .utils.profit_aggregation import make_profit_main
 
-from .lib.file_io import load_parquet, save_csv, load_csv
+from .lib.file_io import load_parquet, save_arrow_stream
 from .lib.agg_settings import PATH_ASSET_PROFIT_DETAIL, PATH_BALANCE_DETAIL
 PATH_ASSET_PROFIT_DETAIL_DEV = "G:/マイドライブ/AssetManager/total/output/asset_detail_test2.parquet"
 
 import os
+import time
 import requests
 import pandas as pd
 import logging
 
 API_BASE = os.environ.get("API_BASE_URL", "http://localhost:5000")
-PATH_UPDATED_ASSET_PROFIT = "./data/update_diff/diff_asset_profit.csv"
-PATH_UPDATED_BALANCE = "./data/update_diff/diff_balance.csv"
+# 差分は Arrow IPC ストリームで保存・送信する(CSV と違い型がそのまま届き、サーバー側で解析し直さない)
+PATH_UPDATED_ASSET_PROFIT = "./data/update_diff/diff_asset_profit.arrows"
+PATH_UPDATED_BALANCE = "./data/update_diff/diff_balance.arrows"
+ARROW_STREAM_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+# DB の最新日付から何日さかのぼって送り直すか(upsert なので重複しない。遅れて確定した値の修正用)
+RESYNC_DAYS = int(os.environ.get("RESYNC_DAYS", "7"))
+# 取り込みジョブの完了を待つ時間(秒)とポーリング間隔
+JOB_TIMEOUT = float(os.environ.get("UPLOAD_JOB_TIMEOUT", "600"))
+JOB_POLL_INTERVAL = 1.0
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
+def wait_for_job(job_url, timeout=JOB_TIMEOUT):
+    """
+    /api/data/jobs/<id> をポーリングし、取り込みジョブが終わったらその状態を返す。
+
+    Raises:
+        TimeoutError: timeout 秒以内に終わらなかった場合
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        res = requests.get(job_url, timeout=10)
+        res.raise_for_status()
+        job = res.json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Upload job did not finish in {timeout} s: {job}")
+        logger.info(f"Upload job {job['status']}: {job.get('progress')}")
+        time.sleep(JOB_POLL_INTERVAL)
+
 def update_master():
     """
     データを更新し、APIから最新日付を取得して差分ファイルを生成する。
@@ -36,8 +63,9 @@ def update_master():
         res = requests.get(f"{API_BASE}/api/dashboard/summary", timeout=10)
         res.raise_for_status() # エラーチェック
         data = res.json()
-        latest_date = pd.to_datetime(data["summary"]["latest_date"])# - pd.Timedelta(days=1)
+        latest_date = pd.to_datetime(data["summary"]["latest_date"])
         logger.info(f"Latest date from API: {latest_date}")
+        since = latest_date - pd.Timedelta(days=RESYNC_DAYS)
 
         # マスターファイルを開く
         #df_master_asset_profit = load_parquet(PATH_ASSET_PROFIT_DETAIL)
@@ -46,15 +74,15 @@ def update_master():
 
         # 更新部分だけを抜き出す
         df_filtered_asset_profit = (
-            df_master_asset_profit[df_master_asset_profit["date"] > latest_date]
+            df_master_asset_profit[df_master_asset_profit["date"] > since]
         )
         df_filtered_balance = (
-            df_master_balance[df_master_balance["date"] > latest_date]
+            df_master_balance[df_master_balance["date"] > since]
         )
 
         # 更新部分をファイルに保存する(空の場合も更新>更新部分がないということを知らせる)
-        save_csv(df_filtered_asset_profit, PATH_UPDATED_ASSET_PROFIT)
-        save_csv(df_filtered_balance, PATH_UPDATED_BALANCE)
+        save_arrow_stream(df_filtered_asset_profit, PATH_UPDATED_ASSET_PROFIT)
+        save_arrow_stream(df_filtered_balance, PATH_UPDATED_BALANCE)
         logger.info("Master update completed successfully.")
 
         # ---------------------------------------------------------
@@ -63,21 +91,28 @@ def update_master():
         upload_url = f"{API_BASE}/api/data/upload"
         logger.info(f"Uploading data to {upload_url}...")
 
-        files = {
+        handles = {
             "file_asset": open(PATH_UPDATED_ASSET_PROFIT, "rb"),
             "file_balance": open(PATH_UPDATED_BALANCE, "rb")
         }
-        
+        files = {
+            name: (os.path.basename(f.name), f, ARROW_STREAM_CONTENT_TYPE) for name, f in handles.items()
+        }
+
         try:
-            resp = requests.post(upload_url, files=files, timeout=30)
+            resp = requests.post(upload_url, files=files, data={"mode": "upsert"}, timeout=30)
             resp.raise_for_status()
-            result = resp.json()
-            logger.info(f"Upload successful: {result}")
+            # 取り込みはサーバーのバックグラウンドで行われるので、ジョブの完了を待つ
+            job = wait_for_job(f"{API_BASE}{resp.json()['job_url']}")
+            if job["status"] == "succeeded":
+                logger.info(f"Upload successful: {job['result']} ({job['elapsed_sec']} s)")
+            else:
+                logger.error(f"Upload job failed: {job['error']}")
         except Exception as e:
             logger.error(f"Failed to upload data: {e}")
         finally:
             # ファイルハンドルを閉じる
-            for f in files.values():
+            for f in handles.values():
                 f.close()
 
     except requests.RequestException as e:
@@ -0,0 +1,110 @@
+"""
+アップロード中のダッシュボード読み込みのベンチマーク。
+
+複数スレッドで build_dashboard_payload を繰り返しながら、別スレッドで asset に行を追記し続け、
+読み込みのレイテンシと件数を比較する。
+
+- legacy: クエリごとに sqlite3.connect(既定の PRAGMA、rollback ジャーナル)
+- pooled: app.utils.connection(読み取り専用接続のプール、WAL、PRAGMA 調整、書き込み用接続1本)
+
+    python -m benchmarks.bench_concurrent_reads --readers 4 --seconds 5
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from app.routes import dashboard_service
+from app.utils import connection, data_loader, rollups
+from app.utils.db_schema import migrate
+from benchmarks.synthetic_db import make_synthetic_finance_db
+
+@contextmanager
+def legacy_connection(db_path):
+    # 変更前と同じく、毎回接続を開いて閉じる
+    with sqlite3.connect(db_path) as conn:
+        yield conn
+
+def writer_loop(db_path, stop, counts, start_day):
+    # 目標 (target) のある期間内で、既存データの翌日から1日分ずつ追記する
+    day = start_day
+    while not stop.is_set():
+        df = pd.DataFrame({
+            "date": [day.strftime("%Y-%m-%d %H:%M:%S")] * 50,
+            "資産名": [f"bench{i}" for i in range(50)],
+            "資産額": np.ones(50), "トータルリターン": np.zeros(50),
+        })
+        data_loader.append_to_table(db_path, df, "asset")
+        counts["writes"] += 1
+        day += pd.Timedelta(days=1)
+
+def reader_loop(db_path, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        dashboard_service.build_dashboard_payload(db_path)
+        latencies.append(time.perf_counter() - start)
+
+def run(db_path, readers, seconds, start_day):
+    stop = threading.Event()
+    counts = {"writes": 0}
+    latencies = [[] for _ in range(readers)]
+    threads = [threading.Thread(target=writer_loop, args=(db_path, stop, counts, start_day))]
+    threads += [threading.Thread(target=reader_loop, args=(db_path, stop, latencies[i])) for i in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    merged = np.array([v for lat in latencies for v in lat]) * 1000
+    return len(merged), np.percentile(merged, 50), np.percentile(merged, 95), counts["writes"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=1825)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"days={args.days} readers={args.readers} seconds={args.seconds}")
+    print(f"{'mode':<8}{'reads':>8}{'p50 [ms]':>10}{'p95 [ms]':>10}{'writes':>8}")
+    for mode in ("legacy", "pooled"):
+        fd, db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        try:
+            make_synthetic_finance_db(db_path, days=args.days)
+            migrate(db_path)
+            if mode == "legacy":
+                with sqlite3.connect(db_path) as conn:
+                    conn.execute("PRAGMA journal_mode = DELETE")
+                patches = [mock.patch.object(module, name, legacy_connection)
+                           for module, name in ((data_loader, "read_connection"), (data_loader, "write_connection"),
+                                                (rollups, "read_connection"))]
+            else:
+                patches = []
+            for p in patches:
+                p.start()
+            try:
+                start_day = pd.Timestamp("2015-01-01") + pd.Timedelta(days=args.days)
+                reads, p50, p95, writes = run(db_path, args.readers, args.seconds, start_day)
+            finally:
+                for p in patches:
+                    p.stop()
+            print(f"{mode:<8}{reads:>8}{p50:>10.1f}{p95:>10.1f}{writes:>8}")
+        finally:
+            connection.close_connections(db_path)
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(db_path + suffix)
+                except OSError:
+                    pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+build_dashboard_payload のベンチマーク(順次実行と app.utils.executor による並行実行の比較)。
+
+    python -m benchmarks.bench_dashboard_payload --days 3650 --repeat 20
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.routes import dashboard_service
+from app.utils import connection, executor
+from app.utils.db_schema import migrate
+from benchmarks.synthetic_db import make_synthetic_finance_db
+
+def measure(func, repeat):
+    func()  # 接続・キャッシュのウォームアップ
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=3650)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--max-points", type=int, default=2000)
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        make_synthetic_finance_db(db_path, days=args.days)
+        migrate(db_path)
+        print(f"days={args.days} max_points={args.max_points} repeat={args.repeat}")
+        print(f"{'workers (io/cpu)':<18}{'median [ms]':>12}")
+        for io_workers, cpu_workers in ((1, 1), (4, 1), (4, 4), (4, 8)):
+            executor.configure(io_workers=io_workers, cpu_workers=cpu_workers)
+            ms = measure(lambda: dashboard_service.build_dashboard_payload(db_path, max_points=args.max_points),
+                         args.repeat)
+            print(f"{f'{io_workers}/{cpu_workers}':<18}{ms:>12.1f}")
+        executor.configure()
+    finally:
+        connection.close_connections(db_path)
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(db_path + suffix)
+            except OSError:
+                pass
+
+if __name__ == "__main__":
+    main()
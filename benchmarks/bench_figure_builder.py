@@ -0,0 +1,106 @@
+"""
+グラフ JSON 生成のベンチマーク。
+
+figure_builder.figure + dumps_bytes(レイアウトを事前計算し、NumPy 配列を直接書き出す)と
+従来の go.Figure → graph_common_setting → to_dict() → json.dumps の実装を、
+同じ DataFrame から6つのグラフを作る時間で比較する。出力が同じ内容であることも確認する。
+
+    python -m benchmarks.bench_figure_builder --days 3650 --repeat 5
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
+
+from app.routes import dashboard_service
+from app.routes.figure_builder import graph_common_setting
+from app.utils.json_provider import dumps_bytes
+from app.utils.db_schema import migrate
+from benchmarks.synthetic_db import make_synthetic_finance_db
+
+def plotly_figure_json(traces, graph_id, x_title, y_title) -> str:
+    """
+    figure_builder.figure と同じ入力から go.Figure を経由して JSON を作る(従来の実装。比較用)。
+    """
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    for spec in traces:
+        kwargs = {k: v for k, v in spec.items() if k != "type"}
+        kwargs["x"] = np.asarray(kwargs["x"]).tolist()
+        kwargs["y"] = np.asarray(kwargs["y"]).astype(float).tolist()
+        trace_cls = go.Bar if spec["type"] == "bar" else go.Scatter
+        fig.add_trace(trace_cls(**kwargs))
+    fig = graph_common_setting(fig, x_title, y_title)
+    fig.update_layout(meta={"id": graph_id})
+    return json.dumps(fig.to_dict())
+
+def build_graphs(df_asset_profit, df_balance, df_target):
+    """
+    6つのグラフを作り、それぞれ JSON (bytes) にして返す。
+    """
+    df_general = dashboard_service.make_general_and_special_balance(df_balance, "一般収支")
+    df_special = dashboard_service.make_general_and_special_balance(df_balance, "特別収支")
+    graphs = {
+        "assets": dashboard_service.build_total_assets(df_asset_profit, df_target),
+        "returns": dashboard_service.build_total_returns(df_asset_profit, df_target),
+        "general_income_expenditure": dashboard_service.build_general_income_expenditure(df_general),
+        "general_balance": dashboard_service.build_general_balance(df_general),
+        "special_income_expenditure": dashboard_service.build_special_income_expenditure(df_special),
+        "special_balance": dashboard_service.build_special_balance(df_special),
+    }
+    return {key: graph.encode("utf-8") if isinstance(graph, str) else dumps_bytes(graph)
+            for key, graph in graphs.items()}
+
+def timeit(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, min(times), sum(times) / len(times)
+
+def assert_same(fast, slow):
+    for key in slow:
+        a, b = json.loads(fast[key]), json.loads(slow[key])
+        assert a["layout"] == b["layout"], key
+        for ta, tb in zip(a["data"], b["data"]):
+            assert ta["x"] == tb["x"], key
+            np.testing.assert_allclose(ta["y"], tb["y"], err_msg=key)
+            assert {k: v for k, v in ta.items() if k not in ("x", "y")} == \
+                   {k: v for k, v in tb.items() if k not in ("x", "y")}, key
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=1825)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        make_synthetic_finance_db(db_path, days=args.days)
+        migrate(db_path)
+        frames = dashboard_service.read_table_from_db(db_path)
+
+        # 初回のレイアウト生成は計測から除く
+        fast = build_graphs(*frames)
+        fast, fast_min, fast_avg = timeit(lambda: build_graphs(*frames), args.repeat)
+        with mock.patch.object(dashboard_service, "figure", plotly_figure_json):
+            slow, slow_min, slow_avg = timeit(lambda: build_graphs(*frames), args.repeat)
+        assert_same(fast, slow)
+
+        size = sum(len(v) for v in fast.values())
+        print(f"days={args.days} repeat={args.repeat} payload={size / 1024:.0f} KiB")
+        print(f"{'path':<12}{'min [ms]':>12}{'avg [ms]':>12}")
+        print(f"{'go.Figure':<12}{slow_min * 1000:>12.1f}{slow_avg * 1000:>12.1f}")
+        print(f"{'figure':<12}{fast_min * 1000:>12.1f}{fast_avg * 1000:>12.1f}")
+        print(f"speedup: {slow_min / fast_min:.1f}x")
+    finally:
+        os.remove(db_path)
+
+if __name__ == "__main__":
+    main()
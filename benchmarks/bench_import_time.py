@@ -0,0 +1,78 @@
+"""
+起動 (import app と create_app) のコストのベンチマーク。
+
+python -X importtime で create_app までを別プロセスで実行し、次を表示する。
+
+- create_app までの実時間と、importtime の合計 (app 配下の累積時間)
+- 累積時間の大きいトップレベルの import
+- pandas / NumPy / Plotly が create_app の時点で読み込まれているか(読み込まれていないのが正しい)
+
+ウォームアップ (app.utils.warmup) はバックグラウンドで import するので、計測では起動しない。
+
+    python -m benchmarks.bench_import_time --repeat 5 --top 10
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("pandas", "numpy", "plotly")
+
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from app.utils import warmup
+warmup.start_warmup = lambda app: None
+from app import create_app
+create_app()
+elapsed = time.perf_counter() - start
+print(f"elapsed_ms={elapsed * 1000:.1f}")
+print("loaded=" + ",".join(m for m in %r if m in sys.modules))
+""" % (HEAVY_MODULES,)
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def run_once():
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", SCRIPT], cwd=ROOT,
+                          capture_output=True, text=True, check=True)
+    out = dict(line.split("=", 1) for line in proc.stdout.splitlines() if "=" in line)
+    imports = []
+    for line in proc.stderr.splitlines():
+        m = LINE.match(line)
+        if m:
+            self_us, cumulative_us, indent, name = m.groups()
+            imports.append((name, len(indent) // 2, int(self_us), int(cumulative_us)))
+    return float(out["elapsed_ms"]), [m for m in out["loaded"].split(",") if m], imports
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    elapsed, totals, loaded, runs = [], [], set(), []
+    for _ in range(args.repeat):
+        ms, heavy, imports = run_once()
+        elapsed.append(ms)
+        # トップレベル (インデント 0) の累積時間の合計 = importtime で計測した import の合計
+        totals.append(sum(cum for _, depth, _, cum in imports if depth == 0) / 1000)
+        loaded.update(heavy)
+        runs.append(imports)
+
+    print(f"repeat={args.repeat}")
+    print(f"create_app wall [ms]: median={np.median(elapsed):.1f} min={np.min(elapsed):.1f}")
+    print(f"importtime total [ms]: median={np.median(totals):.1f}")
+    print(f"heavy modules loaded by create_app: {', '.join(sorted(loaded)) or 'none'}")
+
+    # 最後の実行のトップレベル import を累積時間の大きい順に
+    top = sorted((i for i in runs[-1] if i[1] == 0), key=lambda i: -i[3])[:args.top]
+    print(f"{'module':<40}{'cumulative [ms]':>16}")
+    for name, _, _, cumulative in top:
+        print(f"{name:<40}{cumulative / 1000:>16.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+/api/data/upload の取り込みのベンチマーク(形式ごとのファイルサイズと取り込み時間)。
+
+asset の差分(資産数 × 日数の行)を CSV / Arrow IPC ストリーム / Parquet で作り、
+空の asset テーブル(migrate 済み)に ingest_files で取り込む。
+decode は DB に書き込まずにチャンクを読むだけの時間。
+
+    python -m benchmarks.bench_ingest --days 365 --assets 100
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.utils import connection
+from app.utils.db_schema import migrate
+from app.utils.ingest import ARROW, CSV, PARQUET, ingest_files, iter_chunks, table_column_types
+
+def make_asset_diff(days, assets, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2024-01-01", periods=days, freq="D")
+    n = days * assets
+    value = rng.normal(1_000_000, 10_000, n)
+    ret = rng.normal(0, 1_000, n)
+    return pd.DataFrame({
+        "date": np.repeat(dates, assets), "資産名": np.tile([f"資産{i}" for i in range(assets)], days),
+        "資産タイプ": "リスク資産", "資産カテゴリー": "カテゴリー0", "資産サブタイプ": "サブタイプ0", "金融機関口座": "口座0",
+        "資産額": value, "トータルリターン": ret, "含み損益": ret / 2, "実現損益": ret / 2, "取得価格": value - ret,
+    })
+
+def encode(df, fmt):
+    if fmt == CSV:
+        return df.to_csv(index=False).encode("utf-8")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if fmt == PARQUET:
+        buf = io.BytesIO()
+        pq.write_table(table, buf)
+        return buf.getvalue()
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def run(body, fmt):
+    fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        migrate(db_path)
+        start = time.perf_counter()
+        for _ in iter_chunks(io.BytesIO(body), "asset", table_column_types(db_path, "asset"), fmt):
+            pass
+        decode = time.perf_counter() - start
+        start = time.perf_counter()
+        result = ingest_files(db_path, {"asset": io.BytesIO(body)}, formats={"asset": fmt})
+        return decode, time.perf_counter() - start, result["rows"]
+    finally:
+        connection.close_connections(db_path)
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(db_path + suffix)
+            except OSError:
+                pass
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--assets", type=int, default=100)
+    args = parser.parse_args()
+
+    df = make_asset_diff(args.days, args.assets)
+    print(f"rows={len(df)}")
+    print(f"{'format':<9}{'size [KB]':>11}{'decode [s]':>12}{'ingest [s]':>12}{'rows/s':>10}")
+    for fmt in (CSV, ARROW, PARQUET):
+        body = encode(df, fmt)
+        decode, elapsed, rows = run(body, fmt)
+        print(f"{fmt:<9}{len(body) / 1024:>11.0f}{decode:>12.2f}{elapsed:>12.2f}{rows / elapsed:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+ベンチマーク用に実データと同じ列構成の finance.db を作る。
+"""
+import sqlite3
+import numpy as np
+import pandas as pd
+
+def make_synthetic_finance_db(db_path: str, days: int = 1825, assets: int = 30, items: int = 40,
+                              target_years: int = 30, seed: int = 0) -> None:
+    """
+    asset, balance, target テーブルを持つ finance.db を作成する(既存のテーブルは置き換える)。
+
+    Args:
+        db_path (str): 作成する SQLite データベースのパス
+        days (int): 実績データの日数
+        assets (int): 資産の数
+        items (int): 収支項目の数
+        target_years (int): 目標データの年数(実績より先の日付まで続く)
+        seed (int): 乱数シード
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2015-01-01", periods=days, freq="D")
+
+    frames = []
+    for i in range(assets):
+        value = 1_000_000 + rng.normal(0, 10_000, days).cumsum()
+        ret = rng.normal(0, 1_000, days).cumsum()
+        frames.append(pd.DataFrame({
+            "date": dates, "資産名": f"資産{i}", "資産タイプ": ["リスク資産", "安全資産"][i % 2],
+            "資産カテゴリー": f"カテゴリー{i % 4}", "資産サブタイプ": f"サブタイプ{i % 3}", "金融機関口座": f"口座{i % 5}",
+            "資産額": value, "トータルリターン": ret, "含み損益": ret / 2, "実現損益": ret / 2, "取得価格": value - ret,
+        }))
+    df_asset = pd.concat(frames, ignore_index=True)
+
+    frames = []
+    for i in range(items):
+        balance_type = "一般収支" if i < items * 3 // 4 else "特別収支"
+        category = "収入" if i % 3 == 0 else "支出"
+        sign = 1.0 if category == "収入" else -1.0
+        frames.append(pd.DataFrame({
+            "date": dates, "収支項目": f"項目{i}", "金額": sign * rng.integers(0, 5_000, days),
+            "収支タイプ": balance_type, "収支カテゴリー": category, "目標": sign * 2_000.0,
+        }))
+    df_balance = pd.concat(frames, ignore_index=True)
+
+    target_dates = pd.date_range("2015-01-01", periods=target_years * 365, freq="D")
+    n = np.arange(len(target_dates), dtype=float)
+    frames = []
+    for k, asset_type in enumerate(["リスク資産", "安全資産"]):
+        frames.append(pd.DataFrame({
+            "date": target_dates, "資産タイプ": asset_type, "資産額": 10_000_000 + n * 1_000 * (k + 1),
+            "資産配分率": 0.5, "トータルリターン": n * 100.0, "利回り": 0.03,
+        }))
+    df_target = pd.concat(frames, ignore_index=True)
+
+    with sqlite3.connect(db_path) as conn:
+        df_asset.to_sql("asset", conn, if_exists="replace", index=False)
+        df_balance.to_sql("balance", conn, if_exists="replace", index=False)
+        df_target.to_sql("target", conn, if_exists="replace", index=False)
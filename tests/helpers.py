@@ -0,0 +1,49 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+
+def make_finance_db(db_path, days=120, target_days=None):
+    """
+    テスト用に asset, balance, target テーブルを持つ小さな finance.db を作成する。
+    """
+    dates = pd.date_range("2024-01-01", periods=days, freq="D")
+    n = np.arange(days, dtype=float)
+
+    assets = []
+    for i, (asset_type, base) in enumerate([("リスク資産", 1_000_000.0), ("安全資産", 500_000.0)]):
+        assets.append(pd.DataFrame({
+            "date": dates, "資産名": f"asset{i}", "資産タイプ": asset_type,
+            "資産カテゴリー": f"cat{i}", "資産サブタイプ": f"sub{i}", "金融機関口座": "bank",
+            "資産額": base + n * 1000.0 * (i + 1), "トータルリターン": n * 10.0 * (i + 1),
+            "含み損益": n * 5.0, "実現損益": n * 5.0, "取得価格": base,
+        }))
+    df_asset = pd.concat(assets, ignore_index=True)
+
+    balances = []
+    for item, balance_type, category, amount, target in [
+        ("給与", "一般収支", "収入", 10_000.0, 9_000.0),
+        ("食費", "一般収支", "支出", -3_000.0, -2_500.0),
+        ("賞与", "特別収支", "収入", 1_000.0, 1_000.0),
+        ("旅行", "特別収支", "支出", -500.0, -800.0),
+    ]:
+        balances.append(pd.DataFrame({
+            "date": dates, "収支項目": item, "金額": amount,
+            "収支タイプ": balance_type, "収支カテゴリー": category, "目標": target,
+        }))
+    df_balance = pd.concat(balances, ignore_index=True)
+
+    target_dates = pd.date_range("2024-01-01", periods=target_days or days * 2, freq="D")
+    m = np.arange(len(target_dates), dtype=float)
+    targets = []
+    for asset_type, base in [("リスク資産", 1_000_000.0), ("安全資産", 500_000.0)]:
+        targets.append(pd.DataFrame({
+            "date": target_dates, "資産タイプ": asset_type, "資産額": base + m * 1500.0,
+            "資産配分率": 0.5, "トータルリターン": m * 20.0, "利回り": 0.03,
+        }))
+    df_target = pd.concat(targets, ignore_index=True)
+
+    with sqlite3.connect(db_path) as conn:
+        df_asset.to_sql("asset", conn, if_exists="replace", index=False)
+        df_balance.to_sql("balance", conn, if_exists="replace", index=False)
+        df_target.to_sql("target", conn, if_exists="replace", index=False)
+    return df_asset, df_balance, df_target
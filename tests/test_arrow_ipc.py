@@ -0,0 +1,68 @@
+import unittest
+import json
+import numpy as np
+import pyarrow as pa
+from app.utils import arrow_ipc
+from app.utils.arrow_ipc import columns_to_ipc, graphs_to_ipc
+
+def read(body):
+    table = pa.ipc.open_stream(body).read_all()
+    return table, json.loads(table.schema.metadata[b"payload"])
+
+class TestGraphsToIpc(unittest.TestCase):
+    def setUp(self):
+        x = np.array(["2024-01-01", "2024-01-02", "2024-01-03"])
+        self.payload = {
+            "ok": True,
+            "summary": {"latest_date": "2024/01/03"},
+            "graphs": {
+                "assets": {"data": [
+                    {"name": "a", "uid": "assets:a", "x": x, "y": np.array([1.0, 2.0, 3.0]), "type": "scatter"},
+                    {"name": "b", "uid": "assets:b", "x": x[:2], "y": np.array([4.0, 5.0]), "type": "scatter"},
+                ], "layout": {"meta": {"id": "total_assets"}}},
+                "general_balance": {"replace_from": "2024-01", "traces": [
+                    {"uid": "general_balance:c", "x": ["2024-01"], "y": [7.0]},
+                ]},
+            },
+        }
+
+    def test_columns(self):
+        table, meta = read(graphs_to_ipc(self.payload))
+        self.assertEqual(table.num_rows, 6)
+        self.assertEqual(table.column("graph").to_pylist(), ["assets"] * 5 + ["general_balance"])
+        self.assertEqual(table.column("uid").to_pylist()[2:4], ["assets:a", "assets:b"])
+        self.assertEqual(str(table.column("x")[5]), "2024-01-01")
+        self.assertEqual(table.column("y").to_pylist(), [1.0, 2.0, 3.0, 4.0, 5.0, 7.0])
+
+    def test_metadata_has_everything_but_values(self):
+        _, meta = read(graphs_to_ipc(self.payload))
+        self.assertEqual(meta["summary"], {"latest_date": "2024/01/03"})
+        self.assertEqual(meta["graphs"]["assets"]["data"][1], {"name": "b", "uid": "assets:b", "type": "scatter"})
+        self.assertEqual(meta["graphs"]["assets"]["layout"], {"meta": {"id": "total_assets"}})
+        self.assertEqual(meta["graphs"]["general_balance"],
+                         {"replace_from": "2024-01", "traces": [{"uid": "general_balance:c"}]})
+
+    def test_float_values_are_not_copied(self):
+        y = self.payload["graphs"]["assets"]["data"][0]["y"]
+        self.assertEqual(arrow_ipc._float_array(y).buffers()[1].address, y.ctypes.data)
+
+    def test_empty(self):
+        table, meta = read(graphs_to_ipc({"ok": True, "graphs": {"assets": {"traces": [
+            {"uid": "assets:a", "x": [], "y": []}]}}}))
+        self.assertEqual(table.num_rows, 0)
+        self.assertEqual(table.schema.field("x").type, pa.date32())
+
+class TestColumnsToIpc(unittest.TestCase):
+    def test_columns(self):
+        payload = {"ok": True, "table": "asset", "columns": ["date", "資産タイプ", "sum(資産額)", "count(*)"],
+                   "data": {"date": ["2024-01-01", "2024-02-01"], "資産タイプ": ["x", None],
+                            "sum(資産額)": [1.5, None], "count(*)": [3, 4]}}
+        table, meta = read(columns_to_ipc(payload))
+        self.assertEqual(table.column_names, payload["columns"])
+        self.assertEqual(table.schema.field("date").type, pa.date32())
+        self.assertEqual(table.schema.field("count(*)").type, pa.int64())
+        self.assertEqual(table.column("sum(資産額)").to_pylist(), [1.5, None])
+        self.assertEqual(meta, {k: v for k, v in payload.items() if k != "data"})
+
+if __name__ == '__main__':
+    unittest.main()
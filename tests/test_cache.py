@@ -0,0 +1,106 @@
+import unittest
+import os
+import tempfile
+import threading
+import pandas as pd
+from unittest import mock
+from app.utils.cache import PayloadCache, HIT, STALE, MISS
+from app.utils.data_loader import append_to_table, get_data_version
+from app.utils.json_provider import dumps_bytes
+from app.routes import dashboard_service
+from app.routes.dashboard_service import get_dashboard_payload, build_dashboard_payload, GRAPH_KEYS
+from helpers import make_finance_db
+
+class TestPayloadCache(unittest.TestCase):
+    def test_hit_and_version_mismatch(self):
+        cache = PayloadCache(max_entries=4)
+        cache.set("k", "v1", {"a": 1})
+        self.assertEqual(cache.get("k", "v1"), ({"a": 1}, HIT))
+        self.assertEqual(cache.get("k", "v2"), (None, MISS))
+        self.assertEqual(cache.get("x", "v1"), (None, MISS))
+
+    def test_lru_bound(self):
+        cache = PayloadCache(max_entries=2)
+        cache.set("a", 1, "A")
+        cache.set("b", 1, "B")
+        cache.get("a", 1)
+        cache.set("c", 1, "C")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("b", 1), (None, MISS))
+        self.assertEqual(cache.get("a", 1), ("A", HIT))
+
+    def test_stale_while_revalidate(self):
+        cache = PayloadCache(stale_while_revalidate=True)
+        cache.set("k", "v1", "old")
+        self.assertEqual(cache.get("k", "v2"), ("old", STALE))
+        cache.invalidate()
+        self.assertEqual(cache.get("k", "v1"), ("old", STALE))
+
+        done = threading.Event()
+        self.assertTrue(cache.refresh_async("t", lambda: (cache.set("k", "v2", "new"), done.wait(5))))
+        self.assertFalse(cache.refresh_async("t", lambda: None))
+        done.set()
+
+    def test_invalidate_removes_entries(self):
+        cache = PayloadCache()
+        cache.set(("db1", "summary"), 1, "x")
+        cache.set(("db2", "summary"), 1, "y")
+        cache.invalidate(lambda key: key[0] == "db1")
+        self.assertEqual(cache.get(("db1", "summary"), 1), (None, MISS))
+        self.assertEqual(cache.get(("db2", "summary"), 1), ("y", HIT))
+
+    def test_track(self):
+        cache = PayloadCache(stale_while_revalidate=True)
+        cache.set("a", 1, "A")
+        with cache.track() as outer:
+            cache.get("a", 1)
+            with cache.track() as inner:
+                cache.get("a", 2)
+            cache.get("b", 1)
+        cache.get("a", 1)
+        self.assertEqual(inner, {STALE})
+        self.assertEqual(outer, {HIT, STALE, MISS})
+
+    def test_mark(self):
+        cache = PayloadCache()
+        with cache.track() as states:
+            cache.mark(STALE)
+        cache.mark(HIT)
+        self.assertEqual(states, {STALE})
+        self.assertEqual(cache.counts(), {HIT: 0, STALE: 0, MISS: 0})
+
+class TestDashboardPayloadCache(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        make_finance_db(self.db_path)
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def test_cached_payload_matches_uncached(self):
+        cache = PayloadCache()
+        expected = build_dashboard_payload(self.db_path)
+        self.assertEqual(dumps_bytes(get_dashboard_payload(self.db_path, cache)), dumps_bytes(expected))
+        self.assertEqual(list(get_dashboard_payload(self.db_path, cache)["graphs"]), list(GRAPH_KEYS))
+
+    def test_second_call_does_not_rebuild(self):
+        cache = PayloadCache()
+        get_dashboard_payload(self.db_path, cache, include_graphs=False)
+        with mock.patch.object(dashboard_service, "build_dashboard_payload") as build:
+            payload = get_dashboard_payload(self.db_path, cache, include_graphs=False)
+        build.assert_not_called()
+        self.assertIn("latest_date", payload["summary"])
+
+    def test_append_changes_version(self):
+        before = get_data_version(self.db_path)
+        df = pd.DataFrame({"date": ["2024-12-31"], "収支項目": ["給与"], "金額": [1.0],
+                           "収支タイプ": ["一般収支"], "収支カテゴリー": ["収入"], "目標": [1.0]})
+        append_to_table(self.db_path, df, "balance")
+        self.assertNotEqual(get_data_version(self.db_path), before)
+
+if __name__ == '__main__':
+    unittest.main()
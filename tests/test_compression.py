@@ -0,0 +1,57 @@
+import unittest
+import gzip
+import json
+import numpy as np
+import pandas as pd
+from unittest import mock
+from werkzeug.http import parse_accept_header
+from app.utils import compression, json_provider
+from app.utils.compression import EncodedBody, choose_encoding, GZIP, ZSTD, IDENTITY
+from app.utils.json_provider import dumps_bytes
+
+class TestChooseEncoding(unittest.TestCase):
+    def test_choose(self):
+        encodings = [ZSTD, GZIP]
+        cases = {
+            None: IDENTITY,
+            "gzip, deflate, br": GZIP,
+            "gzip, deflate, br, zstd": ZSTD,
+            "gzip;q=1.0, zstd;q=0.5": GZIP,
+            "*": ZSTD,
+            "gzip;q=0": IDENTITY,
+        }
+        for header, expected in cases.items():
+            self.assertEqual(choose_encoding(parse_accept_header(header), encodings), expected, header)
+
+    def test_zstd_requires_zstandard(self):
+        with mock.patch.object(compression, "zstandard", None):
+            self.assertEqual(choose_encoding(parse_accept_header("zstd, gzip")), GZIP)
+
+class TestEncodedBody(unittest.TestCase):
+    def test_precompressed(self):
+        body = b'{"x": [' + b"1.0, " * 1000 + b'0]}'
+        encoded = EncodedBody(body, encodings=[GZIP])
+        self.assertEqual(gzip.decompress(encoded.get(GZIP)[1]), body)
+        # 事前に圧縮していない方式は identity で返す
+        self.assertEqual(encoded.get(ZSTD), (IDENTITY, body))
+
+    def test_small_body_is_not_compressed(self):
+        self.assertEqual(EncodedBody(b"{}").get(GZIP), (IDENTITY, b"{}"))
+
+class TestDumpsBytes(unittest.TestCase):
+    def test_numpy_and_datetime(self):
+        obj = {
+            "y": np.array([1.5, np.nan]),
+            "n": np.arange(6).reshape(2, 3)[:, 0],
+            "x": np.array(["2024-01-01", "2024-01-02"]),
+            "s": np.float32(0.5),
+            "t": pd.Timestamp("2024-01-02 03:04:05"),
+        }
+        expected = {"y": [1.5, None], "n": [0, 3], "x": ["2024-01-01", "2024-01-02"], "s": 0.5,
+                    "t": "2024-01-02T03:04:05"}
+        self.assertEqual(json.loads(dumps_bytes(obj)), expected)
+        with mock.patch.object(json_provider, "orjson", None):
+            self.assertEqual(json.loads(dumps_bytes(obj)), expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+import threading
+import pandas as pd
+from app.utils import connection
+from app.utils.connection import read_connection, write_connection, close_connections
+from app.utils.data_loader import append_to_table, get_data_version, get_latest_date
+from helpers import make_finance_db
+
+class TestConnection(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        make_finance_db(self.db_path, days=10)
+
+    def tearDown(self):
+        close_connections(self.db_path)
+        os.close(self.db_fd)
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.db_path + suffix)
+            except OSError:
+                pass
+
+    def test_reader_is_reused_and_read_only(self):
+        with read_connection(self.db_path) as first:
+            pass
+        with read_connection(self.db_path) as second:
+            self.assertIs(first, second)
+            self.assertEqual(second.execute("PRAGMA temp_store").fetchone()[0], 2)
+            with self.assertRaises(sqlite3.OperationalError):
+                second.execute("DELETE FROM asset")
+
+    def test_concurrent_readers_get_separate_connections(self):
+        with read_connection(self.db_path) as a, read_connection(self.db_path) as b:
+            self.assertIsNot(a, b)
+
+    def test_writer_uses_wal(self):
+        df = pd.DataFrame({"date": ["2024-01-20"], "資産名": ["asset0"], "資産額": [1.0], "トータルリターン": [0.0]})
+        append_to_table(self.db_path, df, "asset")
+        with write_connection(self.db_path) as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(get_latest_date(self.db_path, "asset"), pd.Timestamp("2024-01-20"))
+
+    def test_read_during_write_transaction(self):
+        # 書き込みトランザクション中でも読み込みはブロックされず、コミット前のデータは見えない
+        with write_connection(self.db_path) as conn:
+            conn.execute("DELETE FROM asset")
+            result = []
+            thread = threading.Thread(target=lambda: result.append(get_latest_date(self.db_path, "asset")))
+            thread.start()
+            thread.join(timeout=5)
+            self.assertEqual(result, [pd.Timestamp("2024-01-10")])
+        self.assertIsNone(get_latest_date(self.db_path, "asset"))
+
+    def test_write_rolls_back_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with write_connection(self.db_path) as conn:
+                conn.execute("DELETE FROM asset")
+                raise RuntimeError
+        self.assertEqual(get_latest_date(self.db_path, "asset"), pd.Timestamp("2024-01-10"))
+
+    def test_reopens_recreated_file(self):
+        self.assertEqual(get_latest_date(self.db_path, "asset"), pd.Timestamp("2024-01-10"))
+        os.remove(self.db_path)
+        make_finance_db(self.db_path, days=3)
+        self.assertEqual(get_latest_date(self.db_path, "asset"), pd.Timestamp("2024-01-03"))
+
+    def test_data_version_changes_on_wal_write(self):
+        with write_connection(self.db_path):
+            pass
+        version = get_data_version(self.db_path)
+        with write_connection(self.db_path) as conn:
+            conn.execute("DELETE FROM asset WHERE date LIKE '2024-01-10%'")
+        self.assertNotEqual(get_data_version(self.db_path), version)
+
+    def test_configure(self):
+        try:
+            connection.configure(pragmas={"cache_size": -1024}, max_idle_readers=0)
+            with read_connection(self.db_path) as first:
+                self.assertEqual(first.execute("PRAGMA cache_size").fetchone()[0], -1024)
+            with read_connection(self.db_path) as second:
+                self.assertIsNot(first, second)
+            with self.assertRaises(ValueError):
+                connection.configure(pragmas={"cache_size; DROP TABLE asset": 0})
+        finally:
+            connection.configure()
+
+if __name__ == '__main__':
+    unittest.main()
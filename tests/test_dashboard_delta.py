@@ -0,0 +1,82 @@
+import unittest
+import os
+import json
+import sqlite3
+import tempfile
+import numpy as np
+from app import create_app
+from app.routes.dashboard_service import build_dashboard_payload, build_dashboard_delta, GRAPH_KEYS
+from app.utils.json_provider import dumps_bytes
+from helpers import make_finance_db
+
+def apply_delta(figure, delta):
+    """dashboard.js の applyGraphDelta と同じ手順で差分を反映する"""
+    for trace in delta["traces"]:
+        target = next(t for t in figure["data"] if t["uid"] == trace["uid"])
+        keep = [i for i, x in enumerate(target["x"]) if x < delta["replace_from"]]
+        target["x"] = [target["x"][i] for i in keep] + trace["x"]
+        target["y"] = [target["y"][i] for i in keep] + trace["y"]
+
+class TestDashboardDelta(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=75)
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def _payload_until(self, cutoff):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            with sqlite3.connect(self.db_path) as src, sqlite3.connect(path) as dst:
+                src.backup(dst)
+                dst.execute("DELETE FROM asset WHERE date > ?", (cutoff,))
+                dst.execute("DELETE FROM balance WHERE date > ?", (cutoff,))
+            return build_dashboard_payload(path)
+        finally:
+            os.remove(path)
+
+    def test_delta_extends_old_payload_to_latest(self):
+        old = self._payload_until("2024-02-15 00:00:00")
+        latest = build_dashboard_payload(self.db_path)
+        delta = build_dashboard_delta(self.db_path, "2024-02-15")
+
+        self.assertEqual(delta["latest_date"], "2024-03-15")
+        self.assertEqual(delta["graphs"]["assets"]["replace_from"], "2024-02-16")
+        self.assertEqual(delta["graphs"]["special_balance"]["replace_from"], "2024-02")
+        self.assertEqual(len(delta["graphs"]["assets"]["traces"][0]["x"]), 29)
+
+        for key in GRAPH_KEYS:
+            figure = json.loads(dumps_bytes(old["graphs"][key]))
+            apply_delta(figure, delta["graphs"][key])
+            expected = json.loads(dumps_bytes(latest["graphs"][key]))
+            for got, want in zip(figure["data"], expected["data"]):
+                self.assertEqual(got["x"], want["x"], key)
+                np.testing.assert_allclose(got["y"], want["y"], err_msg=key)
+
+    def test_delta_without_new_data_is_empty(self):
+        delta = build_dashboard_delta(self.db_path, "2024-03-15")
+        self.assertEqual(delta["latest_date"], "2024-03-15")
+        self.assertEqual(delta["graphs"]["assets"]["traces"][0]["x"], [])
+
+    def test_graphs_endpoint_since(self):
+        app = create_app()
+        app.config['DATABASE_PATH'] = os.path.dirname(self.db_path)
+        app.config['DATABASE'] = {'finance': os.path.basename(self.db_path)}
+        client = app.test_client()
+
+        response = client.get('/api/dashboard/graphs?since=2024-03-10')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data["graphs"]["returns"]["traces"][0]["x"][0], "2024-03-11")
+
+        response = client.get('/api/dashboard/graphs?since=yesterday-ish')
+        self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
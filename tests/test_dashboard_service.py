@@ -0,0 +1,159 @@
+import unittest
+import os
+import tempfile
+import pandas as pd
+from unittest import mock
+from app.routes import dashboard_service
+from app.routes.dashboard_service import (
+    GRAPH_KEYS, build_summary, build_summary_from_db, build_dashboard_payload, build_graph,
+    get_dashboard_bootstrap, get_dashboard_graph, parse_window, read_table_from_db,
+)
+from app.utils import data_store
+from app.utils.cache import PayloadCache
+from app.utils.db_schema import migrate
+from app.utils.json_provider import dumps_bytes
+from helpers import make_finance_db
+
+class TestSummaryFromDb(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=50)
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def test_matches_full_table_summary(self):
+        df_asset_profit, _, df_target = read_table_from_db(self.db_path)
+        expected = build_summary(df_asset_profit, df_target)
+        for migrated in (False, True):
+            if migrated:
+                migrate(self.db_path)
+            summary = build_summary_from_db(self.db_path)
+            self.assertEqual({k: summary[k] for k in expected}, expected)
+
+    def test_changes(self):
+        changes = build_summary_from_db(self.db_path)["changes"]
+        # 資産額は2資産合計で1日あたり 1000 + 2000 増える
+        self.assertEqual(changes["1d"], {"date": "2024/02/18", "total_assets": 3000, "total_returns": 30})
+        self.assertEqual(changes["1w"]["date"], "2024/02/12")
+        self.assertEqual(changes["1w"]["total_assets"], 21000)
+        self.assertEqual(changes["1m"]["date"], "2024/01/19")
+
+    def test_change_before_history_is_none(self):
+        make_finance_db(self.db_path, days=3)
+        changes = build_summary_from_db(self.db_path)["changes"]
+        self.assertIsNotNone(changes["1d"])
+        self.assertIsNone(changes["1w"])
+        self.assertIsNone(changes["1m"])
+
+    def test_summary_payload_does_not_read_tables(self):
+        with mock.patch.object(dashboard_service, "read_table_from_db") as read:
+            payload = build_dashboard_payload(self.db_path, include_graphs=False)
+        read.assert_not_called()
+        self.assertEqual(payload["summary"]["latest_date"], "2024/02/19")
+
+class TestGraphs(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=70)
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def test_build_graph_matches_payload(self):
+        graphs = build_dashboard_payload(self.db_path, include_summary=False)["graphs"]
+        for key in GRAPH_KEYS:
+            self.assertEqual(dumps_bytes(build_graph(self.db_path, key)), dumps_bytes(graphs[key]), key)
+
+    def test_build_graph_reads_only_needed_tables(self):
+        expected = {
+            "assets": ["asset", "target"],
+            "general_balance": ["balance"],
+            "special_income_expenditure": ["balance"],
+        }
+        for key, tables in expected.items():
+            with mock.patch.object(dashboard_service, "get_df_from_db", wraps=dashboard_service.get_df_from_db) as read:
+                build_graph(self.db_path, key)
+            self.assertEqual([c.kwargs["table_name"] for c in read.call_args_list], tables, key)
+        self.assertEqual(read.call_args.kwargs["filters"], {"収支タイプ": "特別収支"})
+
+    def test_unknown_graph(self):
+        with self.assertRaises(ValueError):
+            build_graph(self.db_path, "unknown")
+
+    def test_max_points(self):
+        full = build_graph(self.db_path, "assets")
+        graph = build_graph(self.db_path, "assets", max_points=20)
+        self.assertEqual(len(full["data"][0]["x"]), 70)
+        for trace, full_trace in zip(graph["data"], full["data"]):
+            self.assertEqual(len(trace["x"]), 20)
+            self.assertEqual((trace["x"][0], trace["x"][-1]), (full_trace["x"][0], full_trace["x"][-1]))
+        # 月次のグラフは間引かない
+        self.assertEqual(dumps_bytes(build_graph(self.db_path, "general_balance", max_points=3)),
+                         dumps_bytes(build_graph(self.db_path, "general_balance")))
+
+    def test_window(self):
+        window = parse_window("2024-02-01", "2024-02-10")
+        graph = build_graph(self.db_path, "returns", max_points=1000, window=window)
+        self.assertEqual(graph["data"][0]["x"].tolist(), pd.date_range("2024-02-01", "2024-02-10").strftime("%Y-%m-%d").tolist())
+        graph = build_graph(self.db_path, "special_balance", window=window)
+        full = build_graph(self.db_path, "special_balance")
+        self.assertEqual(graph["data"][0]["x"].tolist(), ["2024-02"])
+        self.assertEqual(graph["data"][0]["y"].tolist(), full["data"][0]["y"][1:2].tolist())
+
+    def test_windowed_payload_matches_full(self):
+        window = parse_window("2024-01-20", "2024-02-10")
+        graphs = build_dashboard_payload(self.db_path, include_summary=False, window=window)["graphs"]
+        full = build_dashboard_payload(self.db_path, include_summary=False)["graphs"]
+        for key in GRAPH_KEYS:
+            self.assertEqual(dumps_bytes(build_graph(self.db_path, key, window=window)), dumps_bytes(graphs[key]), key)
+            monthly = len(full[key]["data"][0]["x"][0]) == 7
+            expected_x = ["2024-01", "2024-02"] if monthly else \
+                pd.date_range("2024-01-20", "2024-02-10").strftime("%Y-%m-%d").tolist()
+            for trace, full_trace in zip(graphs[key]["data"], full[key]["data"]):
+                self.assertEqual(trace["x"].tolist(), expected_x, key)
+                keep = [x in expected_x for x in full_trace["x"].tolist()]
+                # 特別収支の累積も全期間で計算した値と一致する(開始月より前の合計が初期値になる)
+                self.assertEqual(trace["y"].tolist(), full_trace["y"][keep].tolist(), key)
+
+    def test_window_reads_only_window(self):
+        window = parse_window("2024-02-01", None)
+        with mock.patch.object(dashboard_service, "get_df_from_db", wraps=dashboard_service.get_df_from_db) as read, \
+             mock.patch.object(data_store, "get_df_from_db", wraps=data_store.get_df_from_db) as table_read:
+            build_dashboard_payload(self.db_path, include_summary=False, window=window)
+            build_graph(self.db_path, "special_balance", window=window)
+        calls = read.call_args_list + table_read.call_args_list
+        self.assertEqual(len(calls), 6)
+        for call in calls:
+            self.assertIn("date", call.kwargs["filters"], call.kwargs["table_name"])
+
+    def test_parse_window(self):
+        self.assertIsNone(parse_window())
+        self.assertEqual(parse_window(None, "2024-01-31"), (None, pd.Timestamp("2024-01-31")))
+        with self.assertRaises(ValueError):
+            parse_window("2024-02-01", "2024-01-01")
+
+    def test_graph_cache_entries_per_max_points(self):
+        cache = PayloadCache()
+        small = get_dashboard_graph(self.db_path, "assets", cache, max_points=10)
+        self.assertEqual(len(get_dashboard_graph(self.db_path, "assets", cache)["data"][0]["x"]), 70)
+        self.assertIs(get_dashboard_graph(self.db_path, "assets", cache, max_points=10), small)
+        # 間引かないグラフは max_points に関わらず同じエントリ
+        self.assertIs(get_dashboard_graph(self.db_path, "general_balance", cache, max_points=10),
+                      get_dashboard_graph(self.db_path, "general_balance", cache))
+
+    def test_bootstrap(self):
+        payload = get_dashboard_bootstrap(self.db_path, graph_key="general_balance")
+        self.assertEqual(payload["summary"], build_summary_from_db(self.db_path))
+        self.assertEqual(list(payload["graphs"]), ["general_balance"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,8 @@ import pandas as pd
 import os
 import sqlite3
 import tempfile
-from app.utils.data_loader import append_to_table
+from app.utils.data_loader import append_to_table, get_df_from_db, build_where_clause
+from helpers import make_finance_db
 
 class TestDataLoader(unittest.TestCase):
     def setUp(self):
@@ -33,5 +34,52 @@ class TestDataLoader(unittest.TestCase):
             df_read = pd.read_sql_query("SELECT * FROM test_table", conn)
         self.assertEqual(len(df_read), 2)
 
+class TestGetDfFromDb(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=40)
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def _read(self, **kwargs):
+        params = dict(db_path=self.db_path, table_name="balance", index_col="date",
+                      columns_col=["収支タイプ", "収支カテゴリー"], values_col=["金額", "目標"], set_index=True)
+        params.update(kwargs)
+        return get_df_from_db(**params)
+
+    def test_pushdown_matches_pandas(self):
+        for aggfunc in ["sum", "count", "max", "mean"]:
+            pd.testing.assert_frame_equal(
+                self._read(aggfunc=aggfunc, pushdown=True),
+                self._read(aggfunc=aggfunc, pushdown=False),
+            )
+
+    def test_mixed_date_formats_are_merged(self):
+        df = pd.DataFrame({"date": ["2024-01-01"], "収支項目": ["給与"], "金額": [1.0],
+                           "収支タイプ": ["一般収支"], "収支カテゴリー": ["収入"], "目標": [0.0]})
+        append_to_table(self.db_path, df, "balance")
+        result = self._read()
+        self.assertFalse(result.reset_index().duplicated(["date", "収支タイプ", "収支カテゴリー"]).any())
+        row = result.reset_index().query("date == @pd.Timestamp('2024-01-01') and 収支タイプ == '一般収支' and 収支カテゴリー == '収入'")
+        self.assertEqual(row["金額"].tolist(), [10001.0])
+
+    def test_filters(self):
+        result = self._read(columns_col=None, values_col="金額",
+                            filters={"収支タイプ": "特別収支", "date": ("range", pd.Timestamp("2024-01-05"), pd.Timestamp("2024-01-11"))})
+        self.assertEqual(len(result), 6)
+        self.assertTrue((result["金額"] == 500.0).all())
+
+    def test_build_where_clause(self):
+        where, params = build_where_clause({"a": [1, 2], "b": (">", 3), "c": "x"})
+        self.assertEqual(where, ' WHERE "a" IN (?, ?) AND "b" > ? AND "c" = ?')
+        self.assertEqual(params, [1, 2, 3, "x"])
+        with self.assertRaises(ValueError):
+            build_where_clause({"a": ("; DROP", 1)})
+
 if __name__ == '__main__':
     unittest.main()
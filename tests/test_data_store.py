@@ -0,0 +1,116 @@
+import unittest
+import os
+import tempfile
+from unittest import mock
+import numpy as np
+import pandas as pd
+from app.routes.dashboard_service import (
+    GRAPH_KEYS, build_dashboard_delta, build_dashboard_payload, build_graph, build_summary_from_db
+)
+from app.utils import data_store
+from app.utils.connection import close_connections
+from app.utils.data_loader import append_to_table
+from app.utils.json_provider import dumps_bytes
+from helpers import make_finance_db
+
+class TestDataStore(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=120)
+
+    def tearDown(self):
+        data_store.unregister()
+        close_connections(self.db_path)
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def _from_db_and_store(self, build):
+        expected = build()
+        data_store.register(self.db_path)
+        return expected, build()
+
+    def test_unregistered(self):
+        self.assertIsNone(data_store.snapshot(self.db_path))
+        self.assertIsNone(data_store.refresh(self.db_path))
+        self.assertFalse(data_store.is_registered(self.db_path))
+
+    def test_payload_matches_db(self):
+        expected, actual = self._from_db_and_store(lambda: build_dashboard_payload(self.db_path))
+        self.assertEqual(dumps_bytes(actual), dumps_bytes(expected))
+
+    def test_summary_matches_db(self):
+        expected, actual = self._from_db_and_store(lambda: build_summary_from_db(self.db_path))
+        self.assertEqual(actual, expected)
+
+    def test_payload_window_matches_db(self):
+        window = (pd.Timestamp("2024-02-10"), pd.Timestamp("2024-03-20"))
+        expected, actual = self._from_db_and_store(
+            lambda: build_dashboard_payload(self.db_path, include_summary=False, window=window))
+        self.assertEqual(dumps_bytes(actual), dumps_bytes(expected))
+
+    def test_graph_window_matches_db(self):
+        window = (pd.Timestamp("2024-02-10"), pd.Timestamp("2024-03-20"))
+        build = lambda: {key: build_graph(self.db_path, key, window=window) for key in GRAPH_KEYS}
+        expected, actual = self._from_db_and_store(build)
+        self.assertEqual(dumps_bytes(actual), dumps_bytes(expected))
+
+    def test_delta_matches_db(self):
+        expected, actual = self._from_db_and_store(lambda: build_dashboard_delta(self.db_path, "2024-03-15"))
+        self.assertEqual(dumps_bytes(actual), dumps_bytes(expected))
+
+    def test_steady_state_does_not_read_db(self):
+        data_store.register(self.db_path)
+        data_store.snapshot(self.db_path)
+        with mock.patch("app.utils.data_store.get_df_from_db") as store_read, \
+             mock.patch("app.routes.dashboard_service.get_df_from_db") as service_read, \
+             mock.patch("app.routes.dashboard_service.get_latest_date") as latest_read:
+            build_dashboard_payload(self.db_path)
+            build_dashboard_delta(self.db_path, "2024-03-15")
+            build_graph(self.db_path, "special_balance")
+        store_read.assert_not_called()
+        service_read.assert_not_called()
+        latest_read.assert_not_called()
+
+    def test_reloads_when_data_changes(self):
+        data_store.register(self.db_path)
+        before = data_store.snapshot(self.db_path)
+        self.assertIs(data_store.snapshot(self.db_path), before)
+
+        append_to_table(self.db_path, pd.DataFrame({
+            "date": ["2024-04-30 00:00:00"], "資産名": ["extra"],
+            "資産額": [1000.0], "トータルリターン": [10.0],
+        }), "asset")
+        after = data_store.snapshot(self.db_path)
+        self.assertIsNot(after, before)
+        self.assertNotEqual(after.version, before.version)
+        self.assertEqual(after.latest_date("asset"), pd.Timestamp("2024-04-30"))
+        # 入れ替え前の Snapshot は変更されない
+        self.assertEqual(before.latest_date("asset"), pd.Timestamp("2024-04-29"))
+
+    def test_refresh_swaps_snapshot(self):
+        data_store.register(self.db_path)
+        before = data_store.snapshot(self.db_path)
+        after = data_store.refresh(self.db_path)
+        self.assertIsNot(after, before)
+        self.assertIs(data_store.snapshot(self.db_path), after)
+
+    def test_stats(self):
+        data_store.register(self.db_path)
+        self.assertEqual(data_store.stats(), [{"db_path": os.path.abspath(self.db_path), "loaded": False}])
+        snap = data_store.snapshot(self.db_path)
+        stats, = data_store.stats()
+        self.assertTrue(stats["loaded"])
+        self.assertEqual(stats["rows"]["asset"], 120)
+        self.assertEqual(stats["nbytes"], snap.nbytes)
+        self.assertGreater(stats["nbytes"], 0)
+        self.assertGreaterEqual(stats["load_sec"], 0)
+
+    def test_frames_are_copies(self):
+        data_store.register(self.db_path)
+        snap = data_store.snapshot(self.db_path)
+        df_asset_profit, _, _ = snap.frames()
+        df_asset_profit["資産額"] = np.nan
+        self.assertFalse(snap.asset["資産額"].isna().any())
+
+if __name__ == "__main__":
+    unittest.main()
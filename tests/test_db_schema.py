@@ -0,0 +1,80 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+import pandas as pd
+from app.utils.db_schema import migrate, get_schema_version, SCHEMA_VERSION, SchemaMigrationError
+from app.utils.data_loader import append_to_table, build_aggregate_query
+from helpers import make_finance_db
+
+class TestMigrate(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def test_migrate_existing_db_in_place(self):
+        make_finance_db(self.db_path, days=10)
+        # 日付表記が異なる行は正規化される
+        df = pd.DataFrame({"date": ["2024-02-01"], "収支項目": ["給与"], "金額": [1.0],
+                           "収支タイプ": ["一般収支"], "収支カテゴリー": ["収入"], "目標": [0.0]})
+        append_to_table(self.db_path, df, "balance")
+
+        self.assertEqual(migrate(self.db_path), SCHEMA_VERSION)
+
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM asset").fetchone()[0], 20)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM balance").fetchone()[0], 41)
+            row = conn.execute("SELECT date, 金額 FROM balance WHERE 収支項目 = '給与' ORDER BY date DESC LIMIT 1").fetchone()
+            self.assertEqual(row, ("2024-02-01 00:00:00", 1.0))
+            sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'asset'").fetchone()[0]
+            self.assertIn("WITHOUT ROWID", sql)
+            with self.assertRaises(sqlite3.IntegrityError):
+                conn.execute("INSERT INTO asset (date, 資産名) VALUES ('2024-01-01 00:00:00', 'asset0')")
+
+    def test_migrate_is_idempotent_and_creates_empty_tables(self):
+        self.assertEqual(migrate(self.db_path), SCHEMA_VERSION)
+        self.assertEqual(migrate(self.db_path, reapply=True), SCHEMA_VERSION)
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(get_schema_version(conn), SCHEMA_VERSION)
+            tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertTrue({"asset", "balance", "target"} <= tables)
+
+    def test_dashboard_queries_use_covering_index(self):
+        make_finance_db(self.db_path, days=10)
+        migrate(self.db_path)
+        query, params = build_aggregate_query(
+            "balance", ["date", "収支タイプ", "収支カテゴリー"], ["金額", "目標"],
+            filters={"date": (">", pd.Timestamp("2024-01-05"))})
+        with sqlite3.connect(self.db_path) as conn:
+            plan = " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + query, params))
+        self.assertIn("SEARCH balance USING COVERING INDEX", plan)
+
+    def test_missing_key_column_is_rejected(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("CREATE TABLE asset (date TEXT, value INTEGER)")
+        with self.assertRaises(SchemaMigrationError):
+            migrate(self.db_path)
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(get_schema_version(conn), 0)
+
+    def test_duplicate_keys_are_rejected(self):
+        make_finance_db(self.db_path, days=10)
+        # 日付表記が異なるだけの重複行は、正規化すると主キーが重複する
+        df = pd.DataFrame({"date": ["2024-01-01"], "収支項目": ["給与"], "金額": [1.0],
+                           "収支タイプ": ["一般収支"], "収支カテゴリー": ["収入"], "目標": [0.0]})
+        append_to_table(self.db_path, df, "balance")
+        with self.assertRaisesRegex(SchemaMigrationError, "2024-01-01 00:00:00', '給与'"):
+            migrate(self.db_path)
+        # 行を捨てずに元のまま残す
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(get_schema_version(conn), 0)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM balance").fetchone()[0], 41)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+import numpy as np
+import pandas as pd
+from app.utils.downsample import lttb_indices
+
+class TestLttb(unittest.TestCase):
+    def test_keeps_ends_and_count(self):
+        x = np.arange(1000)
+        y = np.sin(x / 50.0)
+        idx = lttb_indices(x, y, 100)
+        self.assertEqual(len(idx), 100)
+        self.assertEqual((idx[0], idx[-1]), (0, 999))
+        self.assertTrue(np.all(np.diff(idx) > 0))
+
+    def test_keeps_spikes(self):
+        y = np.zeros(10000)
+        y[1234], y[8765] = 100.0, -100.0
+        idx = lttb_indices(np.arange(10000), y, 50)
+        self.assertIn(1234, idx)
+        self.assertIn(8765, idx)
+
+    def test_short_series_is_unchanged(self):
+        np.testing.assert_array_equal(lttb_indices(np.arange(5), np.arange(5), 10), np.arange(5))
+        np.testing.assert_array_equal(lttb_indices(np.arange(5), np.arange(5), 2), np.arange(5))
+
+    def test_datetime_x(self):
+        x = pd.date_range("2000-01-01", periods=5000, freq="D").values
+        y = np.cumsum(np.random.default_rng(0).normal(size=5000))
+        idx = lttb_indices(x, y, 500)
+        self.assertEqual(len(idx), 500)
+        self.assertIn(int(np.argmax(y)), idx)
+
+if __name__ == '__main__':
+    unittest.main()
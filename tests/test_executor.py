@@ -0,0 +1,75 @@
+import unittest
+import os
+import tempfile
+import threading
+from app.routes.dashboard_service import build_dashboard_payload
+from app.utils import executor
+from app.utils.connection import close_connections
+from app.utils.executor import CPU, IO, gather
+from app.utils.json_provider import dumps_bytes
+from helpers import make_finance_db
+
+class TestGather(unittest.TestCase):
+    def setUp(self):
+        executor.configure(io_workers=4, cpu_workers=4)
+
+    def tearDown(self):
+        executor.configure()
+
+    def test_keeps_order(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def call(i):
+            # 3つが同時に実行されていないと Barrier を抜けられない
+            barrier.wait()
+            return i, threading.current_thread().name
+
+        results = gather([lambda i=i: call(i) for i in range(3)], IO)
+        self.assertEqual([i for i, _ in results], [0, 1, 2])
+        self.assertTrue(all(name.startswith("dashboard-io") for _, name in results))
+
+    def test_sequential_when_single_worker(self):
+        executor.configure(io_workers=1)
+        names = gather([lambda: threading.current_thread().name] * 2, IO)
+        self.assertEqual(names, [threading.current_thread().name] * 2)
+
+    def test_raises_first_error(self):
+        def fail(message):
+            raise ValueError(message)
+
+        with self.assertRaisesRegex(ValueError, "first"):
+            gather([lambda: 1, lambda: fail("first"), lambda: fail("second")], CPU)
+
+    def test_nested(self):
+        # プールのスレッドから同じプールを使っても止まらない
+        results = gather([lambda: gather([lambda: 1, lambda: 2], CPU)] * 6, CPU)
+        self.assertEqual(results, [[1, 2]] * 6)
+
+    def test_unknown_pool(self):
+        with self.assertRaises(ValueError):
+            gather([lambda: 1], "gpu")
+
+class TestParallelPayload(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=120)
+
+    def tearDown(self):
+        executor.configure()
+        close_connections(self.db_path)
+        os.close(self.db_fd)
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def test_same_as_sequential(self):
+        executor.configure(io_workers=1, cpu_workers=1)
+        expected = build_dashboard_payload(self.db_path, max_points=50)
+        executor.configure(io_workers=4, cpu_workers=4)
+        payload = build_dashboard_payload(self.db_path, max_points=50)
+        self.assertEqual(list(payload["graphs"]), list(expected["graphs"]))
+        self.assertEqual(dumps_bytes(payload), dumps_bytes(expected))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+import json
+import numpy as np
+import pandas as pd
+from unittest import mock
+from app.utils import json_provider
+from app.routes.figure_builder import figure_json, scatter, bar, format_dates
+from benchmarks.bench_figure_builder import plotly_figure_json
+
+class TestFigureJson(unittest.TestCase):
+    def setUp(self):
+        index = pd.date_range("2024-01-01", periods=5, freq="D")
+        self.x = format_dates(index, "D")
+        self.traces = [
+            bar(self.x, np.array([1.0, 2.5, -3.0, 4.0, 0.1]), "収入実績", "g:収入実績"),
+            scatter(self.x, np.arange(5), "収支目標", "g:収支目標", mode="lines+markers", fill="tozeroy"),
+        ]
+
+    def _assert_same_as_plotly(self):
+        fast = json.loads(figure_json(self.traces, "g", "日付", "金額"))
+        slow = json.loads(plotly_figure_json(self.traces, "g", "日付", "金額"))
+        self.assertEqual(fast, slow)
+
+    def test_matches_plotly_output(self):
+        self._assert_same_as_plotly()
+
+    def test_matches_plotly_output_without_orjson(self):
+        with mock.patch.object(json_provider, "orjson", None):
+            self._assert_same_as_plotly()
+
+    def test_format_dates(self):
+        self.assertEqual(self.x.tolist()[:2], ["2024-01-01", "2024-01-02"])
+        months = format_dates(pd.date_range("2024-01-31", periods=2, freq="ME"), "M")
+        self.assertEqual(months.tolist(), ["2024-01", "2024-02"])
+
+    def test_empty_traces(self):
+        empty = [scatter(format_dates([], "D"), np.array([], dtype=float), "a", "g:a")]
+        data = json.loads(figure_json(empty, "g", "日付", "金額"))["data"]
+        self.assertEqual((data[0]["x"], data[0]["y"]), ([], []))
+
+if __name__ == '__main__':
+    unittest.main()
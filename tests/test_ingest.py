@@ -0,0 +1,168 @@
+import unittest
+import io
+import os
+import sqlite3
+import tempfile
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from app.utils.connection import close_connections
+from app.utils.db_schema import migrate
+from app.utils.ingest import ARROW, PARQUET, UPSERT, IngestError, detect_format, ingest_files
+from helpers import make_finance_db
+
+ASSET_HEADER = "date,資産名,資産タイプ,資産額,トータルリターン\n"
+BALANCE_HEADER = "date,収支項目,金額,収支タイプ,収支カテゴリー,目標\n"
+
+def asset_csv(days, start=1):
+    rows = [f"2024-03-{d:02d},asset0,リスク資産,{1000.0 * d},{10.0 * d}\n" for d in range(start, start + days)]
+    return io.BytesIO((ASSET_HEADER + "".join(rows)).encode("utf-8"))
+
+def asset_frame(days):
+    return pd.DataFrame({
+        "date": pd.date_range("2024-03-01", periods=days),
+        "資産名": ["asset0"] * days,
+        "資産タイプ": ["リスク資産"] * days,
+        "資産額": range(1000, 1000 * (days + 1), 1000),  # 整数列も REAL として取り込む
+        "トータルリターン": [1.5] * days,
+    })
+
+def arrow_stream(df):
+    sink = pa.BufferOutputStream()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return io.BytesIO(sink.getvalue().to_pybytes())
+
+def parquet_file(df):
+    buf = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), buf, row_group_size=2)
+    buf.seek(0)
+    return buf
+
+class TestIngest(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        make_finance_db(self.db_path, days=10)
+        migrate(self.db_path)
+
+    def tearDown(self):
+        close_connections(self.db_path)
+        os.close(self.db_fd)
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.db_path + suffix)
+            except OSError:
+                pass
+
+    def _query(self, sql):
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute(sql).fetchall()
+
+    def test_chunked_ingest_of_two_files(self):
+        balance = io.BytesIO((BALANCE_HEADER + "2024-03-01,給与,100,一般収支,収入,\n").encode("utf-8"))
+        result = ingest_files(self.db_path, {"asset": asset_csv(7), "balance": balance}, chunk_rows=3)
+        self.assertEqual(result["counts"], {"asset": 7, "balance": 1})
+        self.assertEqual(result["rows"], 8)
+        self.assertGreater(result["rows_per_sec"], 0)
+
+        rows = self._query("SELECT date, 資産額, 資産カテゴリー FROM asset WHERE date >= '2024-03' ORDER BY date")
+        self.assertEqual(rows[0], ("2024-03-01 00:00:00", 1000.0, None))
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(self._query("SELECT 目標 FROM balance WHERE date = '2024-03-01 00:00:00'"), [(None,)])
+        # ロールアップはトリガーで更新される
+        self.assertEqual(self._query("SELECT 資産額 FROM asset_daily_total WHERE date = '2024-03-07'"), [(7000.0,)])
+
+    def test_error_rolls_back_every_file(self):
+        balance = io.BytesIO((BALANCE_HEADER + "not a date,給与,100,一般収支,収入,0\n").encode("utf-8"))
+        with self.assertRaises(IngestError):
+            ingest_files(self.db_path, {"asset": asset_csv(5), "balance": balance}, chunk_rows=2)
+        self.assertEqual(self._query("SELECT COUNT(*) FROM asset WHERE date >= '2024-03'"), [(0,)])
+
+    def test_duplicate_key(self):
+        result = ingest_files(self.db_path, {"asset": asset_csv(3), "balance": io.BytesIO(b"")})
+        self.assertEqual(result["counts"], {"asset": 3, "balance": 0})
+        # 重複する行があれば、重複しない行も含めて何も書き込まない
+        with self.assertRaises(IngestError):
+            ingest_files(self.db_path, {"asset": asset_csv(5, start=2)}, chunk_rows=2)
+        self.assertEqual(self._query("SELECT COUNT(*) FROM asset WHERE date >= '2024-03'"), [(3,)])
+
+    def test_unknown_column(self):
+        csv = io.BytesIO("date,資産名,unknown\n2024-03-01,asset0,1\n".encode("utf-8"))
+        with self.assertRaises(IngestError):
+            ingest_files(self.db_path, {"asset": csv})
+
+    def test_header_only(self):
+        result = ingest_files(self.db_path, {"asset": io.BytesIO(ASSET_HEADER.encode("utf-8"))})
+        self.assertEqual(result["counts"], {"asset": 0})
+
+    def test_upsert(self):
+        ingest_files(self.db_path, {"asset": asset_csv(3)})
+        # 3/2 の値を変更し、3/4 を追加して 3/1〜3/4 を送り直す
+        text = asset_csv(4).getvalue().decode("utf-8").replace("2024-03-02,asset0,リスク資産,2000.0",
+                                                               "2024-03-02,asset0,リスク資産,2500.0")
+        csv = io.BytesIO(text.encode("utf-8"))
+        result = ingest_files(self.db_path, {"asset": csv}, chunk_rows=3, mode=UPSERT)
+        self.assertEqual(result["changes"]["asset"], {"inserted": 1, "updated": 1, "unchanged": 2})
+        self.assertEqual(result["counts"], {"asset": 2})
+        self.assertEqual(self._query("SELECT COUNT(*) FROM asset WHERE date >= '2024-03'"), [(4,)])
+        self.assertEqual(self._query("SELECT 資産額 FROM asset WHERE date = '2024-03-02 00:00:00'"), [(2500.0,)])
+        # ロールアップにも差分が反映される
+        self.assertEqual(self._query("SELECT 資産額, row_count FROM asset_daily_total WHERE date = '2024-03-02'"),
+                         [(2500.0, 1)])
+
+        # 同じ内容を送り直しても何も変わらない
+        result = ingest_files(self.db_path, {"asset": asset_csv(1, start=4)}, mode=UPSERT)
+        self.assertEqual(result["changes"]["asset"], {"inserted": 0, "updated": 0, "unchanged": 1})
+
+    def test_upsert_duplicate_keys_in_chunk(self):
+        text = ASSET_HEADER + "2024-03-01,asset0,リスク資産,1000.0,1.0\n2024-03-01,asset0,リスク資産,1500.0,1.0\n"
+        result = ingest_files(self.db_path, {"asset": io.BytesIO(text.encode("utf-8"))}, mode=UPSERT)
+        self.assertEqual(result["changes"]["asset"], {"inserted": 1, "updated": 0, "unchanged": 1})
+        self.assertEqual(self._query("SELECT 資産額 FROM asset WHERE date >= '2024-03'"), [(1500.0,)])
+        self.assertEqual(self._query("SELECT 資産額, row_count FROM asset_daily_total WHERE date = '2024-03-01'"),
+                         [(1500.0, 1)])
+
+    def test_upsert_resent_floats_are_unchanged(self):
+        # 既定の float パーサーでは元の値に戻らない値
+        text = ASSET_HEADER + "2024-03-01,asset0,リスク資産,228762.22127045266,945270.6955539223\n"
+        ingest_files(self.db_path, {"asset": io.BytesIO(text.encode("utf-8"))}, mode=UPSERT)
+        self.assertEqual(self._query("SELECT 資産額 FROM asset WHERE date >= '2024-03'"), [(228762.22127045266,)])
+        result = ingest_files(self.db_path, {"asset": io.BytesIO(text.encode("utf-8"))}, mode=UPSERT)
+        self.assertEqual(result["changes"]["asset"], {"inserted": 0, "updated": 0, "unchanged": 1})
+
+    def test_upsert_requires_primary_key(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("CREATE TABLE plain (date TEXT, value REAL)")
+        csv = io.BytesIO(b"date,value\n2024-03-01,1\n")
+        with self.assertRaises(IngestError):
+            ingest_files(self.db_path, {"plain": csv}, mode=UPSERT)
+        with self.assertRaises(IngestError):
+            ingest_files(self.db_path, {"asset": asset_csv(1)}, mode="replace")
+
+    def test_arrow_and_parquet(self):
+        result = ingest_files(self.db_path, {"asset": arrow_stream(asset_frame(5)), "balance": parquet_file(
+            pd.DataFrame({"date": pd.to_datetime(["2024-03-01", "2024-03-02", "2024-03-03"]),
+                          "収支項目": ["給与", "家賃", "食費"], "金額": [100.0, -50.0, None],
+                          "収支タイプ": ["一般収支"] * 3, "収支カテゴリー": ["収入", "支出", "支出"]})
+        )}, chunk_rows=2, formats={"asset": ARROW, "balance": PARQUET})
+        self.assertEqual(result["counts"], {"asset": 5, "balance": 3})
+        self.assertEqual(self._query("SELECT date, 資産額, typeof(資産額) FROM asset WHERE date = '2024-03-05 00:00:00'"),
+                         [("2024-03-05 00:00:00", 5000.0, "real")])
+        self.assertEqual(self._query("SELECT 金額 FROM balance WHERE 収支項目 = '食費' AND date >= '2024-03-03'"), [(None,)])
+
+    def test_arrow_invalid(self):
+        with self.assertRaises(IngestError):
+            ingest_files(self.db_path, {"asset": io.BytesIO(b"not arrow")}, formats={"asset": ARROW})
+        frame = asset_frame(1).rename(columns={"資産額": "unknown"})
+        with self.assertRaises(IngestError):
+            ingest_files(self.db_path, {"asset": arrow_stream(frame)}, formats={"asset": ARROW})
+
+    def test_detect_format(self):
+        self.assertEqual(detect_format("application/vnd.apache.arrow.stream"), ARROW)
+        self.assertEqual(detect_format("application/octet-stream", "diff.parquet"), PARQUET)
+        self.assertEqual(detect_format(None, "diff_asset_profit.csv"), "csv")
+        self.assertEqual(detect_format("application/octet-stream"), "csv")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from app.utils.connection import close_connections
+from app.utils.jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.dir, "jobs.db")
+        self.queues = []
+
+    def tearDown(self):
+        for queue in self.queues:
+            queue.stop()
+        close_connections(self.db_path)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def make_queue(self, handler, **kwargs):
+        queue = JobQueue(self.db_path, handler, poll_interval=0.05, **kwargs)
+        self.queues.append(queue)
+        return queue
+
+    def wait(self, queue, job_id, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = queue.get(job_id)
+            if job["status"] in (SUCCEEDED, FAILED):
+                return job
+            time.sleep(0.01)
+        self.fail(f"job did not finish: {job}")
+
+    def test_runs_jobs_in_order(self):
+        order = []
+
+        def handler(payload, progress):
+            progress({"step": 1})
+            order.append(payload["n"])
+            return {"double": payload["n"] * 2}
+
+        queue = self.make_queue(handler)
+        ids = [queue.submit({"n": n}) for n in range(3)]
+        jobs = [self.wait(queue, job_id) for job_id in ids]
+        self.assertEqual(order, [0, 1, 2])
+        self.assertEqual([job["result"] for job in jobs], [{"double": 0}, {"double": 2}, {"double": 4}])
+        self.assertEqual(jobs[0]["progress"], {"step": 1})
+        self.assertGreaterEqual(jobs[0]["elapsed_sec"], 0)
+        self.assertIsNone(queue.get("unknown"))
+
+    def test_failed_job(self):
+        def handler(payload, progress):
+            raise ValueError("broken file")
+
+        queue = self.make_queue(handler)
+        job = self.wait(queue, queue.submit({}))
+        self.assertEqual(job["status"], FAILED)
+        self.assertEqual(job["error"], "broken file")
+        self.assertIsNone(job["result"])
+
+    def test_progress_visible_while_running(self):
+        started, release = threading.Event(), threading.Event()
+
+        def handler(payload, progress):
+            progress({"rows": 10})
+            started.set()
+            release.wait(5)
+            return {}
+
+        queue = self.make_queue(handler)
+        job_id = queue.submit({})
+        self.assertTrue(started.wait(5))
+        job = queue.get(job_id)
+        self.assertEqual((job["status"], job["progress"]), (RUNNING, {"rows": 10}))
+        release.set()
+        self.assertEqual(self.wait(queue, job_id)["status"], SUCCEEDED)
+
+    def test_interrupted_job_is_requeued(self):
+        queue = self.make_queue(lambda payload, progress: {})
+        queue.stop()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("INSERT INTO jobs (id, status, payload, created_at) VALUES ('a', ?, '{}', 0)", (RUNNING,))
+            conn.execute("INSERT INTO jobs (id, status, payload, created_at) VALUES ('b', ?, '{}', 1)", (QUEUED,))
+        close_connections(self.db_path)
+
+        queue = self.make_queue(lambda payload, progress: {"ok": True})
+        self.assertEqual(self.wait(queue, "a")["result"], {"ok": True})
+        self.assertEqual(self.wait(queue, "b")["status"], SUCCEEDED)
+
+    def test_keep_finished(self):
+        queue = self.make_queue(lambda payload, progress: {}, keep_finished=2)
+        ids = [queue.submit({}) for _ in range(4)]
+        self.wait(queue, ids[-1])
+        self.assertEqual([queue.get(job_id) is not None for job_id in ids], [False, False, True, True])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+from app import create_app
+from app.utils import metrics
+from helpers import make_finance_db
+
+class TestMetrics(unittest.TestCase):
+    def tearDown(self):
+        metrics.configure()
+        metrics.unregister_collector("test")
+
+    def test_counter(self):
+        counter = metrics.counter("test_counter_total", "テスト", ["kind"])
+        self.assertIs(metrics.counter("test_counter_total", "テスト", ["kind"]), counter)
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+        counter.inc(kind='b"c')
+        text = metrics.render()
+        self.assertIn("# TYPE test_counter_total counter", text)
+        self.assertIn('test_counter_total{kind="a"} 3', text)
+        self.assertIn('test_counter_total{kind="b\\"c"} 1', text)
+
+    def test_labels_must_match(self):
+        counter = metrics.counter("test_labels_total", "テスト", ["kind"])
+        with self.assertRaises(ValueError):
+            counter.inc(other="a")
+        with self.assertRaises(ValueError):
+            metrics.histogram("test_labels_total", "テスト", ["kind"])
+
+    def test_histogram(self):
+        histogram = metrics.histogram("test_seconds", "テスト", buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+        text = metrics.render()
+        self.assertIn('test_seconds_bucket{le="0.1"} 2', text)
+        self.assertIn('test_seconds_bucket{le="1.0"} 3', text)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 4', text)
+        self.assertIn("test_seconds_sum 3.65", text)
+        self.assertIn("test_seconds_count 4", text)
+
+    def test_collector(self):
+        metrics.register_collector("test", lambda: [
+            ("test_gauge", metrics.GAUGE, "テスト", [({"db": "finance.db"}, 1.5)]),
+        ])
+        self.assertIn('test_gauge{db="finance.db"} 1.5', metrics.render())
+
+        def fail():
+            raise RuntimeError("boom")
+        metrics.register_collector("test", fail)
+        self.assertNotIn("test_gauge", metrics.render())
+
+    def test_multiprocess(self):
+        directory = tempfile.mkdtemp()
+        try:
+            metrics.configure(multiprocess_dir=directory, flush_interval=60)
+            counter = metrics.counter("test_multiprocess_total", "テスト", ["kind"])
+            histogram = metrics.histogram("test_multiprocess_seconds", "テスト", buckets=(1.0,))
+            counter.inc(kind="a")
+            histogram.observe(0.5)
+            metrics.flush()
+            self.assertTrue(os.path.exists(os.path.join(directory, f"metrics-{os.getpid()}.json")))
+
+            # 別プロセスが書き出した値
+            other = {
+                "test_multiprocess_total": {"type": "counter", "help": "テスト", "labelnames": ["kind"],
+                                            "values": [[["a"], 2], [["b"], 1]]},
+                "test_multiprocess_seconds": {"type": "histogram", "help": "テスト", "labelnames": [],
+                                              "buckets": [1.0], "values": [[[], [[0, 1], 2.0]]]},
+            }
+            with open(os.path.join(directory, "metrics-999999.json"), "w", encoding="utf-8") as f:
+                json.dump(other, f)
+            text = metrics.render()
+            self.assertIn('test_multiprocess_total{kind="a"} 3', text)
+            self.assertIn('test_multiprocess_total{kind="b"} 1', text)
+            self.assertIn('test_multiprocess_seconds_bucket{le="1.0"} 1', text)
+            self.assertIn('test_multiprocess_seconds_bucket{le="+Inf"} 2', text)
+            self.assertIn("test_multiprocess_seconds_sum 2.5", text)
+        finally:
+            metrics.configure()
+            shutil.rmtree(directory)
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=40)
+
+        self.app = create_app()
+        self.app.config['DATABASE_PATH'] = os.path.dirname(self.db_path)
+        self.app.config['DATABASE'] = {'finance': os.path.basename(self.db_path)}
+        self.app.config['DATA_STORE'] = {'enabled': False}
+        self.app.testing = True
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def test_metrics(self):
+        self.client.get('/api/dashboard/graphs')
+        self.client.get('/api/dashboard/graphs')
+        self.client.get('/api/dashboard/graphs/assets')
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+        text = response.get_data(as_text=True)
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="/api/dashboard/graphs",method="GET",le="+Inf"}',
+                      text)
+        self.assertIn('http_requests_total{endpoint="/api/dashboard/graphs/<graph_id>",method="GET",status="200"}',
+                      text)
+        self.assertIn('http_response_bytes_count{endpoint="/api/dashboard/graphs"}', text)
+        self.assertIn('db_read_duration_seconds_count{table="asset"}', text)
+        self.assertRegex(text, r'dashboard_cache_requests_total\{result="hit"\} [1-9]')
+        self.assertIn("dashboard_cache_hit_ratio ", text)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,232 @@
+import unittest
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import pandas as pd
+from unittest import mock
+from app import create_app
+from app.routes import dashboard_service
+from app.utils import data_store, precomputed
+from app.utils.cache import HIT, MISS, STALE
+from app.utils.data_loader import append_to_table
+from helpers import make_finance_db
+
+def join_rebuilds():
+    for thread in threading.enumerate():
+        if thread.name == "dashboard-precompute":
+            thread.join()
+
+def add_day(db_path, day):
+    df = pd.DataFrame({"date": [day], "資産名": ["asset0"], "資産額": [1.0], "トータルリターン": [0.0]})
+    append_to_table(db_path, df, "asset")
+
+class TestPrecomputed(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=40)
+        self.snapshot_path = f"{self.db_path}.dashboard.json"
+        self.builds = 0
+
+    def tearDown(self):
+        join_rebuilds()
+        precomputed.unregister()
+        os.close(self.db_fd)
+        for path in (self.db_path, self.snapshot_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def build(self):
+        self.builds += 1
+        return dashboard_service.build_dashboard_payload(self.db_path)
+
+    def register(self):
+        precomputed.register(self.db_path, self.build, variant=None, path=self.snapshot_path)
+
+    def test_miss_until_built(self):
+        self.assertEqual(precomputed.get(self.db_path), (None, MISS))
+        self.register()
+        self.assertEqual(precomputed.get(self.db_path), (None, MISS))
+        published = precomputed.rebuild(self.db_path)
+        self.assertEqual(precomputed.get(self.db_path), (published, HIT))
+        # 現在のデータから作ったものがあれば作り直さない
+        precomputed.rebuild(self.db_path)
+        self.assertEqual(self.builds, 1)
+
+    def test_previous_payload_until_rebuilt(self):
+        self.register()
+        before = precomputed.rebuild(self.db_path)
+        add_day(self.db_path, "2024-02-10")
+
+        published, state = precomputed.get(self.db_path)
+        self.assertIs(published, before)
+        self.assertEqual(state, STALE)
+        join_rebuilds()
+        published, state = precomputed.get(self.db_path)
+        self.assertEqual(state, HIT)
+        self.assertEqual(published.payload["summary"]["latest_date"], "2024/02/10")
+        self.assertEqual(self.builds, 2)
+
+    def test_survives_restart(self):
+        self.register()
+        before = precomputed.rebuild(self.db_path)
+        precomputed.unregister()
+
+        self.register()
+        published, state = precomputed.get(self.db_path)
+        self.assertEqual(state, HIT)
+        self.assertEqual(published.payload["summary"], before.payload["summary"])
+        self.assertEqual(published.payload["graphs"]["assets"]["data"][0]["x"][0], "2024-01-01")
+        self.assertEqual(self.builds, 1)
+
+    def test_changed_while_stopped(self):
+        self.register()
+        precomputed.rebuild(self.db_path)
+        precomputed.unregister()
+        add_day(self.db_path, "2024-02-10")
+
+        self.register()
+        published, state = precomputed.get(self.db_path)
+        self.assertEqual(state, STALE)
+        self.assertEqual(published.payload["summary"]["latest_date"], "2024/02/09")
+
+    def test_other_variant_is_not_loaded(self):
+        self.register()
+        precomputed.rebuild(self.db_path)
+        precomputed.unregister()
+        precomputed.register(self.db_path, self.build, variant=500, path=self.snapshot_path)
+        self.assertEqual(precomputed.get(self.db_path), (None, MISS))
+
+    def test_failed_build_keeps_previous(self):
+        self.register()
+        before = precomputed.rebuild(self.db_path)
+        add_day(self.db_path, "2024-02-10")
+        with mock.patch.object(self, "build", side_effect=RuntimeError("boom")):
+            precomputed.unregister()
+            self.register()
+            precomputed.rebuild(self.db_path)
+        published, state = precomputed.get(self.db_path)
+        self.assertEqual(published.payload["summary"], before.payload["summary"])
+        self.assertEqual(state, STALE)
+
+class TestPrecomputedDashboard(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=40)
+
+        self.app = create_app()
+        self.app.config['DATABASE_PATH'] = os.path.dirname(self.db_path)
+        self.app.config['DATABASE'] = {'finance': os.path.basename(self.db_path)}
+        self.app.config['DASHBOARD_PRECOMPUTE'] = {'enabled': True}
+        self.job_dir = tempfile.mkdtemp()
+        self.app.config['UPLOAD'] = {**self.app.config.get('UPLOAD', {}), 'job_dir': self.job_dir}
+        self.app.testing = True
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            dashboard_service.register_precompute(self.db_path, self.app.config)
+        precomputed.rebuild(self.db_path)
+
+    def tearDown(self):
+        join_rebuilds()
+        queue = self.app.extensions.get("ingest_jobs")
+        if queue is not None:
+            queue.stop()
+        shutil.rmtree(self.job_dir, ignore_errors=True)
+        precomputed.unregister()
+        data_store.unregister()
+        os.close(self.db_fd)
+        for path in (self.db_path, f"{self.db_path}.dashboard.json"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def test_requests_do_not_build(self):
+        with mock.patch.object(dashboard_service, "build_dashboard_payload") as build, \
+                mock.patch.object(dashboard_service, "build_graph") as build_graph:
+            for url in ['/api/dashboard/graphs', '/api/dashboard/summary', '/api/dashboard/bootstrap',
+                        '/api/dashboard/graphs/general_balance']:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200, url)
+                self.assertIsNotNone(response.headers.get("ETag"))
+        build.assert_not_called()
+        build_graph.assert_not_called()
+
+    def test_first_request_does_not_wait_for_the_build(self):
+        # 起動直後で保存したペイロードが無い場合、リクエストは作成を待たずに通常の経路で返し、作成はバックグラウンドで行う
+        precomputed.unregister()
+        os.remove(f"{self.db_path}.dashboard.json")
+        with self.app.app_context():
+            dashboard_service.register_precompute(self.db_path, self.app.config)
+        with mock.patch.object(precomputed, "rebuild") as rebuild, \
+                mock.patch.object(precomputed, "rebuild_async") as rebuild_async:
+            response = self.client.get('/api/dashboard/summary')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["summary"]["latest_date"], "2024/02/09")
+        rebuild.assert_not_called()
+        rebuild_async.assert_called_once_with(self.db_path)
+
+    def test_smaller_max_points_are_downsampled_from_payload(self):
+        # 画面の幅に合わせた max_points (作ったときより少ない) でも作り直さず、作ったグラフを間引く
+        with mock.patch.object(dashboard_service, "build_dashboard_payload") as build, \
+                mock.patch.object(dashboard_service, "build_graph") as build_graph:
+            graph = self.client.get('/api/dashboard/graphs/assets?max_points=10').get_json()["graphs"]["assets"]
+            bootstrap = self.client.get('/api/dashboard/bootstrap?graph=returns&max_points=10').get_json()
+            graphs = self.client.get('/api/dashboard/graphs?max_points=10').get_json()["graphs"]
+        build.assert_not_called()
+        build_graph.assert_not_called()
+        self.assertEqual([len(t["x"]) for t in graph["data"]], [10, 10])
+        self.assertEqual((graph["data"][0]["x"][0], graph["data"][0]["x"][-1]), ("2024-01-01", "2024-02-09"))
+        self.assertEqual(len(bootstrap["graphs"]["returns"]["data"][0]["y"]), 10)
+        self.assertEqual(graphs["assets"], graph)
+        # 間引かないグラフはそのまま
+        full = self.client.get('/api/dashboard/graphs').get_json()["graphs"]
+        self.assertEqual(graphs["general_balance"], full["general_balance"])
+
+    def test_window_is_built(self):
+        response = self.client.get('/api/dashboard/graphs/assets?from=2024-02-01')
+        self.assertEqual(response.get_json()["graphs"]["assets"]["data"][0]["x"][0], "2024-02-01")
+
+    def test_stale_payload_is_not_cached(self):
+        etag = self.client.get('/api/dashboard/summary').headers["ETag"]
+        add_day(self.db_path, "2024-02-10")
+        with mock.patch.object(precomputed, "rebuild_async") as rebuild_async:
+            response = self.client.get('/api/dashboard/summary', headers={"If-None-Match": etag})
+        rebuild_async.assert_called_once()
+        # 作り直しが終わるまでは前のペイロードを、ETag を付けずに返す
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["summary"]["latest_date"], "2024/02/09")
+        self.assertEqual(response.headers["Cache-Control"], "no-store")
+        self.assertIsNone(response.headers.get("ETag"))
+
+        precomputed.rebuild(self.db_path)
+        response = self.client.get('/api/dashboard/summary')
+        self.assertEqual(response.get_json()["summary"]["latest_date"], "2024/02/10")
+        self.assertIsNotNone(response.headers.get("ETag"))
+
+    def test_upload_rebuilds(self):
+        csv = b"date,\xe8\xb3\x87\xe7\x94\xa3\xe5\x90\x8d,\xe8\xb3\x87\xe7\x94\xa3\xe9\xa1\x8d\n2024-02-10,asset0,1.0\n"
+        response = self.client.post('/api/data/upload', data={'file_asset': (io.BytesIO(csv), 'diff_asset_profit.csv')})
+        job_url = response.get_json()["job_url"]
+        deadline = time.time() + 10
+        while self.client.get(job_url).get_json()["status"] not in ("succeeded", "failed") and time.time() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(self.client.get(job_url).get_json()["status"], "succeeded")
+
+        published, state = precomputed.get(self.db_path)
+        self.assertEqual(state, HIT)
+        self.assertEqual(published.payload["summary"]["latest_date"], "2024/02/10")
+        with mock.patch.object(dashboard_service, "build_dashboard_payload") as build:
+            data = self.client.get('/api/dashboard/summary').get_json()
+        build.assert_not_called()
+        self.assertEqual(data["summary"]["latest_date"], "2024/02/10")
+        stats, = [s for s in self.client.get('/api/data/store').get_json()["payloads"]
+                  if s["db_path"] == os.path.abspath(self.db_path)]
+        self.assertTrue(stats["fresh"])
+
+if __name__ == '__main__':
+    unittest.main()
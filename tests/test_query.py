@@ -0,0 +1,196 @@
+import unittest
+import os
+import json
+import tempfile
+import pandas as pd
+import pyarrow as pa
+from unittest import mock
+from app import create_app
+from app.utils import query
+from app.utils.arrow_ipc import ARROW_STREAM
+from app.utils.cache import PayloadCache
+from app.utils.data_loader import append_to_table
+from app.utils.db_schema import migrate
+from app.utils.query import compile_query, get_query_result, parse_query, run_query
+from helpers import make_finance_db
+
+class TestParseQuery(unittest.TestCase):
+    def test_measures(self):
+        spec = parse_query("asset", ["資産額", "MAX(トータルリターン)", "count(*)", "sum(資産額)"])
+        self.assertEqual([m.name for m in spec.measures], ["sum(資産額)", "max(トータルリターン)", "count(*)"])
+
+    def test_same_query_same_spec(self):
+        a = parse_query("asset", ["sum(資産額)"], ["資産タイプ"], "month", {"資産タイプ": ["b", "a"]})
+        b = parse_query("asset", ["sum(資産額)"], ["資産タイプ", "資産タイプ"], "month", {"資産タイプ": ["a", "b", "a"]})
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+
+    def test_rejects_unknown_names(self):
+        for args in [
+            ("sqlite_master", ["sum(資産額)"]),
+            ("asset", []),
+            ("asset", ["sum(資産名)"]),
+            ("asset", ["median(資産額)"]),
+            ("asset", ["sum(*)"]),
+            ("asset", ["sum(資産額)"], ["資産額"]),
+            ("asset", ["sum(資産額)"], [], "hour"),
+            ("asset", ["sum(資産額)"], [], None, {"date": ["2024-01-01"]}),
+            ("asset", ['sum("資産額") FROM asset; --)']),
+        ]:
+            with self.assertRaises(ValueError, msg=args):
+                parse_query(*args)
+
+    def test_compile_is_parameterized(self):
+        spec = parse_query("asset", ["sum(資産額)"], ["資産タイプ"], "month", {"資産タイプ": ["x' OR 1=1 --"]},
+                           window=(pd.Timestamp("2024-01-01"), pd.Timestamp("2024-01-31")))
+        sql, params, names = compile_query(spec)
+        self.assertNotIn("OR 1=1", sql)
+        self.assertEqual(params, ["x' OR 1=1 --", "2024-01-01", "2024-02-01"])
+        self.assertEqual(names, ["date", "資産タイプ", "sum(資産額)"])
+        self.assertIn("GROUP BY 1, 2", sql)
+
+class TestRunQuery(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.df_asset, self.df_balance, _ = make_finance_db(self.db_path, days=70)
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def _expected(self, df, freq, keys, column, func):
+        period = df["date"].dt.to_period(freq).dt.start_time.dt.strftime("%Y-%m-%d")
+        grouped = df.assign(period=period).groupby(["period"] + keys)[column].agg(func).reset_index()
+        return grouped
+
+    def test_matches_pandas(self):
+        for granularity, freq in [("day", "D"), ("week", "W-SUN"), ("month", "M"), ("year", "Y")]:
+            spec = parse_query("asset", ["sum(資産額)", "max(トータルリターン)", "count(*)"], ["資産タイプ"], granularity)
+            result = run_query(self.db_path, spec)
+            expected = self._expected(self.df_asset, freq, ["資産タイプ"], "資産額", "sum")
+            self.assertEqual(result["data"]["date"], expected["period"].tolist(), granularity)
+            self.assertEqual(result["data"]["資産タイプ"], expected["資産タイプ"].tolist())
+            self.assertEqual(result["data"]["sum(資産額)"], expected["資産額"].tolist())
+            expected_max = self._expected(self.df_asset, freq, ["資産タイプ"], "トータルリターン", "max")
+            self.assertEqual(result["data"]["max(トータルリターン)"], expected_max["トータルリターン"].tolist())
+            self.assertEqual(sum(result["data"]["count(*)"]), len(self.df_asset))
+            self.assertFalse(result["truncated"])
+
+    def test_week_starts_on_monday(self):
+        spec = parse_query("asset", ["count(*)"], granularity="week")
+        dates = run_query(self.db_path, spec)["data"]["date"]
+        self.assertTrue(all(pd.Timestamp(d).dayofweek == 0 for d in dates))
+        # 2024-01-01 は月曜日
+        self.assertEqual(dates[0], "2024-01-01")
+
+    def test_filters_and_window(self):
+        spec = parse_query("balance", ["sum(金額)"], ["収支項目"], None, {"収支タイプ": ["特別収支"]},
+                           window=(pd.Timestamp("2024-01-10"), pd.Timestamp("2024-01-19")))
+        result = run_query(self.db_path, spec)
+        self.assertEqual(result["data"], {"収支項目": ["旅行", "賞与"], "sum(金額)": [-5000.0, 10000.0]})
+
+    def test_truncated(self):
+        result = run_query(self.db_path, parse_query("asset", ["count(*)"], granularity="day"), max_rows=5)
+        self.assertEqual(len(result["data"]["date"]), 5)
+        self.assertTrue(result["truncated"])
+
+    def test_rollup_gives_same_result(self):
+        specs = [
+            parse_query("asset", ["sum(資産額)", "sum(トータルリターン)"], granularity="week"),
+            parse_query("balance", ["sum(金額)"], ["収支カテゴリー"], "month", {"収支タイプ": ["一般収支"]},
+                        window=(pd.Timestamp("2024-02-01"), pd.Timestamp("2024-02-29"))),
+            parse_query("target", ["sum(資産額)"], granularity="year"),
+        ]
+        before = [run_query(self.db_path, spec) for spec in specs]
+        migrate(self.db_path)
+        after = [run_query(self.db_path, spec) for spec in specs]
+        self.assertEqual([r["source"] for r in after],
+                         ["asset_daily_total", "balance_monthly_by_type_category", "target_daily_total"])
+        for b, a in zip(before, after):
+            self.assertEqual(a["data"], b["data"])
+
+    def test_rollup_not_used_when_it_cannot_answer(self):
+        migrate(self.db_path)
+        for spec in [
+            parse_query("asset", ["max(資産額)"], granularity="month"),
+            parse_query("asset", ["sum(資産額)"], ["資産タイプ"]),
+            parse_query("balance", ["sum(金額)"], granularity="week"),
+            parse_query("balance", ["sum(金額)"], granularity="month",
+                        window=(pd.Timestamp("2024-01-15"), None)),
+        ]:
+            self.assertEqual(run_query(self.db_path, spec)["source"], spec.table)
+
+    def test_cached_by_data_version(self):
+        cache = PayloadCache()
+        spec = parse_query("asset", ["sum(資産額)"], granularity="month")
+        first = get_query_result(self.db_path, spec, cache)
+        with mock.patch.object(query, "run_query", wraps=run_query) as run:
+            self.assertIs(get_query_result(self.db_path, spec, cache), first)
+            run.assert_not_called()
+            df = pd.DataFrame({"date": ["2024-03-11"], "資産名": ["asset9"], "資産額": [1.0]})
+            append_to_table(self.db_path, df, "asset")
+            self.assertEqual(get_query_result(self.db_path, spec, cache)["data"]["sum(資産額)"][-1],
+                             first["data"]["sum(資産額)"][-1] + 1.0)
+            run.assert_called_once()
+
+class TestQueryEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=40)
+
+        self.app = create_app()
+        self.app.config['DATABASE_PATH'] = os.path.dirname(self.db_path)
+        self.app.config['DATABASE'] = {'finance': os.path.basename(self.db_path)}
+        self.app.testing = True
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def test_query(self):
+        response = self.client.get('/api/query?table=asset&measures=sum(資産額),count(*)&group_by=資産タイプ'
+                                   '&granularity=month&filter=資産タイプ:安全資産&from=2024-01-01&to=2024-01-31')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data["columns"], ["date", "資産タイプ", "sum(資産額)", "count(*)"])
+        self.assertEqual(data["data"]["date"], ["2024-01-01"])
+        self.assertEqual(data["data"]["count(*)"], [31])
+        self.assertIsNotNone(response.headers.get("ETag"))
+
+    def test_not_modified(self):
+        url = '/api/query?table=balance&measures=金額&granularity=year'
+        etag = self.client.get(url).headers["ETag"]
+        with mock.patch.object(query, "run_query") as run:
+            response = self.client.get(url, headers={"If-None-Match": etag})
+        run.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+
+    def test_arrow_stream(self):
+        url = '/api/query?table=asset&measures=sum(資産額),count(*)&group_by=資産タイプ&granularity=month'
+        plain = self.client.get(url).get_json()
+        response = self.client.get(url, headers={"Accept": ARROW_STREAM})
+        self.assertEqual(response.mimetype, ARROW_STREAM)
+        table = pa.ipc.open_stream(response.data).read_all()
+        self.assertEqual(table.column_names, plain["columns"])
+        self.assertEqual(table.schema.field("date").type, pa.date32())
+        self.assertEqual([d.isoformat() for d in table["date"].to_pylist()], plain["data"]["date"])
+        self.assertEqual(table["sum(資産額)"].to_pylist(), plain["data"]["sum(資産額)"])
+        self.assertEqual(json.loads(table.schema.metadata[b"payload"])["table"], "asset")
+
+    def test_bad_request(self):
+        for url in ['/api/query?measures=sum(資産額)',
+                    '/api/query?table=asset&measures=sum(金額)',
+                    '/api/query?table=asset&measures=sum(資産額)&granularity=hour',
+                    '/api/query?table=asset&measures=sum(資産額)&filter=資産タイプ',
+                    '/api/query?table=asset&measures=sum(資産額)&from=2024-02-01&to=2024-01-01']:
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+
+if __name__ == '__main__':
+    unittest.main()
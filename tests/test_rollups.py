@@ -0,0 +1,100 @@
+import unittest
+import os
+import json
+import sqlite3
+import tempfile
+import numpy as np
+import pandas as pd
+from app.utils.db_schema import migrate
+from app.utils.data_loader import append_to_table
+from app.utils.rollups import rollup_table, drop_rollups
+from app.utils.json_provider import dumps_bytes
+from app.routes.dashboard_service import build_dashboard_payload, build_dashboard_delta
+from helpers import make_finance_db
+
+class TestRollups(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=60)
+        migrate(self.db_path)
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def _query(self, sql, params=()):
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _assert_rollups_consistent(self):
+        self.assertEqual(
+            self._query("SELECT date, 資産額, トータルリターン FROM asset_daily_total ORDER BY date"),
+            self._query("SELECT substr(date, 1, 10), SUM(資産額), SUM(トータルリターン) FROM asset "
+                        "GROUP BY substr(date, 1, 10) ORDER BY 1"),
+        )
+        self.assertEqual(
+            self._query("SELECT date, 収支タイプ, 収支カテゴリー, 金額, 目標 FROM balance_monthly_by_type_category ORDER BY 1, 2, 3"),
+            self._query("SELECT substr(date, 1, 7) || '-01', 収支タイプ, 収支カテゴリー, SUM(金額), SUM(目標) FROM balance "
+                        "GROUP BY 1, 2, 3 ORDER BY 1, 2, 3"),
+        )
+
+    def test_rollups_created_by_migration(self):
+        self.assertEqual(rollup_table(self.db_path, "asset"), "asset_daily_total")
+        self.assertEqual(rollup_table(self.db_path, "target"), "target_daily_total")
+        self.assertEqual(len(self._query("SELECT * FROM asset_daily_total")), 60)
+        self._assert_rollups_consistent()
+
+    def test_rollups_follow_insert_update_delete(self):
+        df = pd.DataFrame({"date": ["2024-03-01", "2024-03-01"], "資産名": ["asset0", "asset1"],
+                           "資産額": [10.0, 20.0], "トータルリターン": [1.0, 2.0]})
+        append_to_table(self.db_path, df, "asset")
+        df = pd.DataFrame({"date": ["2024-03-01"], "収支項目": ["給与"], "金額": [5.0],
+                           "収支タイプ": ["一般収支"], "収支カテゴリー": ["収入"], "目標": [1.0]})
+        append_to_table(self.db_path, df, "balance")
+        self.assertEqual(self._query("SELECT 資産額 FROM asset_daily_total WHERE date = '2024-03-01'"), [(30.0,)])
+        self._assert_rollups_consistent()
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE asset SET 資産額 = 100.0 WHERE date = '2024-03-01' AND 資産名 = 'asset0'")
+            conn.execute("UPDATE balance SET 収支タイプ = '特別収支' WHERE date = '2024-03-01'")
+            conn.execute("DELETE FROM asset WHERE date LIKE '2024-01-1%'")
+        self.assertEqual(self._query("SELECT 資産額 FROM asset_daily_total WHERE date = '2024-03-01'"), [(120.0,)])
+        self._assert_rollups_consistent()
+
+    def test_null_group_keys_are_skipped(self):
+        df = pd.DataFrame({"date": ["2024-03-01", "2024-03-01"], "収支項目": ["雑費", "雑収入"], "金額": [-5.0, 7.0],
+                           "収支タイプ": [None, "一般収支"], "収支カテゴリー": ["支出", None], "目標": [0.0, 0.0]})
+        append_to_table(self.db_path, df, "balance")
+        self.assertEqual(self._query("SELECT COUNT(*) FROM balance_monthly_by_type_category WHERE date = '2024-03-01'"),
+                         [(0,)])
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE balance SET 収支タイプ = '一般収支' WHERE 収支項目 = '雑費'")
+            conn.execute("DELETE FROM balance WHERE 収支項目 = '雑収入'")
+        self.assertEqual(self._query("SELECT 金額, row_count FROM balance_monthly_by_type_category "
+                                     "WHERE date = '2024-03-01'"), [(-5.0, 1)])
+        # 既存の DB に NULL のキーがあってもマイグレーションできる
+        migrate(self.db_path, reapply=True)
+        self.assertEqual(self._query("SELECT 金額, row_count FROM balance_monthly_by_type_category "
+                                     "WHERE date = '2024-03-01'"), [(-5.0, 1)])
+
+    def test_dashboard_reads_rollups_with_same_result(self):
+        with_rollups = build_dashboard_payload(self.db_path)
+        delta_with_rollups = build_dashboard_delta(self.db_path, "2024-02-10")
+        with sqlite3.connect(self.db_path) as conn:
+            drop_rollups(conn)
+        self.assertIsNone(rollup_table(self.db_path, "asset"))
+        without_rollups = build_dashboard_payload(self.db_path)
+
+        self.assertEqual(with_rollups["summary"], without_rollups["summary"])
+        for key, graph in without_rollups["graphs"].items():
+            got, want = json.loads(dumps_bytes(with_rollups["graphs"][key])), json.loads(dumps_bytes(graph))
+            for a, b in zip(got["data"], want["data"]):
+                self.assertEqual(a["x"], b["x"])
+                np.testing.assert_allclose(a["y"], b["y"])
+        self.assertEqual(delta_with_rollups, build_dashboard_delta(self.db_path, "2024-02-10"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,292 @@
+import unittest
+import gzip
+import json
+import os
+import tempfile
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from unittest import mock
+from app import create_app
+from app.routes import dashboard_service
+from app.utils import compression
+from app.utils.arrow_ipc import ARROW_STREAM
+from app.utils.cache import PayloadCache
+from app.utils.data_loader import append_to_table, bump_data_version
+from helpers import make_finance_db
+
+class TestConditionalGet(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=40)
+
+        self.app = create_app()
+        self.app.config['DATABASE_PATH'] = os.path.dirname(self.db_path)
+        self.app.config['DATABASE'] = {'finance': os.path.basename(self.db_path)}
+        self.app.testing = True
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def test_etag_and_last_modified(self):
+        for url in ['/api/dashboard/graphs', '/api/dashboard/summary']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNotNone(response.headers.get("ETag"))
+            self.assertIsNotNone(response.headers.get("Last-Modified"))
+            self.assertEqual(response.headers["Cache-Control"], "no-cache")
+
+    def test_if_none_match_returns_304_without_building(self):
+        etag = self.client.get('/api/dashboard/graphs').headers["ETag"]
+        with mock.patch.object(dashboard_service, "get_dashboard_payload") as build:
+            response = self.client.get('/api/dashboard/graphs', headers={"If-None-Match": etag})
+        build.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+
+    def test_etag_depends_on_endpoint_and_query(self):
+        graphs = self.client.get('/api/dashboard/graphs').headers["ETag"]
+        summary = self.client.get('/api/dashboard/summary').headers["ETag"]
+        delta = self.client.get('/api/dashboard/graphs?since=2024-02-01').headers["ETag"]
+        self.assertEqual(len({graphs, summary, delta}), 3)
+
+    def test_upload_changes_etag(self):
+        etag = self.client.get('/api/dashboard/summary').headers["ETag"]
+        df = pd.DataFrame({"date": ["2024-02-10"], "資産名": ["asset0"], "資産額": [1.0], "トータルリターン": [0.0]})
+        append_to_table(self.db_path, df, "asset")
+        response = self.client.get('/api/dashboard/summary', headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_etag_is_stable_across_processes(self):
+        # プロセス内のカウンタだけが変わっても(別プロセス・再起動と同じ)データが同じなら ETag は変わらない
+        etag = self.client.get('/api/dashboard/summary').headers["ETag"]
+        bump_data_version(self.db_path)
+        response = self.client.get('/api/dashboard/summary', headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get('/api/dashboard/summary').headers["Last-Modified"]
+        response = self.client.get('/api/dashboard/summary', headers={"If-Modified-Since": last_modified})
+        self.assertEqual(response.status_code, 304)
+
+class TestGraphEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=40)
+
+        self.app = create_app()
+        self.app.config['DATABASE_PATH'] = os.path.dirname(self.db_path)
+        self.app.config['DATABASE'] = {'finance': os.path.basename(self.db_path)}
+        self.app.testing = True
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def test_single_graph(self):
+        graphs = self.client.get('/api/dashboard/graphs').get_json()["graphs"]
+        response = self.client.get('/api/dashboard/graphs/special_balance')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["graphs"], {"special_balance": graphs["special_balance"]})
+        etag = response.headers["ETag"]
+        response = self.client.get('/api/dashboard/graphs/special_balance', headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_unknown_graph(self):
+        self.assertEqual(self.client.get('/api/dashboard/graphs/unknown').status_code, 404)
+        self.assertEqual(self.client.get('/api/dashboard/bootstrap?graph=unknown').status_code, 400)
+
+    def test_max_points(self):
+        self.app.config['DASHBOARD_GRAPHS'] = {'max_points': 30}
+        x = lambda url: self.client.get(url).get_json()["graphs"]["assets"]["data"][0]["x"]
+        self.assertEqual(len(x('/api/dashboard/graphs/assets?max_points=10')), 10)
+        # 設定の値が省略時の値かつ上限
+        self.assertEqual(len(x('/api/dashboard/graphs/assets')), 30)
+        self.assertEqual(len(x('/api/dashboard/graphs/assets?max_points=100')), 30)
+        self.assertEqual(len(x('/api/dashboard/bootstrap?max_points=10')), 10)
+        for value in ("abc", "2"):
+            self.assertEqual(self.client.get(f'/api/dashboard/graphs?max_points={value}').status_code, 400)
+
+    def test_from_to(self):
+        data = self.client.get('/api/dashboard/graphs/assets?from=2024-01-05&to=2024-01-07').get_json()
+        self.assertEqual(data["graphs"]["assets"]["data"][0]["x"], ["2024-01-05", "2024-01-06", "2024-01-07"])
+        response = self.client.get('/api/dashboard/graphs/assets?from=2024-02-01&to=2024-01-01')
+        self.assertEqual(response.status_code, 400)
+
+    def test_from_to_all_graphs(self):
+        data = self.client.get('/api/dashboard/graphs?from=2024-01-05&to=2024-01-07').get_json()
+        self.assertEqual(data["graphs"]["returns"]["data"][0]["x"], ["2024-01-05", "2024-01-06", "2024-01-07"])
+        self.assertEqual(data["graphs"]["special_balance"]["data"][0]["x"], ["2024-01"])
+        data = self.client.get('/api/dashboard/bootstrap?graph=assets&from=2024-02-01').get_json()
+        self.assertEqual(data["summary"]["latest_date"], "2024/02/09")
+        self.assertEqual(data["graphs"]["assets"]["data"][0]["x"][0], "2024-02-01")
+        for url in ('/api/dashboard/graphs?from=abc', '/api/dashboard/graphs?since=2024-01-10&from=2024-01-01',
+                    '/api/dashboard/bootstrap?from=2024-02-01&to=2024-01-01'):
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+
+    def test_bootstrap(self):
+        data = self.client.get('/api/dashboard/bootstrap').get_json()
+        self.assertEqual(data["summary"]["latest_date"], "2024/02/09")
+        self.assertEqual(list(data["graphs"]), ["assets"])
+        data = self.client.get('/api/dashboard/bootstrap?graph=returns').get_json()
+        self.assertEqual(list(data["graphs"]), ["returns"])
+
+class TestResponseEncoding(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=40)
+
+        self.app = create_app()
+        self.app.config['DATABASE_PATH'] = os.path.dirname(self.db_path)
+        self.app.config['DATABASE'] = {'finance': os.path.basename(self.db_path)}
+        self.app.testing = True
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def test_graphs_are_native_json(self):
+        data = self.client.get('/api/dashboard/graphs').get_json()
+        figure = data["graphs"]["assets"]
+        self.assertIsInstance(figure, dict)
+        self.assertEqual(figure["data"][0]["x"][0], "2024-01-01")
+        self.assertEqual(figure["layout"]["meta"], {"id": "total_assets"})
+
+    def test_gzip(self):
+        plain = self.client.get('/api/dashboard/graphs')
+        response = self.client.get('/api/dashboard/graphs', headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertEqual(json.loads(gzip.decompress(response.data)), plain.get_json())
+        self.assertNotIn("Content-Encoding", plain.headers)
+        # 圧縮方式ごとに ETag が異なる
+        self.assertNotEqual(response.headers["ETag"], plain.headers["ETag"])
+
+    def test_compressed_body_is_cached(self):
+        headers = {"Accept-Encoding": "gzip"}
+        first = self.client.get('/api/dashboard/graphs', headers=headers)
+        with mock.patch.object(compression, "compress") as compress:
+            second = self.client.get('/api/dashboard/graphs', headers=headers)
+        compress.assert_not_called()
+        self.assertEqual(first.data, second.data)
+
+    def test_upload_rebuilds_response(self):
+        before = self.client.get('/api/dashboard/summary').get_json()
+        df = pd.DataFrame({"date": ["2024-02-10"], "資産名": ["asset0"], "資産額": [1.0], "トータルリターン": [0.0]})
+        append_to_table(self.db_path, df, "asset")
+        after = self.client.get('/api/dashboard/summary').get_json()
+        self.assertNotEqual(before["summary"]["latest_date"], after["summary"]["latest_date"])
+
+    def test_stale_while_revalidate(self):
+        self.app.extensions["dashboard_cache"] = PayloadCache(stale_while_revalidate=True)
+        before = self.client.get('/api/dashboard/summary').get_json()["summary"]["latest_date"]
+        df = pd.DataFrame({"date": ["2024-02-10"], "資産名": ["asset0"], "資産額": [1.0], "トータルリターン": [0.0]})
+        append_to_table(self.db_path, df, "asset")
+
+        # 古い本文を返しつつ再計算し、再計算が終われば新しい本文になる
+        dates = []
+        for _ in range(4):
+            dates.append(self.client.get('/api/dashboard/summary').get_json()["summary"]["latest_date"])
+            for thread in threading.enumerate():
+                if thread.name == "payload-cache-refresh":
+                    thread.join()
+        self.assertEqual(dates[0], before)
+        self.assertEqual(dates[-1], "2024/02/10")
+
+    def test_arrow_stream(self):
+        plain = self.client.get('/api/dashboard/graphs').get_json()
+        response = self.client.get('/api/dashboard/graphs', headers={"Accept": ARROW_STREAM})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, ARROW_STREAM)
+        self.assertIn("Accept", response.headers["Vary"])
+        table = pa.ipc.open_stream(response.data).read_all()
+        assets = table.filter(pc.equal(table["uid"].cast(pa.string()), "assets:資産額_実績"))
+        figure = plain["graphs"]["assets"]["data"][0]
+        self.assertEqual([d.isoformat() for d in assets["x"].to_pylist()], figure["x"])
+        self.assertEqual(assets["y"].to_pylist(), figure["y"])
+        meta = json.loads(table.schema.metadata[b"payload"])
+        self.assertEqual(meta["graphs"]["assets"]["layout"], plain["graphs"]["assets"]["layout"])
+        self.assertNotEqual(response.headers["ETag"], self.client.get('/api/dashboard/graphs').headers["ETag"])
+
+    def test_json_is_default(self):
+        for accept in (None, "*/*", f"application/json, {ARROW_STREAM};q=0.5"):
+            headers = {"Accept": accept} if accept else {}
+            response = self.client.get('/api/dashboard/graphs/assets', headers=headers)
+            self.assertEqual(response.mimetype, "application/json", accept)
+        # Arrow で返さないエンドポイント
+        response = self.client.get('/api/dashboard/summary', headers={"Accept": f"{ARROW_STREAM}, */*;q=0.1"})
+        self.assertEqual(response.mimetype, "application/json")
+        response = self.client.get('/api/dashboard/summary', headers={"Accept": ARROW_STREAM})
+        self.assertEqual(response.status_code, 406)
+
+    def test_arrow_delta(self):
+        response = self.client.get('/api/dashboard/graphs?since=2024-02-05', headers={"Accept": ARROW_STREAM})
+        table = pa.ipc.open_stream(response.data).read_all()
+        meta = json.loads(table.schema.metadata[b"payload"])
+        self.assertEqual(meta["graphs"]["special_balance"]["replace_from"], "2024-02")
+        assets = table.filter(pc.equal(table["graph"].cast(pa.string()), "assets"))
+        self.assertEqual(len(assets), 8)
+
+class TestServerTiming(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=40)
+
+        self.app = create_app()
+        self.app.config['DATABASE_PATH'] = os.path.dirname(self.db_path)
+        self.app.config['DATABASE'] = {'finance': os.path.basename(self.db_path)}
+        self.app.config['DATA_STORE'] = {'enabled': False}
+        self.app.config['TIMING'] = {'enabled': True, 'log': True}
+        self.app.testing = True
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def test_server_timing_header_and_log(self):
+        with self.assertLogs("app.utils.timing", level="INFO") as logs:
+            response = self.client.get('/api/dashboard/graphs')
+        self.assertEqual(response.status_code, 200)
+        names = [part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")]
+        for name in ["read", "balance", "build_total_assets", "build_special_balance", "serialize", "compress", "total"]:
+            self.assertIn(name, names)
+
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record["path"], "/api/dashboard/graphs")
+        self.assertEqual(record["status"], 200)
+        self.assertEqual(record["stages"]["read"]["count"], 3)
+        self.assertGreater(record["total_ms"], 0)
+
+    def test_cached_response_has_no_build_stages(self):
+        self.client.get('/api/dashboard/graphs')
+        names = [part.split(";")[0] for part in self.client.get('/api/dashboard/graphs').headers["Server-Timing"].split(", ")]
+        self.assertEqual(names, ["total"])
+
+    def test_disabled(self):
+        self.app.config['TIMING'] = {'enabled': False}
+        response = self.client.get('/api/dashboard/graphs')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Server-Timing", response.headers)
+
+if __name__ == '__main__':
+    unittest.main()
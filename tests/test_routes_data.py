@@ -4,6 +4,8 @@ import io
 import sys
 import tempfile
 import sqlite3
+import shutil
+import time
 from app import create_app
 
 class TestRoutesData(unittest.TestCase):
@@ -23,16 +25,35 @@ class TestRoutesData(unittest.TestCase):
         self.app = create_app()
         self.app.config['DATABASE_PATH'] = os.path.dirname(self.db_path)
         self.app.config['DATABASE'] = {'finance': os.path.basename(self.db_path)}
+        self.job_dir = tempfile.mkdtemp()
+        self.app.config['UPLOAD'] = {**self.app.config.get('UPLOAD', {}), 'job_dir': self.job_dir}
         self.app.testing = True
         self.client = self.app.test_client()
 
     def tearDown(self):
+        queue = self.app.extensions.get("ingest_jobs")
+        if queue is not None:
+            queue.stop()
+        shutil.rmtree(self.job_dir, ignore_errors=True)
         os.close(self.db_fd)
         try:
             os.remove(self.db_path)
         except OSError:
             pass
 
+    def wait_for_job(self, response, timeout=10):
+        # 202 で返ったジョブが終わるまで /api/data/jobs/<id> をポーリングする
+        self.assertEqual(response.status_code, 202)
+        job_url = response.get_json()["job_url"]
+        self.assertEqual(response.headers["Location"], job_url)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = self.client.get(job_url).get_json()
+            if job["status"] in ("succeeded", "failed"):
+                return job
+            time.sleep(0.02)
+        self.fail(f"job did not finish: {job}")
+
     def test_upload_update_no_files(self):
         response = self.client.post('/api/data/upload')
         self.assertEqual(response.status_code, 400)
@@ -53,8 +74,14 @@ class TestRoutesData(unittest.TestCase):
             data=data
         )
 
-        self.assertEqual(response.status_code, 200)
-        self.assertIn(b"success", response.data)
+        job = self.wait_for_job(response)
+        self.assertEqual(job["status"], "succeeded")
+        self.assertEqual(job["result"]["updated_counts"], {"asset": 1, "balance": 1})
+        self.assertEqual(job["progress"]["rows"], {"asset": 1, "balance": 1})
+        self.assertIn("rows_per_sec", job["result"])
+        self.assertIsNotNone(job["elapsed_sec"])
+        # アップロードファイルは取り込み後に削除する
+        self.assertEqual(sorted(n for n in os.listdir(self.job_dir) if n.endswith(".upload")), [])
         
         # Verify data in DB
         conn = sqlite3.connect(self.db_path)
@@ -65,5 +92,50 @@ class TestRoutesData(unittest.TestCase):
         self.assertEqual(cursor.fetchone()[0], 1)
         conn.close()
 
+    def test_upload_update_arrow(self):
+        import pandas as pd
+        import pyarrow as pa
+        table = pa.Table.from_pandas(pd.DataFrame({"date": pd.to_datetime(["2023-01-01"]), "value": [100]}))
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+
+        data = {
+            'file_asset': (io.BytesIO(sink.getvalue().to_pybytes()), 'diff_asset_profit.arrows',
+                           'application/vnd.apache.arrow.stream'),
+        }
+        response = self.client.post('/api/data/upload', data=data)
+
+        self.assertEqual(self.wait_for_job(response)["status"], "succeeded")
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("SELECT date, value FROM asset").fetchall(), [("2023-01-01 00:00:00", 100)])
+        conn.close()
+
+    def test_upload_update_invalid_csv(self):
+        # balance の列が不正な場合は asset も追加しない
+        asset_csv = (io.BytesIO(b"date,value\n2023-01-01,100\n"), 'diff_asset_profit.csv')
+        balance_csv = (io.BytesIO(b"date,unknown\n2023-01-01,200\n"), 'diff_balance.csv')
+
+        response = self.client.post(
+            '/api/data/upload',
+            data={'file_asset': asset_csv, 'file_balance': balance_csv}
+        )
+
+        job = self.wait_for_job(response)
+        self.assertEqual(job["status"], "failed")
+        self.assertIn("unknown", job["error"])
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("SELECT count(*) FROM asset").fetchone()[0], 0)
+        conn.close()
+
+    def test_upload_update_invalid_mode(self):
+        asset_csv = (io.BytesIO(b"date,value\n2023-01-01,100\n"), 'diff_asset_profit.csv')
+        response = self.client.post('/api/data/upload', data={'file_asset': asset_csv, 'mode': 'replace'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_job(self):
+        response = self.client.get('/api/data/jobs/unknown')
+        self.assertEqual(response.status_code, 404)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from app.utils import executor, timing
+from app.utils.executor import CPU, gather
+
+class TestTiming(unittest.TestCase):
+    def tearDown(self):
+        executor.configure()
+
+    def test_disabled_records_nothing(self):
+        @timing.timed()
+        def work():
+            return 1
+
+        self.assertIsNone(timing.current())
+        with timing.stage("read"):
+            self.assertEqual(work(), 1)
+        self.assertIsNone(timing.current())
+
+    def test_records_stages(self):
+        @timing.timed()
+        def work():
+            with timing.stage("inner"):
+                return 1
+
+        token = timing.start()
+        try:
+            work()
+            work()
+            with timing.stage("read"):
+                pass
+        finally:
+            timings = timing.finish(token)
+        self.assertIsNone(timing.current())
+
+        stages = timings.as_dict()
+        self.assertEqual(list(stages), ["inner", "work", "read"])
+        self.assertEqual(stages["work"]["count"], 2)
+        self.assertEqual(stages["read"]["count"], 1)
+
+    def test_records_error(self):
+        @timing.timed("fail")
+        def fail():
+            raise ValueError("boom")
+
+        token = timing.start()
+        try:
+            with self.assertRaises(ValueError):
+                fail()
+        finally:
+            timings = timing.finish(token)
+        self.assertEqual(timings.as_dict()["fail"]["count"], 1)
+
+    def test_gather_records_to_caller(self):
+        # プールのスレッドで実行した段階も呼び出し元の計測に入る
+        executor.configure(cpu_workers=4)
+        token = timing.start()
+        try:
+            gather([timing.timed("build")(lambda: 1)] * 4, CPU)
+        finally:
+            timings = timing.finish(token)
+        self.assertEqual(timings.as_dict()["build"]["count"], 4)
+
+    def test_server_timing(self):
+        token = timing.start()
+        try:
+            timing.current().add("read", 0.0125)
+            timing.current().add("read", 0.0125)
+            timing.current().add("serialize", 0.001)
+        finally:
+            timings = timing.finish(token)
+        header = timings.server_timing()
+        self.assertRegex(header, r'^read;dur=25\.0;desc="x2", serialize;dur=1\.0, total;dur=\d+\.\d$')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+from app import create_app
+from app.utils import data_store, precomputed
+from app.utils.config import load_settings
+from app.utils.connection import close_connections
+from app.utils.warmup import warm_up
+from helpers import make_finance_db
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class TestStartup(unittest.TestCase):
+    def test_create_app_does_not_import_heavy_modules(self):
+        script = (
+            "import sys\n"
+            "from app.utils import warmup\n"
+            "warmup.start_warmup = lambda app: None\n"
+            "from app import create_app\n"
+            "create_app()\n"
+            "print(','.join(m for m in ('pandas', 'numpy', 'plotly') if m in sys.modules))\n"
+        )
+        proc = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)
+        self.assertEqual(proc.stdout.strip(), "")
+
+    def test_create_app_without_warmup_does_not_import_heavy_modules(self):
+        script = (
+            "import sys\n"
+            "import app\n"
+            "settings = app.load_settings('setting.yaml')\n"
+            "settings['warmup'] = {'enabled': False}\n"
+            "app.load_settings = lambda path: settings\n"
+            "app.create_app()\n"
+            "print(','.join(m for m in ('pandas', 'numpy', 'plotly') if m in sys.modules))\n"
+        )
+        proc = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)
+        self.assertEqual(proc.stdout.strip(), "")
+
+class TestWarmUp(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        make_finance_db(self.db_path, days=40)
+        self.app = create_app()
+        self.app.config['DATABASE_PATH'] = os.path.dirname(self.db_path)
+        self.app.config['DATABASE'] = {'finance': os.path.basename(self.db_path)}
+
+    def tearDown(self):
+        data_store.unregister()
+        precomputed.unregister()
+        close_connections(self.db_path)
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+        if os.path.exists(f"{self.db_path}.dashboard.json"):
+            os.remove(f"{self.db_path}.dashboard.json")
+
+    def test_loads_data_store(self):
+        self.app.config['DATA_STORE'] = {'enabled': True}
+        warm_up(self.app)
+        self.assertTrue(data_store.is_registered(self.db_path))
+        stats, = [s for s in data_store.stats() if s["db_path"] == os.path.abspath(self.db_path)]
+        self.assertTrue(stats["loaded"])
+        self.assertIn("app.routes.dashboard_service", sys.modules)
+
+    def test_builds_dashboard_payload(self):
+        self.app.config['DASHBOARD_PRECOMPUTE'] = {'enabled': True}
+        warm_up(self.app)
+        published, state = precomputed.get(self.db_path)
+        self.assertEqual(state, "hit")
+        self.assertEqual(published.payload["summary"]["latest_date"], "2024/02/09")
+        self.assertTrue(os.path.exists(f"{self.db_path}.dashboard.json"))
+
+    def test_create_app_registers_without_warmup(self):
+        settings = load_settings(os.path.join(ROOT, "setting.yaml"))
+        settings["warmup"] = {"enabled": False}
+        settings["database_path"] = os.path.dirname(self.db_path)
+        settings["database"] = {"finance": os.path.basename(self.db_path)}
+        settings["dashboard_precompute"] = {"enabled": True}
+        with mock.patch("app.load_settings", return_value=settings):
+            app = create_app()
+        # create_app では登録せず、最初のリクエストの前に登録する
+        self.assertFalse(data_store.is_registered(self.db_path))
+        self.assertEqual(app.test_client().get('/api/dashboard/').status_code, 200)
+        self.assertTrue(data_store.is_registered(self.db_path))
+        self.assertTrue(precomputed.is_registered(self.db_path))
+
+    def test_data_store_disabled(self):
+        self.app.config['DATA_STORE'] = {'enabled': False}
+        warm_up(self.app)
+        self.assertFalse(data_store.is_registered(self.db_path))
+
+    def test_missing_database(self):
+        self.app.config['DATA_STORE'] = {'enabled': True}
+        self.app.config['DATABASE'] = {'finance': 'missing.db'}
+        missing = os.path.join(os.path.dirname(self.db_path), 'missing.db')
+        warm_up(self.app)
+        # 後から作られた場合に備えて登録だけしておき、読み込みはしない
+        self.assertTrue(data_store.is_registered(missing))
+        self.assertFalse(os.path.exists(missing))
+        stats, = [s for s in data_store.stats() if s["db_path"] == os.path.abspath(missing)]
+        self.assertFalse(stats["loaded"])
+
+if __name__ == "__main__":
+    unittest.main()